@@ -0,0 +1,248 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import importlib.util
+from src import sob
+from src.sob.lib.py_mesh_v2 import py_mesh_v2
+
+# Benchmarks of the deck generation. The reference implementations are the ones of the first commit of the
+# repository, loaded from the git history.
+
+def load_reference(module_path, revision=None, package=None):
+    # module of the first commit of the repository by default; loaded into package (e.g. 'src.sob') if its
+    # relative imports are to resolve to the modules of the package
+    if revision is None:
+        revision = subprocess.run(['git', 'rev-list', '--max-parents=0', 'HEAD'], check=True,
+                                  capture_output=True, text=True).stdout.split()[0]
+    source = subprocess.run(['git', 'show', f'{revision}:{module_path}'], check=True,
+                            capture_output=True, text=True).stdout
+    path = os.path.join(tempfile.mkdtemp(), os.path.basename(module_path))
+    with open(path, 'w') as f:
+        f.write(source)
+    name = 'reference_' + os.path.basename(module_path)[:-3]
+    spec = importlib.util.spec_from_file_location(f'{package}.{name}' if package else name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def time_call(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def benchmark_py_mesh_v2(elsizes=(4.0, 2.0, 1.0)):
+    # mesher of the crash tube with triggers, reference loop implementation vs vectorized one
+    reference = load_reference('src/sob/lib/py_mesh_v2.py')
+    for elsize in elsizes:
+        working_dir = tempfile.mkdtemp()
+        mesh = sob.CrashTubeMesh([-5.0, 5.0, 5.0, 2.0, -2.0, 3.0], elsize=elsize, trigger_height=3*elsize)
+        mesh.write_py_mesh_input(working_dir)
+        var_file = os.path.join(working_dir, 'py_mesh.input')
+
+        # the reference implementation writes mesh.k into the current working directory
+        cwd = os.getcwd()
+        os.chdir(working_dir)
+        try:
+            reference_time = time_call(lambda: reference.py_mesh_v2(var_file))
+        finally:
+            os.chdir(cwd)
+        with open(os.path.join(working_dir, 'mesh.k')) as f:
+            reference_mesh = f.read()
+
+        new_time = time_call(lambda: py_mesh_v2(var_file, output_dir=working_dir))
+        with open(os.path.join(working_dir, 'mesh.k')) as f:
+            identical = f.read() == reference_mesh
+
+        print(f'elsize {elsize} mm: reference {reference_time:.3f} s, vectorized {new_time:.3f} s, '
+              f'speedup {reference_time/new_time:.1f}x, identical mesh.k: {identical}')
+
+def benchmark_refined_mesh_writing(elsize=0.04):
+    # refined crash tube of about 1M shells: 4 cells of 12 elements along the edges and
+    # 800/0.04 = 20000 elements along the extrusion length
+    working_dir = tempfile.mkdtemp()
+    mesh = sob.CrashTubeMesh([-5.0, 5.0, 5.0, 2.0, -2.0, 3.0], elsize=elsize, trigger_height=3*elsize)
+    start = time.perf_counter()
+    mesh.write_mesh_file(working_dir)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(os.path.join(working_dir, 'mesh.k'))
+    print(f'elsize {elsize} mm ({4*12*int(round(800/elsize))} shells): mesh.k of {size/1e6:.0f} MB '
+          f'generated and written in {elapsed:.2f} s')
+
+def benchmark_analytic_objectives(n_designs=1000000):
+    # mass and absorbed energy of a batch of designs, computed without any input deck
+    import numpy as np
+    designs = np.random.default_rng(0).uniform(-5, 5, (n_designs, 5))
+    for model_type, dimension in [(1, 5), (3, 5)]:
+        for output_data in ['mass', 'absorbed_energy']:
+            problem = sob.get_problem(model_type, dimension, output_data, 'none')
+            elapsed = time_call(lambda: problem.evaluate_batch(designs))
+            print(f'{problem.__class__.__name__} {output_data}: {n_designs/elapsed/1e6:.1f} million designs per second')
+
+def benchmark_deck_rendering(n_decks=200):
+    # input deck of the star box, reference writers of the keyword files vs rendered blocks cached per parameters
+    # (mesh.k is written by the same mesh class in both)
+    reference = load_reference('src/sob/fem.py', package='src.sob')
+    reference_dir, new_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    mesh = sob.StarBoxMesh([90.0, 90.0, 10.0, 10.0, 1.5])
+
+    def write_reference_decks():
+        for _ in range(n_decks):
+            reference.StarBoxModel(mesh).write_input_files()
+
+    def write_decks():
+        for _ in range(n_decks):
+            sob.StarBoxModel(mesh).write_input_files(new_dir)
+
+    # the reference implementation writes the deck into the current working directory
+    cwd = os.getcwd()
+    os.chdir(reference_dir)
+    try:
+        reference_time = time_call(write_reference_decks, repeat=1)
+    finally:
+        os.chdir(cwd)
+    new_time = time_call(write_decks, repeat=1)
+
+    identical = True
+    for file_name in sorted(os.listdir(reference_dir)):
+        with open(os.path.join(reference_dir, file_name), 'rb') as f, open(os.path.join(new_dir, file_name), 'rb') as g:
+            identical = identical and f.read() == g.read()
+    print(f'star box decks: reference {n_decks/reference_time:.0f} decks per second, cached blocks '
+          f'{n_decks/new_time:.0f} decks per second, speedup {reference_time/new_time:.1f}x, identical decks: {identical}')
+
+def benchmark_time_history(n_rows=200000, n_nodes=5):
+    # intrusion from a long time history: whole CSV with a Python max vs tracked node columns and sidecar
+    import numpy as np
+    import pandas as pd
+    from src.sob.history import read_header, load_time_history, peak_abs
+    working_dir = tempfile.mkdtemp()
+    path = os.path.join(working_dir, 'combineT01.csv')
+    columns = ['time'] + [f'DATABASE_HISTORY_NODE{1001+i} {axis}' for i in range(n_nodes) for axis in ['X', 'Y', 'Z', 'VX', 'VY', 'VZ']]
+    pd.DataFrame(np.random.default_rng(0).normal(size=(n_rows, len(columns))), columns=columns).to_csv(path, index=False)
+    key = 'DATABASE_HISTORY_NODE1001'
+
+    def reference():
+        output_data_frame = pd.read_csv(path)
+        output_data_frame.columns = output_data_frame.columns.str.replace(' ', '')
+        matching_columns = [col for col in output_data_frame.columns if key in col]
+        return abs(max(output_data_frame[matching_columns[2]], key=abs))
+
+    def load(sidecar):
+        header = read_header(path)
+        history = load_time_history(path, usecols=header[:1] + [name for name in header[1:] if key in name], sidecar=sidecar)
+        return peak_abs(history[key + 'Z'])
+
+    reference_time = time_call(reference)
+    parse_time = time_call(lambda: load(False))
+    sidecar_time = time_call(lambda: load(True))
+    print(f'time history of {n_rows} rows, {len(columns)} columns: reference {reference_time:.3f} s, '
+          f'tracked node columns {parse_time:.3f} s, from the sidecar {sidecar_time:.4f} s, '
+          f'same intrusion: {reference() == load(True)}')
+
+def benchmark_fidelity(batch_file_path=None, n_designs=4):
+    # cost of the fidelity levels: size of the model and of the time history, and with the solver
+    # (batch_file_path), the time per evaluation and the error of the intrusion relative to the 'high' level
+    import numpy as np
+    from src.sob.problems import FIDELITY_LEVELS
+    designs = np.random.default_rng(0).uniform(-5, 5, (n_designs, 5))
+    for model_type in [1, 3]:
+        reference = None
+        for fidelity in FIDELITY_LEVELS:
+            working_dir = tempfile.mkdtemp()
+            cwd = os.getcwd()
+            os.chdir(working_dir)
+            try:
+                problem = sob.get_problem(model_type, 5, 'intrusion', batch_file_path, fidelity=fidelity)
+                problem.generate_input_deck(designs[0])
+                model = problem.model
+                report = (f'{problem.__class__.__name__} {fidelity}: {len(model.mesh.generate_mesh()["element_ids"])} shells, '
+                          f'end time {model.end_time} ms, {int(round(model.end_time/model.database_dtime))} history rows, '
+                          f"d3plot {'on' if model.consider_d3plot else 'off'}")
+                if batch_file_path is not None:
+                    start = time.perf_counter()
+                    intrusions = problem.evaluate_batch(designs)
+                    report += f', {(time.perf_counter() - start)/n_designs:.1f} s per design'
+                    if reference is None:
+                        reference = intrusions
+                    report += f', intrusion error {np.mean(np.abs(intrusions - reference)/reference)*100:.1f} %'
+            finally:
+                os.chdir(cwd)
+            print(report)
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def benchmark_output_profile(batch_file_path=None, n_designs=2):
+    # disk bytes of the 'full' and 'objective' output profiles: databases of the deck, and with the solver
+    # (batch_file_path), the bytes written and the time per run
+    import numpy as np
+    from src.sob.fem import OUTPUT_PROFILES
+    designs = np.random.default_rng(0).uniform(-5, 5, (n_designs, 5))
+    for model_type in [1, 3]:
+        reference = None
+        for output_profile in OUTPUT_PROFILES:
+            working_dir = tempfile.mkdtemp()
+            cwd = os.getcwd()
+            os.chdir(working_dir)
+            try:
+                problem = sob.get_problem(model_type, 5, 'intrusion', batch_file_path, output_profile=output_profile,
+                                          shared_includes=False)
+                deck_dir = problem.generate_input_deck(designs[0])
+                with open(os.path.join(deck_dir, 'dcc.k')) as f:
+                    databases = [line.strip()[len('*DATABASE_'):] for line in f if line.startswith('*DATABASE')]
+                report = f'{problem.__class__.__name__} {output_profile}: databases {databases}'
+                if batch_file_path is not None:
+                    deck_bytes = _directory_size(working_dir)
+                    start = time.perf_counter()
+                    problem.evaluate_batch(designs)
+                    elapsed = (time.perf_counter() - start)/n_designs
+                    output_bytes = (_directory_size(working_dir) - deck_bytes)/n_designs
+                    if reference is None:
+                        reference = (elapsed, output_bytes)
+                    report += (f', {output_bytes/1e6:.1f} MB and {elapsed:.1f} s per run, '
+                               f'saved {(reference[1] - output_bytes)/1e6:.1f} MB and {reference[0] - elapsed:.1f} s')
+            finally:
+                os.chdir(cwd)
+                shutil.rmtree(working_dir, ignore_errors=True)
+            print(report)
+
+def benchmark_solver_environment(batch_file_path=None, n_designs=4, fidelity='low'):
+    # fixed and variable time per run of short simulations, through the batch file vs with the solver
+    # environment set up once (found from the batch file, see environment.py)
+    if batch_file_path is None:
+        return
+    import numpy as np
+    designs = np.random.default_rng(0).uniform(-5, 5, (n_designs, 5))
+    for environment in [None, sob.SolverEnvironment(batch_file_path=batch_file_path)]:
+        working_dir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(working_dir)
+        try:
+            problem = sob.get_problem(1, 5, 'intrusion', batch_file_path, fidelity=fidelity, environment=environment)
+            timings = []
+            for design in designs:
+                problem(design)
+                timings.append(problem.output_data_frame.attrs['timings'])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(working_dir, ignore_errors=True)
+        total = np.mean([timing['total'] for timing in timings])
+        variable = np.mean([timing.get('engine', np.nan) for timing in timings])
+        print(f"{'batch file' if environment is None else 'solver environment'}: {total:.2f} s per run, "
+              f'{total - variable:.2f} s fixed and {variable:.2f} s variable')
+
+if __name__ == '__main__':
+    benchmark_py_mesh_v2()
+    benchmark_refined_mesh_writing()
+    benchmark_analytic_objectives()
+    benchmark_deck_rendering()
+    benchmark_time_history()
+    # the simulations of the fidelity levels are run if the batch file of OpenRadioss is given
+    benchmark_fidelity(sys.argv[1] if len(sys.argv) > 1 else None)
+    benchmark_output_profile(sys.argv[1] if len(sys.argv) > 1 else None)
+    benchmark_solver_environment(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -1,6 +1,15 @@
 from .problems import *
+from .tuning import calibrate_throughput, best_split
+from .deck import DeckIndex
+from .objectives import OBJECTIVES, register_objective
+from .monitor import RunMonitor, energy_absorbed, velocity_reversal, intrusion_exceeds
+from .workspace import Workspace
+from .solver import run_radioss, RunResult, SimulationError
+from .journal import EvaluationJournal
+from .broker import JobBroker, BrokerClient, serve_broker, connect
+from .environment import SolverEnvironment
 
-def get_problem(model_type, dimension, output_data, batch_file_path):
+def get_problem(model_type, dimension, output_data, batch_file_path, **kwargs):
     '''
     Generates a problem instance based on the specified model type and configuration.
 
@@ -35,23 +44,85 @@ def get_problem(model_type, dimension, output_data, batch_file_path):
             - 5: All vary except for the middle trigger depth.
             - 6: All three positions and depths vary.
 
-    output_data : str
+    output_data : str or list
         Specifies the type of output data required. The options are:
         - 'mass'
         - 'absorbed_energy'
         - 'intrusion' (Requires running FEM simulation while 'mass' and 'absorbed_energy' do not require one.)
+        - 'peak_wall_force', 'mean_crush_force', 'specific_energy_absorption', 'crush_efficiency' (require a
+          simulation)
+        - any output data added with register_objective.
+        With a list of output data, the problem returns a vector of the outputs of a design, computed from
+        one simulation at most. The three point bending model supports none of them yet: pass None and use
+        generate_input_deck.
 
     batch_file_path : str
         Path to the OpenRadioss batch file.
+
+    **kwargs
+        Options of the problem instance:
+        - cache : EvaluationCache
+            Persistent cache of the simulation results, the solver is skipped for designs already in the cache.
+        - nt : int
+            Number of OpenMP threads per MPI process of an OpenRadioss run (default 1).
+        - nmpi : int
+            Number of MPI processes of an OpenRadioss run (default 1).
+        - sp : str
+            "sp" for the single precision solver, any other value for double precision (default "sp").
+        - auto_tune : bool
+            Whether evaluate_batch uses the split of cores recorded by calibrate_throughput (default True).
+        - mass_mode : str
+            'analytic' for the mass from the perimeter of the cross section (default), 'mesh' for the mass
+            summed over the shells of the generated mesh, including the trigger dents.
+        - shared_includes : bool
+            Whether the keyword files which don't depend on the design are written once into
+            <problem>_includes and hard linked into each deck (default True).
+        - stop_criteria : list
+            Criteria stopping a simulation once its objective is determined, e.g. [velocity_reversal(),
+            intrusion_exceeds(best_intrusion)], see monitor.py (default None: the simulations run to the end time).
+            The stopped decks are recorded in problem.early_stops.
+        - fidelity : str or dict
+            'high' (default), 'medium' or 'low', see FIDELITY_LEVELS in problems.py: coarser mesh, shorter end
+            time, sparser outputs and no d3plot for cheap approximations (StarBox and CrashTube only). A dict of
+            the same parameters defines a custom level.
+        - output_profile : str
+            'full' (default) or 'objective', see OUTPUT_PROFILES in fem.py: the 'objective' profile writes only
+            the time history of the tracked node and the rigid wall force (StarBox and CrashTube), without
+            d3plot, animation files nor the other databases.
+        - workspace : Workspace
+            Run directories on a scratch root (e.g. /dev/shm), harvested into a results store and deleted once
+            each design is evaluated, within a disk quota, see workspace.py (default None: the decks are written
+            under the current working directory and kept).
+        - timeout : float
+            Wall-clock limit of an OpenRadioss run in seconds, the job is killed when it is exceeded (default None).
+        - retries : int
+            Number of retries of a failed or timed out run, with other splits of the cores (default 0).
+        - failure_penalty : float
+            Evaluation of a design whose run failed, recorded in problem.failures (default None: SimulationError
+            is raised, with the RunResult of the run).
+        - journal : EvaluationJournal
+            Append-only journal of the evaluations which need a simulation, see journal.py: restarted with the
+            same journal, a campaign skips the designs already evaluated and reattaches or runs again the ones
+            which were in flight (default None).
+        - broker : JobBroker or BrokerClient
+            Job queue the simulations are submitted to, evaluated by worker processes on this machine or on
+            others, see broker.py and worker.py (default None: the simulations are run here). The stop criteria
+            aren't sent to the workers. The jobs are waited for until the timeout of the broker, and those
+            running for longer than its stale_after (default: the timeout of the problem, every retry included)
+            are queued again for the other workers.
+        - environment : SolverEnvironment
+            OpenRadioss environment set up once, which runs the starter, the engine and the converters directly
+            instead of the batch file, see environment.py (default None). The timings of each run (fixed and
+            variable time) are in the attrs['timings'] of the simulation result.
     '''
     if model_type==1:
-        problem_instance = StarBox(dimension, output_data, batch_file_path)
+        problem_instance = StarBox(dimension, output_data, batch_file_path, **kwargs)
         return problem_instance
     elif model_type==2:
-        problem_instance = ThreePointBending(dimension, output_data, batch_file_path)
+        problem_instance = ThreePointBending(dimension, output_data, batch_file_path, **kwargs)
         return problem_instance
     elif model_type==3:
-        problem_instance = CrashTube(dimension, output_data, batch_file_path)
+        problem_instance = CrashTube(dimension, output_data, batch_file_path, **kwargs)
         return problem_instance
     else:
         raise ValueError('Invalid model type')
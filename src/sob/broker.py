@@ -0,0 +1,380 @@
+"""
+Job queue of the evaluations, shared by the head node running the optimizer and the worker processes running
+the simulations, on the same machine or on other machines.
+
+A job is a design vector together with the spec of its problem (OptiProblem.spec: the problem type, dimension,
+output data and simulation options), so that only a few bytes cross the wire: the worker regenerates the input
+deck on its own machine, runs OpenRadioss and sends back the evaluation, and the compressed time history if the
+job asks for it (see cache.dump_history). A job is 'queued', then 'running' once a worker has claimed it, then
+'done' or 'failed' (the evaluation raised on the worker, e.g. SimulationError without failure_penalty).
+
+The JobBroker is a SQLite database, shared by the processes of one machine, or of several machines if it is on
+a file system whose locks SQLite supports (not NFS in general). Otherwise, serve the broker from the head node
+with serve_broker, and connect the workers to it with BrokerClient: the same methods, as JSON lines over TCP.
+connect opens either from an address, a path or 'host:port'.
+
+The workers are started with worker.py, see its module docstring, and OptiProblem(broker=...) submits its
+simulations to the broker instead of running them.
+"""
+
+import json
+import time
+import base64
+import socket
+import sqlite3
+import threading
+import socketserver
+import numpy as np
+
+# methods of a broker which BrokerClient calls on the server
+BROKER_METHODS = ('submit', 'claim', 'complete', 'fail', 'get', 'finished', 'cancel', 'requeue_stale', 'counts')
+
+class JobBroker():
+    '''
+    Job queue of evaluations in a SQLite database, see the module docstring.
+
+    Parameters:
+        path (str): Path of the database, created if it doesn't exist.
+        histories (bool): Whether the submitted jobs ask the workers for the time history of the simulation.
+        poll_interval (float): Seconds between two looks at the jobs waited for, see wait_all.
+        timeout (float): Seconds after which the jobs waited for are given up, see wait_all. Default: no limit.
+        stale_after (float): Seconds after which a running job is queued again while jobs are waited for, see
+            requeue_stale. Default: never.
+    '''
+    def __init__(self, path='sob_jobs.sqlite', histories=True, poll_interval=0.5, timeout=None, stale_after=None) -> None:
+        self.path = path
+        self.histories = histories
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+        # the connection is shared by the threads of a batch evaluation
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self._connection:
+            # the workers read and write the queue concurrently
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                                     'id INTEGER PRIMARY KEY AUTOINCREMENT, spec TEXT, variables TEXT, '
+                                     'nt INTEGER, nmpi INTEGER, history INTEGER, status TEXT, worker TEXT, '
+                                     'submitted REAL, started REAL, finished REAL, result TEXT, data BLOB)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def submit(self, spec, variable_array, nt=1, nmpi=1):
+        """
+        Queue the evaluation of a design.
+
+        Returns:
+            int: The id of the job.
+        """
+        variables = json.dumps(np.asarray(variable_array, dtype=float).tolist())
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (spec, variables, nt, nmpi, history, status, submitted) VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (json.dumps(spec, sort_keys=True), variables, nt, nmpi, int(self.histories), time.time()))
+        return cursor.lastrowid
+
+    def claim(self, worker):
+        """
+        Take the oldest queued job for a worker.
+
+        Returns:
+            dict: The id, spec, variables, nt, nmpi and history flag of the job, None if no job is queued.
+        """
+        with self._lock:
+            while True:
+                row = self._connection.execute("SELECT id, spec, variables, nt, nmpi, history FROM jobs "
+                                               "WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    return None
+                with self._connection:
+                    # another worker may have claimed it meanwhile
+                    claimed = self._connection.execute("UPDATE jobs SET status = 'running', worker = ?, started = ? "
+                                                       "WHERE id = ? AND status = 'queued'", (worker, time.time(), row[0])).rowcount
+                if claimed:
+                    job_id, spec, variables, nt, nmpi, history = row
+                    return {'id': job_id, 'spec': json.loads(spec), 'variables': json.loads(variables),
+                            'nt': nt, 'nmpi': nmpi, 'history': bool(history)}
+
+    def complete(self, job_id, result, history=None):
+        """
+        Record the evaluation of a job: result is a JSON-serializable dict (see worker.Worker.process), history
+        the compressed time history or None.
+        """
+        self._finish(job_id, 'done', result, history)
+
+    def fail(self, job_id, result):
+        """
+        Record a job whose evaluation raised: result is a JSON-serializable dict with its message.
+        """
+        self._finish(job_id, 'failed', result)
+
+    def _finish(self, job_id, status, result, history=None):
+        with self._lock, self._connection:
+            self._connection.execute('UPDATE jobs SET status = ?, finished = ?, result = ?, data = ? WHERE id = ?',
+                                     (status, time.time(), json.dumps(result), history, job_id))
+
+    def get(self, job_id):
+        """
+        Returns:
+            dict: The id, status, worker, times, result (None until the job is finished) and compressed time
+            history (None if there is none) of a job.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT status, worker, submitted, started, finished, result, data '
+                                           'FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(f'No job {job_id} in {self.path}')
+        status, worker, submitted, started, finished, result, data = row
+        return {'id': job_id, 'status': status, 'worker': worker, 'submitted': submitted, 'started': started,
+                'finished': finished, 'result': None if result is None else json.loads(result), 'history': data}
+
+    def finished(self, job_ids):
+        """
+        Returns:
+            list: The jobs among job_ids which are done or failed, see get.
+        """
+        job_ids = [int(job_id) for job_id in job_ids]
+        if not job_ids:
+            return []
+        with self._lock:
+            rows = self._connection.execute('SELECT id, status, worker, submitted, started, finished, result, data FROM jobs '
+                                            f"WHERE status IN ('done', 'failed') AND id IN ({', '.join('?' * len(job_ids))})",
+                                            job_ids).fetchall()
+        return [{'id': job_id, 'status': status, 'worker': worker, 'submitted': submitted, 'started': started,
+                 'finished': finished, 'result': json.loads(result), 'history': data}
+                for job_id, status, worker, submitted, started, finished, result, data in rows]
+
+    def cancel(self, job_ids):
+        """
+        Fail the jobs among job_ids which no worker has claimed yet, e.g. those of a batch given up.
+
+        Returns:
+            int: The number of jobs cancelled.
+        """
+        job_ids = [int(job_id) for job_id in job_ids]
+        if not job_ids:
+            return 0
+        with self._lock, self._connection:
+            return self._connection.execute("UPDATE jobs SET status = 'failed', finished = ?, result = ? "
+                                            f"WHERE status = 'queued' AND id IN ({', '.join('?' * len(job_ids))})",
+                                            [time.time(), json.dumps({'message': 'cancelled'})] + job_ids).rowcount
+
+    def wait(self, job_id, timeout=None):
+        return wait_for(self, job_id, timeout)
+
+    def requeue_stale(self, older_than):
+        """
+        Queue again the jobs running for more than older_than seconds, e.g. those of a worker which died.
+        older_than must exceed the longest simulation, the job of a live worker would be run twice otherwise.
+
+        Returns:
+            int: The number of jobs queued again.
+        """
+        with self._lock, self._connection:
+            return self._connection.execute("UPDATE jobs SET status = 'queued', worker = NULL, started = NULL "
+                                            "WHERE status = 'running' AND started < ?", (time.time() - older_than,)).rowcount
+
+    def counts(self):
+        """
+        Returns:
+            dict: The number of jobs of each status.
+        """
+        with self._lock:
+            return dict(self._connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+def wait_all(broker, job_ids, timeout=None, stale_after=None):
+    """
+    Poll jobs until they are all finished, in a single loop, queueing again the jobs running for more than
+    stale_after seconds at each poll (see requeue_stale): the jobs of a worker which died are run by the others.
+
+    Parameters:
+        timeout (float): Seconds after which the jobs not finished yet are given up. Default: broker.timeout.
+        stale_after (float): Default: broker.stale_after.
+
+    Yields:
+        dict: The jobs as they finish, see JobBroker.get.
+
+    Raises:
+        TimeoutError: Jobs aren't finished after timeout seconds; those no worker has claimed are cancelled.
+    """
+    timeout = timeout if timeout is not None else getattr(broker, 'timeout', None)
+    stale_after = stale_after if stale_after is not None else getattr(broker, 'stale_after', None)
+    pending = set(job_ids)
+    start = time.monotonic()
+    while pending:
+        if stale_after is not None:
+            broker.requeue_stale(stale_after)
+        for job in broker.finished(sorted(pending)):
+            pending.discard(job['id'])
+            yield job
+        if not pending:
+            break
+        if timeout is not None and time.monotonic() - start > timeout:
+            broker.cancel(sorted(pending))
+            raise TimeoutError(f'{len(pending)} jobs still not finished after {timeout} s: {sorted(pending)}')
+        time.sleep(broker.poll_interval)
+
+def wait_for(broker, job_id, timeout=None):
+    """
+    Poll a job until it is finished, see wait_all.
+
+    Returns:
+        dict: The job, see JobBroker.get.
+    """
+    return next(wait_all(broker, [job_id], timeout))
+
+def _encode(value):
+    # JSON-serializable value, bytes as base64
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode()}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {'__bytes__'}:
+            return base64.b64decode(value['__bytes__'])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    # one JSON line per call: {"method": ..., "args": [...]} -> {"result": ...} or {"error": ...}
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if request['method'] not in BROKER_METHODS:
+                    raise ValueError(f"Unknown broker method '{request['method']}'")
+                result = getattr(self.server.broker, request['method'])(*_decode(request['args']))
+                response = {'result': _encode(result)}
+            except Exception as e:
+                response = {'error': f'{e.__class__.__name__}: {e}'}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, broker, address) -> None:
+        self.broker = broker
+        super().__init__(address, _BrokerHandler)
+
+def serve_broker(broker, host='127.0.0.1', port=5555, background=False):
+    """
+    Serve a JobBroker to the BrokerClients of other machines.
+
+    The server doesn't authenticate its clients: by default it only listens on the loopback interface, serving
+    it to other machines (e.g. host='0.0.0.0') is to be done on a trusted network only.
+
+    Parameters:
+        background (bool): Serve from a daemon thread and return at once. Default: serve until interrupted.
+
+    Returns:
+        BrokerServer: The server, shut it down with shutdown(). Its address is in server_address (port 0
+        picks a free port).
+    """
+    server = BrokerServer(broker, (host, port))
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        with server:
+            server.serve_forever()
+    return server
+
+class BrokerClient():
+    '''
+    A JobBroker served by serve_broker on another machine, with the same methods.
+
+    Parameters:
+        address (str or tuple): 'host:port' or (host, port) of the server.
+        poll_interval, timeout, stale_after: See JobBroker.
+    '''
+    def __init__(self, address, poll_interval=0.5, timeout=None, stale_after=None) -> None:
+        if isinstance(address, str):
+            host, port = address.rsplit(':', 1)
+            address = (host, int(port))
+        self.address = address
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        # the connection is shared by the threads of a batch evaluation, one call at a time
+        self._lock = threading.Lock()
+        self._socket = socket.create_connection(address)
+        self._file = self._socket.makefile('rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def _call(self, method, *args):
+        request = json.dumps({'method': method, 'args': _encode(list(args))}).encode() + b'\n'
+        with self._lock:
+            self._socket.sendall(request)
+            line = self._file.readline()
+        if not line:
+            raise ConnectionError(f'Broker {self.address[0]}:{self.address[1]} closed the connection')
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(f"Broker {method} failed: {response['error']}")
+        return _decode(response['result'])
+
+    def submit(self, spec, variable_array, nt=1, nmpi=1):
+        return self._call('submit', spec, np.asarray(variable_array, dtype=float).tolist(), nt, nmpi)
+
+    def claim(self, worker):
+        return self._call('claim', worker)
+
+    def complete(self, job_id, result, history=None):
+        return self._call('complete', job_id, result, history)
+
+    def fail(self, job_id, result):
+        return self._call('fail', job_id, result)
+
+    def get(self, job_id):
+        return self._call('get', job_id)
+
+    def finished(self, job_ids):
+        return self._call('finished', [int(job_id) for job_id in job_ids])
+
+    def cancel(self, job_ids):
+        return self._call('cancel', [int(job_id) for job_id in job_ids])
+
+    def wait(self, job_id, timeout=None):
+        return wait_for(self, job_id, timeout)
+
+    def requeue_stale(self, older_than):
+        return self._call('requeue_stale', older_than)
+
+    def counts(self):
+        return self._call('counts')
+
+def connect(address, **kwargs):
+    """
+    Returns:
+        JobBroker or BrokerClient: The broker at address, 'host:port' for a served broker, the path of the
+        database otherwise.
+    """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return BrokerClient(address, **kwargs)
+    return JobBroker(address, **kwargs)
@@ -0,0 +1,175 @@
+import io
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+
+# Options of a problem instance which change its simulated time history, and their defaults: an option is part of
+# the key only if it differs from its default, which keeps the keys of the existing entries
+HISTORY_OPTIONS = {'fidelity': 'high', 'sp': 'sp', 'output_profile': 'full', 'wall_force_key': None}
+
+def evaluation_key(problem, fem_space_variable_array, decimals=6):
+    """
+    Compute the key of a design of a problem instance: a hash of the problem type, dimension, output data, the
+    default parameters of the mesh and the model, the options of the instance in HISTORY_OPTIONS (fidelity,
+    precision of the solver, output profile, rigid wall force column) and the design variables in the FEM space
+    (rounded to decimals).
+
+    Parameters:
+        problem (OptiProblem): The problem instance.
+        fem_space_variable_array (array-like): The design variables mapped to the FEM space.
+        decimals (int): Decimals of the design variables.
+
+    Returns:
+        str: The hexadecimal SHA-256 hash identifying the evaluation.
+    """
+    mesh_class = problem.mesh_class
+    model_class = problem.model_class
+    signature = {
+        'problem': problem.__class__.__name__,
+        'dimension': problem.dimension,
+        'output_data': problem.output_data,
+        'mesh_defaults': getattr(mesh_class, 'default_parameters', None),
+        'impactor_defaults': getattr(model_class, 'impactor_defaults', None),
+        'database_defaults': getattr(model_class, 'database_defaults', None),
+        'material_defaults': getattr(model_class, 'material_defaults', None),
+        # + 0.0 turns -0.0 into 0.0
+        'variables': (np.round(np.asarray(fem_space_variable_array, dtype=float), decimals) + 0.0).tolist(),
+    }
+    for name, default in HISTORY_OPTIONS.items():
+        value = getattr(problem, name, default)
+        if value != default:
+            signature[name] = value
+    text = json.dumps(signature, sort_keys=True, default=lambda value: np.asarray(value).tolist())
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def dump_history(history):
+    """
+    Returns:
+        bytes: The time history (pandas.DataFrame) as a compressed NumPy archive, None for None.
+    """
+    if history is None:
+        return None
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, columns=np.array(history.columns, dtype=str), values=history.to_numpy())
+    return buffer.getvalue()
+
+def load_history(blob):
+    """
+    Returns:
+        pandas.DataFrame: The time history of a compressed NumPy archive written by dump_history, None for None.
+    """
+    if blob is None:
+        return None
+    with np.load(io.BytesIO(blob)) as data:
+        return pd.DataFrame(data['values'], columns=data['columns'])
+
+class EvaluationCache():
+    '''
+    Persistent on-disk cache of evaluations, stored in a SQLite database.
+
+    An entry is keyed by a hash of the problem type, dimension, output data, the default parameters of the mesh
+    and the model, and the design variables in the FEM space (rounded to `decimals`). It stores the objective
+    together with the time history the objective has been computed from, so that a design which has already been
+    simulated is evaluated without generating the input deck or running the solver again.
+
+    The least recently used entries are evicted once the cache holds more than `max_entries` entries or more
+    than `max_bytes` bytes of time history. Setting `enabled` to False bypasses the cache.
+    '''
+    def __init__(self, path='sob_cache.sqlite', max_entries=None, max_bytes=None, decimals=6, enabled=True) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.decimals = decimals
+        self.enabled = enabled
+
+        # hit/miss counters of this cache instance
+        self.hits = 0
+        self.misses = 0
+
+        # the connection is shared by the threads of a batch evaluation
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS evaluations ('
+                                     'key TEXT PRIMARY KEY, objective REAL, history BLOB, '
+                                     'size INTEGER, last_access REAL)')
+
+    def key(self, problem, fem_space_variable_array):
+        """
+        Compute the key of a design of a problem instance, see evaluation_key.
+
+        Returns:
+            str: The hexadecimal SHA-256 hash identifying the evaluation.
+        """
+        return evaluation_key(problem, fem_space_variable_array, self.decimals)
+
+    def get(self, key):
+        """
+        Look up an evaluation.
+
+        Returns:
+            tuple: (objective, time history as pandas.DataFrame or None), or None if the key is not in the cache.
+        """
+        if not self.enabled:
+            return None
+        with self._lock, self._connection:
+            row = self._connection.execute('SELECT objective, history FROM evaluations WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute('UPDATE evaluations SET last_access = ? WHERE key = ?', (time.time(), key))
+            self.hits += 1
+        objective, history = row
+        return objective, load_history(history)
+
+    def put(self, key, objective, history=None):
+        """
+        Store an evaluation, then evict the least recently used entries if the cache is over its limits.
+        """
+        if not self.enabled:
+            return
+        blob = dump_history(history)
+        size = 0 if blob is None else len(blob)
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?)',
+                                     (key, float(objective), blob, size, time.time()))
+            self._evict()
+
+    def _evict(self):
+        if self.max_entries is not None:
+            self._connection.execute('DELETE FROM evaluations WHERE key IN (SELECT key FROM evaluations '
+                                     'ORDER BY last_access DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+        if self.max_bytes is not None:
+            total = 0
+            rows = self._connection.execute('SELECT key, size FROM evaluations ORDER BY last_access DESC').fetchall()
+            for key, size in rows:
+                total += size
+                if total > self.max_bytes:
+                    self._connection.execute('DELETE FROM evaluations WHERE key = ?', (key,))
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM evaluations').fetchone()[0]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of hits and misses, number of entries and bytes of stored time history.
+        """
+        with self._lock:
+            entries, size = self._connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM evaluations').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM evaluations')
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._connection.close()
+
@@ -0,0 +1,286 @@
+import os
+import mmap
+import threading
+import numpy as np
+
+# Fixed-width fields of the entity blocks: keyword (or keyword family) -> widths of the fields of a data line.
+# The first field is the id of the entity.
+ENTITY_FIELDS = {
+    '/NODE': [10, 20, 20, 20],              # node_ID, Xc, Yc, Zc
+    '/SHELL': [10, 10, 10, 10, 10],         # shell_ID, node_ID1 to node_ID4 (/SHELL/<part_ID>)
+    '*NODE': [8, 16, 16, 16],               # nid, x, y, z
+    '*ELEMENT_SHELL': [8, 8, 8, 8, 8, 8],   # eid, pid, n1 to n4
+}
+
+# number of data lines parsed at once
+CHUNK_LINES = 100000
+
+INDEX_SUFFIX = '.index.npz'
+
+def _family(keyword):
+    # '/SHELL/4' -> '/SHELL', the entity blocks are looked up by family
+    if keyword.startswith('/SHELL/'):
+        return '/SHELL'
+    return keyword
+
+def _fixed_width(data, starts, ends, widths):
+    # fields of the lines data[starts:ends] as byte string arrays, blank fields read as 0
+    total = sum(widths)
+    columns = np.arange(total)
+    positions = np.minimum(starts[:, None] + columns, len(data) - 1)
+    chars = np.where(columns < (ends - starts)[:, None], data[positions], ord(' ')).astype(np.uint8)
+    fields = []
+    offset = 0
+    for width in widths:
+        field = np.ascontiguousarray(chars[:, offset:offset+width])
+        field[(field == ord(' ')).all(axis=1), -1] = ord('0')
+        fields.append(field.view(f'S{width}').ravel())
+        offset += width
+    return fields
+
+class DeckIndex():
+    '''
+    Block index of a Radioss (.rad) or LS-DYNA (.k) deck in fixed format, over the memory-mapped file.
+
+    A block starts at a keyword line (a line starting with '/' or '*') and ends where the next keyword starts.
+    The index maps the keywords to the byte ranges of their blocks, and the ids of the nodes and shells of the
+    entity blocks (/NODE, /SHELL/<part_ID>, *NODE and *ELEMENT_SHELL) to the byte offsets of their lines.
+    It is persisted next to the deck (<deck>.index.npz), with the permissions of the umask, and rebuilt when the
+    deck has changed. The decks shipped with the package are indexed with persist=False, in memory only.
+
+    The blocks are parsed into NumPy arrays on access, only the bytes of the requested blocks are read.
+    '''
+    def __init__(self, path, persist=True) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f'Empty deck {path}')
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = np.frombuffer(self._mmap, dtype=np.uint8)
+
+        self.index_path = path + INDEX_SUFFIX
+        if not self._load_index():
+            self._build_index()
+            if persist:
+                self._save_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        # the array is a view of the memory map, it is released first
+        self._data = None
+        self._mmap.close()
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def _load_index(self):
+        try:
+            with np.load(self.index_path) as index:
+                if not np.array_equal(index['signature'], self._signature()):
+                    return False
+                self.keywords = index['keywords'].tolist()
+                self.starts = index['starts']
+                self.ends = index['ends']
+                self._entity_ids = {i: index[f'ids_{i}'] for i in index['entity_blocks'].tolist()}
+                self._entity_offsets = {i: index[f'offsets_{i}'] for i in index['entity_blocks'].tolist()}
+        except (OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def _save_index(self):
+        arrays = {'signature': self._signature(), 'keywords': np.array(self.keywords, dtype=str),
+                  'starts': self.starts, 'ends': self.ends,
+                  'entity_blocks': np.array(sorted(self._entity_ids), dtype=np.int64)}
+        for i in self._entity_ids:
+            arrays[f'ids_{i}'] = self._entity_ids[i]
+            arrays[f'offsets_{i}'] = self._entity_offsets[i]
+        # written to a temporary file and renamed, the index may be read by another process meanwhile; created with
+        # os.open and mode 0o666, the umask applies as for the deck (mkstemp would make it 0o600)
+        tmp_path = f'{self.index_path}.{os.getpid()}-{threading.get_ident()}.tmp'
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # read-only directory: the index is only kept in memory
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _build_index(self):
+        # the keyword lines, found with the C-level search of the memory map
+        starts = [0] if self._mmap[:1] in (b'/', b'*') else []
+        for prefix in (b'\n/', b'\n*'):
+            position = self._mmap.find(prefix)
+            while position != -1:
+                starts.append(position + 1)
+                position = self._mmap.find(prefix, position + 1)
+        starts.sort()
+
+        self.keywords = []
+        for start in starts:
+            end = self._mmap.find(b'\n', start)
+            self.keywords.append(self._mmap[start:end if end != -1 else len(self._mmap)].decode().strip())
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.append(self.starts[1:], len(self._mmap)).astype(np.int64)
+
+        # entity id -> line offset, sorted by id
+        self._entity_ids = {}
+        self._entity_offsets = {}
+        for i, keyword in enumerate(self.keywords):
+            if _family(keyword) in ENTITY_FIELDS:
+                line_starts, line_ends = self._data_lines(i)
+                ids = np.concatenate([_fixed_width(self._data, line_starts[j:j+CHUNK_LINES], line_ends[j:j+CHUNK_LINES],
+                                                   ENTITY_FIELDS[_family(keyword)][:1])[0].astype(np.int64)
+                                      for j in range(0, len(line_starts), CHUNK_LINES)] or [np.zeros(0, dtype=np.int64)])
+                order = np.argsort(ids, kind='stable')
+                self._entity_ids[i] = ids[order]
+                self._entity_offsets[i] = line_starts[order]
+
+    def _data_lines(self, i):
+        # start and end offsets of the lines of the block i, without the keyword line, the comments, the empty
+        # lines and the line terminators
+        start, end = int(self.starts[i]), int(self.ends[i])
+        newlines = np.flatnonzero(self._data[start:end] == ord('\n')) + start
+        starts = np.append(start, newlines + 1)[1:]
+        ends = np.append(newlines[1:], end)
+        keep = starts < ends
+        starts, ends = starts[keep], ends[keep]
+        ends = ends - (self._data[ends - 1] == ord('\r'))
+        first = self._data[starts]
+        keep = (ends > starts) & (first != ord('#')) & (first != ord('$'))
+        return starts[keep], ends[keep]
+
+    def _block_ids(self, keyword):
+        # blocks of the keyword, or of the keyword family ('/SHELL' for all the /SHELL/<part_ID>)
+        return [i for i, k in enumerate(self.keywords) if k == keyword or _family(k) == keyword]
+
+    @property
+    def buffer(self):
+        """
+        Returns:
+            memoryview: The whole memory-mapped deck, without copy.
+        """
+        return memoryview(self._mmap)
+
+    def blocks(self, keyword):
+        """
+        Returns:
+            list: (start, end) byte ranges of the blocks of the keyword, keyword line included.
+        """
+        return [(int(self.starts[i]), int(self.ends[i])) for i in self._block_ids(keyword)]
+
+    def block(self, keyword, occurrence=0):
+        """
+        Returns:
+            memoryview: The bytes of a block of the keyword, without copy.
+        """
+        start, end = self.blocks(keyword)[occurrence]
+        return memoryview(self._mmap)[start:end]
+
+    def data_lines(self, keyword, occurrence=0):
+        """
+        Returns:
+            list: (start, end) byte ranges of the data lines of a block of the keyword, without the keyword
+            line, the comment lines and the line terminators.
+        """
+        i = self._block_ids(keyword)[occurrence]
+        return [(int(start), int(end)) for start, end in zip(*self._data_lines(i))]
+
+    def _read_entities(self, family):
+        # the fields of all the blocks of an entity family, parsed chunk by chunk
+        widths = ENTITY_FIELDS[family]
+        fields, block_of_line = [], []
+        for i in self._block_ids(family):
+            line_starts, line_ends = self._data_lines(i)
+            for j in range(0, len(line_starts), CHUNK_LINES):
+                fields.append(_fixed_width(self._data, line_starts[j:j+CHUNK_LINES], line_ends[j:j+CHUNK_LINES], widths))
+            block_of_line.append(np.full(len(line_starts), i))
+        if not fields:
+            raise KeyError(f'No {family} block in {self.path}')
+        columns = [np.concatenate([chunk[k] for chunk in fields]) for k in range(len(widths))]
+        return columns, np.concatenate(block_of_line)
+
+    def nodes(self):
+        """
+        Returns:
+            tuple: Node ids (N,) and coordinates (N,3) of the /NODE or *NODE blocks.
+        """
+        family = '/NODE' if self._block_ids('/NODE') else '*NODE'
+        columns, _ = self._read_entities(family)
+        return columns[0].astype(np.int64), np.column_stack([column.astype(float) for column in columns[1:]])
+
+    def shells(self, part_id=None):
+        """
+        Parameters:
+            part_id (int): Only the shells of the part (default: all the shells).
+
+        Returns:
+            tuple: Shell ids (M,), part ids (M,) and node ids (M,4) of the /SHELL/<part_ID> or *ELEMENT_SHELL blocks.
+        """
+        if self._block_ids('/SHELL'):
+            columns, block_of_line = self._read_entities('/SHELL')
+            part_of_block = {i: int(self.keywords[i].split('/')[2]) for i in np.unique(block_of_line).tolist()}
+            part_ids = np.array([part_of_block[i] for i in block_of_line.tolist()], dtype=np.int64)
+            connectivity = columns[1:]
+        else:
+            columns, _ = self._read_entities('*ELEMENT_SHELL')
+            part_ids = columns[1].astype(np.int64)
+            connectivity = columns[2:]
+        ids = columns[0].astype(np.int64)
+        nodes = np.column_stack([column.astype(np.int64) for column in connectivity])
+        if part_id is not None:
+            selected = part_ids == part_id
+            ids, part_ids, nodes = ids[selected], part_ids[selected], nodes[selected]
+        return ids, part_ids, nodes
+
+    def prop_shell(self, prop_id):
+        """
+        Reads the /PROP/SHELL/<prop_ID> block: title, Ishell card, Hm card and the card of the thickness.
+
+        Returns:
+            dict: 'title', 'thickness' and 'thickness_field' (the byte range of the 20 characters wide
+            thickness field in the deck).
+        """
+        lines = self.data_lines(f'/PROP/SHELL/{prop_id}')
+        title, thick_line = lines[0], lines[3]
+        field = (thick_line[0] + 20, thick_line[0] + 40)
+        return {
+            'title': self._mmap[title[0]:title[1]].decode().strip(),
+            'thickness': float(self._mmap[field[0]:min(field[1], thick_line[1])].strip() or 0.0),
+            'thickness_field': field,
+        }
+
+    def line_offset(self, keyword, entity_id):
+        """
+        Parameters:
+            keyword (str): Keyword of the entity block ('/NODE', '/SHELL/4', ...) or of the family of blocks
+            ('/SHELL' for the shells of all the parts).
+            entity_id (int): Id of the node or shell.
+
+        Returns:
+            int: The byte offset of the line of the entity.
+        """
+        for i in self._block_ids(keyword):
+            ids = self._entity_ids.get(i)
+            if ids is None:
+                raise ValueError(f'{keyword} is not an entity block')
+            position = np.searchsorted(ids, entity_id)
+            if position < len(ids) and ids[position] == entity_id:
+                return int(self._entity_offsets[i][position])
+        raise KeyError(f'{keyword} {entity_id} not found in {self.path}')
+
+    def line(self, keyword, entity_id):
+        """
+        Returns:
+            str: The data line of the entity.
+        """
+        start = self.line_offset(keyword, entity_id)
+        end = self._mmap.find(b'\n', start)
+        return self._mmap[start:end if end != -1 else len(self._mmap)].decode().rstrip('\r')
@@ -0,0 +1,173 @@
+"""
+Solver environment of OpenRadioss set up once per process, to run the starter, the engine and the converters
+directly instead of through the batch file.
+
+The batch file resolves the environment of OpenRadioss (the paths of the configuration files and of the
+libraries, the OpenMP stack size) and starts the starter, the engine and th_to_csv as fresh processes for every
+run, through a shell. For short runs, e.g. at low fidelity, this fixed overhead weighs on the time per design. A
+SolverEnvironment resolves the environment and the executables once, and then runs the steps of a deck directly:
+
+    starter -i <deck> -np <np> -nt <nt>
+    engine -i <root>_0001.rad -nt <nt>         (mpiexec -n <np> engine_ompi ... with several MPI processes)
+    th_to_csv <root>T01                        (write_csv)
+    anim_to_vtk <root>A001 > <root>A001.vtk    (write_vtk)
+
+The timings of each run (see RunResult.timings) split the time of the engine, which scales with the model,
+from the fixed time of the rest. A worker process keeps its SolverEnvironment for all its jobs, see worker.py.
+"""
+
+import os
+import re
+import time
+import subprocess
+from .solver import run_files, clear_outputs, check_outputs, kill_process_group
+
+# suffix of the executables of the platform in <OpenRadioss>/exec, e.g. starter_linux64_gf_sp
+PLATFORM = 'win64' if os.name == 'nt' else 'linux64_gf'
+EXECUTABLE_EXTENSION = '.exe' if os.name == 'nt' else ''
+
+# ulimit -s of the batch file, raised to the hard limit in the solver processes only: the shell execs the step
+# (the same process, killed with its group) and the optimizer keeps its own limit. A wrapper rather than a
+# preexec_fn, which isn't safe with the threads of a batch evaluation.
+STACK_LIMIT_WRAPPER = ('/bin/sh', '-c', 'ulimit -s "$(ulimit -H -s)" 2>/dev/null; exec "$@"', 'sob-solver')
+
+class SolverEnvironment():
+    '''
+    Environment and executables of an OpenRadioss installation, see the module docstring.
+
+    Parameters:
+        openradioss_path (str): Root of the installation, with exec/, hm_cfg_files/ and extlib/. Default: the
+            OPENRADIOSS_PATH environment variable, else the parent of the directory of batch_file_path
+            (e.g. <OpenRadioss>/linux_scripts_mk3/openradioss_run_script_ps.sh).
+        batch_file_path (str): The batch file the installation is found from.
+        mpi_command (list): Launcher of the MPI engine, followed by the number of processes.
+        stack_size (str): OMP_STACKSIZE of the OpenMP threads.
+
+    stats counts the runs and sums their fixed and variable times, setup_time is the time of the setup.
+    '''
+    def __init__(self, openradioss_path=None, batch_file_path=None, mpi_command=('mpiexec', '-n'), stack_size='400m') -> None:
+        start = time.perf_counter()
+        openradioss_path = openradioss_path or os.environ.get('OPENRADIOSS_PATH')
+        if openradioss_path is None and batch_file_path is not None:
+            openradioss_path = os.path.dirname(os.path.dirname(os.path.abspath(batch_file_path)))
+        if openradioss_path is None:
+            raise ValueError('openradioss_path, the OPENRADIOSS_PATH environment variable or batch_file_path must be provided')
+        self.openradioss_path = os.path.abspath(openradioss_path)
+        self.exec_dir = os.path.join(self.openradioss_path, 'exec')
+        self.mpi_command = list(mpi_command)
+        self.env = self._environment(stack_size)
+        if not os.path.isdir(self.exec_dir):
+            raise FileNotFoundError(f'No OpenRadioss executables in {self.exec_dir}')
+        # the executables resolved so far: (name, sp, mpi) -> path
+        self._executables = {}
+        self.setup_time = time.perf_counter() - start
+        self.stats = {'runs': 0, 'fixed_time': 0.0, 'variable_time': 0.0}
+
+    def _environment(self, stack_size):
+        # the variables the batch file sets before running the starter and the engine
+        root = self.openradioss_path
+        env = dict(os.environ)
+        env['OPENRADIOSS_PATH'] = root
+        env['RAD_CFG_PATH'] = os.path.join(root, 'hm_cfg_files')
+        env['RAD_H3D_PATH'] = os.path.join(root, 'extlib', 'h3d', 'lib', 'win64' if os.name == 'nt' else 'linux64')
+        env['OMP_STACKSIZE'] = stack_size
+        env['KMP_STACKSIZE'] = stack_size
+        if os.name == 'nt':
+            libraries = [os.path.join(root, 'extlib', 'hm_reader', 'win64'), env['RAD_H3D_PATH'],
+                         os.path.join(root, 'extlib', 'intelOneAPI_runtime', 'win64')]
+            env['PATH'] = os.pathsep.join(libraries + [env.get('PATH', '')])
+        else:
+            libraries = [os.path.join(root, 'extlib', 'hm_reader', 'linux64'), env['RAD_H3D_PATH']]
+            env['LD_LIBRARY_PATH'] = os.pathsep.join(libraries + [env.get('LD_LIBRARY_PATH', '')]).rstrip(os.pathsep)
+        return env
+
+    def executable(self, name, sp='sp', mpi=False):
+        """
+        Path of an executable of the installation, e.g. executable('engine', 'sp', mpi=True) ->
+        <OpenRadioss>/exec/engine_linux64_gf_ompi_sp. The converters have no precision nor MPI variant.
+
+        Raises:
+            FileNotFoundError: The executable isn't in the installation.
+        """
+        key = (name, sp == 'sp', mpi)
+        if key not in self._executables:
+            file_name = f'{name}_{PLATFORM}'
+            if name in ('starter', 'engine'):
+                file_name += ('_ompi' if mpi else '') + ('_sp' if sp == 'sp' else '')
+            path = os.path.join(self.exec_dir, file_name + EXECUTABLE_EXTENSION)
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f'No OpenRadioss executable {path}')
+            self._executables[key] = path
+        return self._executables[key]
+
+    def _run_step(self, command, working_dir, env, deadline, monitor=None, stdout=subprocess.DEVNULL):
+        # one process of a run, killed at the deadline (subprocess.TimeoutExpired)
+        if os.name == 'posix':
+            command = list(STACK_LIMIT_WRAPPER) + list(command)
+        process = subprocess.Popen(command, cwd=working_dir, env=env, stdout=stdout,
+                                   start_new_session=(os.name == 'posix'))
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            if monitor is None:
+                return process.wait(timeout)
+            return monitor.watch(process, timeout)
+        except BaseException:
+            kill_process_group(process)
+            process.wait()
+            raise
+
+    def run_once(self, input_file_path, write_vtk=False, write_csv=True, nt=1, np=1, sp='sp', monitor=None, timeout=None):
+        """
+        One attempt of run_radioss with this environment, see solver.run_radioss.
+
+        Returns:
+            tuple: (status, return code, message, timings), see RunResult.
+        """
+        clear_outputs(input_file_path, monitor)
+        files = run_files(input_file_path)
+        working_dir, input_file_name = os.path.split(os.path.abspath(input_file_path))
+        env = dict(self.env, OMP_NUM_THREADS=str(nt))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        timings = {}
+        start = time.perf_counter()
+        returncode = None
+        try:
+            step_start = time.perf_counter()
+            returncode = self._run_step([self.executable('starter', sp), '-i', input_file_name, '-np', str(np), '-nt', str(nt)],
+                                        working_dir, env, deadline)
+            timings['starter'] = time.perf_counter() - step_start
+            if returncode == 0 and os.path.exists(files['engine_input']):
+                engine = [self.executable('engine', sp, mpi=np > 1), '-i', os.path.basename(files['engine_input']), '-nt', str(nt)]
+                if np > 1:
+                    engine = self.mpi_command + [str(np)] + engine
+                step_start = time.perf_counter()
+                returncode = self._run_step(engine, working_dir, env, deadline, monitor)
+                timings['engine'] = time.perf_counter() - step_start
+
+                step_start = time.perf_counter()
+                self._convert(files, working_dir, env, deadline, write_csv, write_vtk)
+                timings['convert'] = time.perf_counter() - step_start
+        except subprocess.TimeoutExpired:
+            timings['total'] = time.perf_counter() - start
+            return 'timeout', returncode, f'killed after {timeout} s', timings
+        except OSError as e:
+            timings['total'] = time.perf_counter() - start
+            return 'error', returncode, str(e), timings
+        timings['total'] = time.perf_counter() - start
+        if 'engine' in timings:
+            self.stats['runs'] += 1
+            self.stats['variable_time'] += timings['engine']
+            self.stats['fixed_time'] += timings['total'] - timings['engine']
+        status, message = check_outputs(input_file_path, returncode, write_csv, monitor)
+        return status, returncode, message, timings
+
+    def _convert(self, files, working_dir, env, deadline, write_csv, write_vtk):
+        # time history to CSV and animation files to VTK, as the batch file does after the engine
+        root = os.path.basename(files['time_history'])[:-len('T01.csv')]
+        if write_csv and os.path.exists(os.path.join(working_dir, root + 'T01')):
+            self._run_step([self.executable('th_to_csv'), root + 'T01'], working_dir, env, deadline)
+        if write_vtk:
+            animations = sorted(name for name in os.listdir(working_dir) if re.fullmatch(re.escape(root) + r'A\d{3,}', name))
+            for name in animations:
+                with open(os.path.join(working_dir, name + '.vtk'), 'wb') as f:
+                    self._run_step([self.executable('anim_to_vtk'), name], working_dir, env, deadline, stdout=f)
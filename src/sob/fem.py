@@ -1,35 +1,108 @@
 import os
+import shutil
+import threading
+import hashlib
+import tempfile
 import numpy as np
+from collections import OrderedDict
 from .mesh import *
+from .deck import DeckIndex
+
+# Output profiles of the models: 'full' writes all the databases and the animation files, 'objective' only the
+# time history the objectives are computed from (see StarBoxModel._writes_database).
+OUTPUT_PROFILES = ['full', 'objective']
+
+# Databases of the 'objective' profile: the time history (T01) of the history nodes is written at the interval of
+# GLSTAT and NODOUT. RWFORC is added for the rigid wall force, see OptiProblem.wall_force_key.
+OBJECTIVE_DATABASES = ['GLSTAT', 'NODOUT']
+
+# Number of rendered keyword files kept in memory, the least recently used beyond it are dropped (see
+# StarBoxModel._rendered_blocks).
+BLOCK_CACHE_SIZE = 32
+
+def _encode(text):
+    # bytes of a keyword file as written in text mode, with the line separator of the platform
+    return text.replace('\n', os.linesep).encode()
+
+def _write_bytes(path, data):
+    # one buffered write per file. An existing file is removed first rather than truncated,
+    # as it may be a hard link to a shared file.
+    if os.path.lexists(path):
+        os.remove(path)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _link_or_copy(source, destination):
+    # hard link to the shared file, copy where hard links are not supported (e.g. across file systems)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
 
 class StarBoxModel():
+    # Define default parameters for load_impactor, the wall location 'wall_loc' depends on the mesh
+    # and is added when the model is initialized.
+    impactor_defaults = {
+        'wall_n_id': 999999,
+        'wall_mass': 250.0,
+        'wall_vel': 7.0,
+    }
+
+    # Define default parameters for load_database
+    database_defaults = {
+        'end_time': 45.0,
+        'database_dtime': 0.05,
+        'consider_d3plot': True, # cons_d3plot
+        'd3plot_dtime': 0.5, # d3plot_dtime
+        'cons_d3thdt' : False,
+        'd3thdt_dtime': 10000, # d3thdt_dt
+        'shell_warping': 1,
+        'binary_ascii': 2,
+        'write_cshell':True,
+        'tdel': 0.0
+        # Add other default parameters here
+    }
+
+    # Define default parameters for load_material
+    material_defaults = {
+        'mat_id': 999,
+        'mat_density': 7.83E-6,
+        'mat_young_mod': 200.0,
+        'mat_poisson_r': 0.3,
+        'mat_yield_initial': 0.366,
+        'mat_tang_mod': 0.0,
+        'mat_failure_pstrain': 1.0E+21,
+        'mat_cowper_symond_c': 40.0,
+        'mat_cowper_symond_p': 5.0,
+        'mat_vp_rate_efffect': 1,
+        'mat_load_curve_id': 1,
+        'mat_effective_plastic_strain_stress': np.array([[0., 0.366], [2.5e-2, 0.4240],
+                                                         [4.9e-2, 0.476], [7.2e-2, 0.507],
+                                                         [9.5e-2, 0.529], [0.118, 0.546],
+                                                         [0.140, 0.559], [0.182, 0.584]]),
+        # Add other default parameters here
+    }
+
+    # Rendered keyword files, shared by all the models with the same parameters (see _block_key): the bytes
+    # of the files which don't depend on the design, and the template of bc_wall.k, in which only the wall
+    # location is filled in for each deck. Least recently used first, at most BLOCK_CACHE_SIZE entries.
+    _block_cache = OrderedDict()
+    _block_lock = threading.Lock()
+
     def __init__(self, mesh:StarBoxMesh, **kwargs) -> None:
         self.mesh = mesh
-        mesh.write_mesh_file()
         # mesh.units =  '  kg  mm  ms  kN  GPa  kN-mm'
         self.units = mesh.units
-        # Define default parameters for load_impactor
-        self.impactor_defaults = {
-            'wall_n_id': 999999,
-            'wall_loc': self.mesh.extrusion_length+1,
-            'wall_mass': 250.0,
-            'wall_vel': 7.0,
-        }
-        
-        # Define default parameters for load_database
-        self.database_defaults = {
-            'end_time': 45.0,
-            'database_dtime': 0.05,
-            'consider_d3plot': True, # cons_d3plot
-            'd3plot_dtime': 0.5, # d3plot_dtime
-            'cons_d3thdt' : False,
-            'd3thdt_dtime': 10000, # d3thdt_dt
-            'shell_warping': 1,
-            'binary_ascii': 2,
-            'write_cshell':True,
-            'tdel': 0.0
-            # Add other default parameters here
-        }
+        self.impactor_defaults = dict(self.impactor_defaults, wall_loc=self.mesh.extrusion_length+1)
+        # computation of mass(), 'analytic' or 'mesh'
+        self.mass_mode = kwargs.get('mass_mode', 'analytic')
+        # output profile, see OUTPUT_PROFILES, and the databases written by the 'objective' profile
+        self.output_profile = kwargs.get('output_profile', 'full')
+        if self.output_profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Invalid output_profile '{self.output_profile}', the options are {OUTPUT_PROFILES}")
+        self.objective_databases = list(kwargs.get('objective_databases', OBJECTIVE_DATABASES))
         
         self.shell_warping = 1    # BWC, lsdyna default is 2. if there is warping set it to 1
         self.binary_ascii = 2  # 1: only ascii   2: only binary   3: both ascii and binary
@@ -44,26 +117,6 @@ class StarBoxModel():
         self.epsflg = 1
         self.rltflg = 1
 
-        # Define default parameters for load_material
-        self.material_defaults = {
-            'mat_id': 999,
-            'mat_density': 7.83E-6,
-            'mat_young_mod': 200.0,
-            'mat_poisson_r': 0.3,
-            'mat_yield_initial': 0.366,
-            'mat_tang_mod': 0.0,
-            'mat_failure_pstrain': 1.0E+21,
-            'mat_cowper_symond_c': 40.0,
-            'mat_cowper_symond_p': 5.0,
-            'mat_vp_rate_efffect': 1,
-            'mat_load_curve_id': 1,
-            'mat_effective_plastic_strain_stress': np.array([[0., 0.366], [2.5e-2, 0.4240],
-                                                             [4.9e-2, 0.476], [7.2e-2, 0.507],
-                                                             [9.5e-2, 0.529], [0.118, 0.546],
-                                                             [0.140, 0.559], [0.182, 0.584]]),
-            # Add other default parameters here
-        }
-
         self._load_impactor(**kwargs)
         self._load_database(**kwargs)
         self._load_material(**kwargs)
@@ -73,12 +126,30 @@ class StarBoxModel():
         self.write_nod_force_bottom = True
 
     def mass(self):
-        return self.mesh.volume()*self.mat_density
+        # 'analytic': perimeter of the cross section * extrusion length * thickness,
+        # 'mesh': shell areas of the generated mesh * thickness, including the trigger dents
+        if self.mass_mode == 'analytic':
+            return self.mesh.volume()*self.mat_density
+        elif self.mass_mode == 'mesh':
+            return self.mesh.mesh_volume()*self.mat_density
+        else:
+            raise ValueError(f"Invalid mass_mode '{self.mass_mode}', expected 'analytic' or 'mesh'")
     
     def absorbed_energy(self):
         # initial kinetic energy
         return self.wall_mass*self.wall_vel**2/2
     
+    def _writes_database(self, name):
+        # whether the database *DATABASE_<name> (or *DATABASE_BINARY_<name>) is written by the output profile
+        return self.output_profile == 'full' or name in self.objective_databases
+
+    def _history_nodes(self):
+        # nodes of *DATABASE_HISTORY_NODE: the wall and the tracked node, the tracked node only for the
+        # 'objective' profile (the crush is read from its displacement)
+        if self.output_profile == 'full':
+            return [self.wall_n_id, self.mesh.node_starting_id]
+        return [self.mesh.node_starting_id]
+
     def _load_impactor(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
@@ -97,67 +168,106 @@ class StarBoxModel():
         for key, value in self.material_defaults.items():
             setattr(self, key, kwargs.get(key, value))
 
-    def _write_bc_wall(self):
+    def _block_key(self):
+        # every parameter of the model except the mesh and the wall location, so that changing any
+        # parameter renders the keyword files again
+        state = []
+        for key, value in vars(self).items():
+            if key in ['mesh', 'wall_loc', 'impactor_defaults', 'mass_mode']:
+                continue
+            if isinstance(value, np.ndarray):
+                value = (value.shape, value.tobytes())
+            elif isinstance(value, (dict, list)):
+                value = repr(value)
+            state.append((key, value))
+        return (self.__class__.__name__, self.mesh.node_starting_id, tuple(sorted(state)))
+
+    def _rendered_blocks(self):
+        """
+        Returns:
+            dict: Per keyword file name, its bytes, or for bc_wall.k its template with a {wall_loc} field.
+        """
+        key = self._block_key()
+        with self._block_lock:
+            blocks = self._block_cache.get(key)
+            if blocks is not None:
+                self._block_cache.move_to_end(key)
+        if blocks is None:
+            blocks = {
+                'bc_wall.k': self._render_bc_wall(),
+                'dcc.k': _encode(self._render_dcc()),
+                'nodal_force_top.k': _encode(self._render_nodal_force_top()),
+                'nodal_force_bottom.k': _encode(self._render_nodal_force_bottom()), # Cannot recogenized by OpenRadioss
+                'material.k': _encode(self._render_material()),
+                'combine.k': _encode(self._render_combine()),
+            }
+            with self._block_lock:
+                self._block_cache[key] = blocks
+                while len(self._block_cache) > BLOCK_CACHE_SIZE:
+                    self._block_cache.popitem(last=False)
+        return blocks
+
+    def _render_bc_wall(self):
         # ----------------------------------------------------------- rigid walls
-        adr = os.path.join(os.getcwd(),'bc_wall.k') 
-        inf = open(adr, 'w')
-        inf.write('*KEYWORD\n')
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$                                 Rigid Wall                                  $')
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$\n')
-        inf.write('*NODE\n')
-        inf.write('$    nid               x               y               z      tc      rc\n')
-        inf.write("{:>8}{:>16}{:>16}{:>16}{:>8}{:>8}\n".format(str(self.wall_n_id),\
-                '0.0', '0.0', str(self.wall_loc), '0', '0'))
-        inf.write('*RIGIDWALL_PLANAR_MOVING_FORCES_ID\n')
-        inf.write('$#      id\n')
-        inf.write("{:>10}\n".format('1'))
-        inf.write('$#    nsid    nsidex     boxid    offset     birth     death     rwksf  \n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
+        # the wall location is a {wall_loc} field of the template, filled in by write_input_files
+        block = []
+        block.append('*KEYWORD\n')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$                                 Rigid Wall                                  $')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$\n')
+        block.append('*NODE\n')
+        block.append('$    nid               x               y               z      tc      rc\n')
+        block.append("{:>8}{:>16}{:>16}{{wall_loc:>16}}{:>8}{:>8}\n".format(str(self.wall_n_id),\
+                '0.0', '0.0', '0', '0'))
+        block.append('*RIGIDWALL_PLANAR_MOVING_FORCES_ID\n')
+        block.append('$#      id\n')
+        block.append("{:>10}\n".format('1'))
+        block.append('$#    nsid    nsidex     boxid    offset     birth     death     rwksf  \n')
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
             '0', '0.0', '0.0', '1.00E20', '1.0'))    
-        inf.write('$#      xt        yt        zt        xh        yh        zh      fric      wvel\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.0','0.0', \
-            str(self.wall_loc), '0.0', '0.0', '0.0', '1.0', '0.0'))
-        inf.write('$#    mass        v0\n')
-        inf.write("{:>10}{:>10}\n".format(str(self.wall_mass),str(self.wall_vel)))    
-        inf.write('$#    soft      ssid        n1        n2        n3        n4\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
+        block.append('$#      xt        yt        zt        xh        yh        zh      fric      wvel\n')
+        block.append("{:>10}{:>10}{{wall_loc:>10}}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.0','0.0', \
+            '0.0', '0.0', '0.0', '1.0', '0.0'))
+        block.append('$#    mass        v0\n')
+        block.append("{:>10}{:>10}\n".format(str(self.wall_mass),str(self.wall_vel)))    
+        block.append('$#    soft      ssid        n1        n2        n3        n4\n')
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
             str(self.wall_n_id), '0', '0', '0'))
-        inf.write('*RIGIDWALL_PLANAR_ID\n') 
-        inf.write('$#      id\n')          
-        inf.write('         2\n') 
-        inf.write('$#    nsid    nsidex     boxid    offset     birth     death     rwksf\n') 
-        inf.write('         0         0         0     0.000     0.0001.0000E+201.00000000\n')      
-        inf.write('$#      xt        yt        zt        xh        yh        zh      fric      wvel\n')    
-        inf.write('     0.000     0.000     0.000     0.000     0.00010.0000000     0.000     0.000\n')  
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$                                Boundary SPC                                 $')
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$\n')  
-        inf.write('*BOUNDARY_SPC_SET\n')
-        inf.write('$#    nsid       cid      dofx      dofy      dofz     dofrx     dofry     dofrz\n')
+        block.append('*RIGIDWALL_PLANAR_ID\n') 
+        block.append('$#      id\n')          
+        block.append('         2\n') 
+        block.append('$#    nsid    nsidex     boxid    offset     birth     death     rwksf\n') 
+        block.append('         0         0         0     0.000     0.0001.0000E+201.00000000\n')      
+        block.append('$#      xt        yt        zt        xh        yh        zh      fric      wvel\n')    
+        block.append('     0.000     0.000     0.000     0.000     0.00010.0000000     0.000     0.000\n')  
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$                                Boundary SPC                                 $')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$\n')  
+        block.append('*BOUNDARY_SPC_SET\n')
+        block.append('$#    nsid       cid      dofx      dofy      dofz     dofrx     dofry     dofrz\n')
         # ---------- lowest node set id is 101
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(101),'0', '1'
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(101),'0', '1'
                     , '1', '1', '1', '1', '1'))
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$                                For Output                                     $')
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$\n')  
-        inf.write('*DATABASE_HISTORY_NODE\n')
-        inf.write('$#    nid1     nid2     nid3     nid4     nid5     nid6     nid7     nid8\n')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$                                For Output                                     $')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$\n')  
+        block.append('*DATABASE_HISTORY_NODE\n')
+        block.append('$#    nid1     nid2     nid3     nid4     nid5     nid6     nid7     nid8\n')
         # ---------- lowest node set id is 101
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(self.wall_n_id), 
-                                            str(self.mesh.node_starting_id), '0', '0', '0', '0', '0', '0'))
-        inf.write('$\n*END')
-        inf.close()
+        history_nodes = [str(node) for node in self._history_nodes()]
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(*history_nodes,
+                                            *['0']*(8 - len(history_nodes))))
+        block.append('$\n*END')
+        return ''.join(block)
 
-    def _write_dcc(self):
+    def _render_dcc(self):
         """
         writes Database, Control and Contact keywords 
 
         Inputs
-            #adr          # addresss of the to be created output file
             endtim        # endtime
             database_dtime   # dt for all databases except than d3polt and d3thdt  
             d3plot_dtime     # dt foe d3plot
@@ -176,286 +286,406 @@ class StarBoxModel():
         Output
             creted adr.k includes control, contact and database 
         """   
-        adr = os.path.join(os.getcwd(),'dcc.k')
-        inf = open(adr, 'w')
-        inf.write('*KEYWORD\n')
+        block = []
+        block.append('*KEYWORD\n')
         # ----------- Control
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$                                   Control                                   $')
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$\n')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$                                   Control                                   $')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$\n')
         if  self.write_cshell == True:
-            inf.writelines('*CONTROL_SHELL\n')
-            inf.writelines('$#  wrpang     esort     irnxx    istupd    theory       bwc     miter      proj\n')
-            inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('20.0', 
+            block.append('*CONTROL_SHELL\n')
+            block.append('$#  wrpang     esort     irnxx    istupd    theory       bwc     miter      proj\n')
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('20.0', 
                         '1', '-1', '0', '2', str(int(self.shell_warping)), '1', '0'))
-            inf.writelines('$# rotascl    intgrd    lamsht    cstyp6    tshell\n')
-            inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('1.0', '0', '0', '1', '0'))
-            inf.writelines('$# psstupd   sidt4tu     cntco    itsflg    irquad \n')
-            inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0', '0', '0', '0', '2'))
-            inf.writelines('$#  nfail1    nfail4   psnfail    keepcs     delfr   drcpsid    drcprm \n')
-            inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('1', 
+            block.append('$# rotascl    intgrd    lamsht    cstyp6    tshell\n')
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('1.0', '0', '0', '1', '0'))
+            block.append('$# psstupd   sidt4tu     cntco    itsflg    irquad \n')
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0', '0', '0', '0', '2'))
+            block.append('$#  nfail1    nfail4   psnfail    keepcs     delfr   drcpsid    drcprm \n')
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('1', 
                         '0', '0', '0', '0', '0', '1.0'))    
         else:
             print ('\nCONTROL_SHELL was not written')
         
-        inf.writelines('*CONTROL_ENERGY\n')
-        inf.writelines('$     hgen      rwen    slnten     rylen\n')
-        inf.writelines('         2         2         1         1\n')
+        block.append('*CONTROL_ENERGY\n')
+        block.append('$     hgen      rwen    slnten     rylen\n')
+        block.append('         2         2         1         1\n')
         
-        inf.writelines('*CONTROL_TERMINATION\n')  
-        inf.writelines('$   endtim    endcyc     dtmin    endeng    endmas\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(self.end_time), '0', '0.0', '0.0', '1.0E8'))
+        block.append('*CONTROL_TERMINATION\n')  
+        block.append('$   endtim    endcyc     dtmin    endeng    endmas\n')
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(self.end_time), '0', '0.0', '0.0', '1.0E8'))
         
         # ----------- Database
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$                                  Database                                   $')
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$\n')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$                                  Database                                   $')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$\n')
         bin_asc = str(int(self.binary_ascii))
-        inf.writelines('*DATABASE_GLSTAT\n')            
-        inf.writelines('$#      dt    binary      lcur     ioopt\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1'))
+        if self._writes_database('GLSTAT'):
+            block.append('*DATABASE_GLSTAT\n')            
+            block.append('$#      dt    binary      lcur     ioopt\n')
+            block.append("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1'))
 
-        inf.writelines('*DATABASE_MATSUM\n')            
-        inf.writelines('$#      dt    binary      lcur     ioopt\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1')) 
+        if self._writes_database('MATSUM'):
+            block.append('*DATABASE_MATSUM\n')            
+            block.append('$#      dt    binary      lcur     ioopt\n')
+            block.append("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1')) 
 
         # !! Cannot recogenized by OpenRadioss
         # !! nodfor gives time histories of contact forces at nodes.
-        # inf.writelines('*DATABASE_NODFOR\n')            
-        # inf.writelines('$#      dt    binary      lcur     ioopt\n')
-        # inf.writelines("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1')) 
+        # block.append('*DATABASE_NODFOR\n')            
+        # block.append('$#      dt    binary      lcur     ioopt\n')
+        # block.append("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1')) 
         
-        inf.writelines('*DATABASE_NODOUT\n')            
-        inf.writelines('$#      dt    binary      lcur     ioopt   option1   option2 \n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1','0.0','0'))
-
-        inf.writelines('*DATABASE_RWFORC\n')            
-        inf.writelines('$#      dt    binary      lcur     ioopt\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1'))  
-
-        inf.writelines('*DATABASE_SECFORC\n')            
-        inf.writelines('$#      dt    binary      lcur     ioopt\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1'))
-
-        inf.writelines('*DATABASE_SLEOUT\n')            
-        inf.writelines('$#      dt    binary      lcur     ioopt\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1'))
-
-        if self.consider_d3plot == True:
-            inf.writelines('*DATABASE_BINARY_D3PLOT\n')    
-            inf.writelines('$#      dt      lcdt      beam     npltc    psetid\n')    
-            inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(self.d3plot_dtime), '0', '0', '0', '0'))    
-            inf.writelines('$#   ioopt\n');inf.writelines('         0\n')              
-
-        if self.cons_d3thdt == True:
-            inf.writelines('*DATABASE_BINARY_D3THDT\n')    
-            inf.writelines('$#      dt      lcdt      beam     npltc    psetid\n')    
-            inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(self.d3thdt_dtime), '0', '0', '0', '0'))    
-
-        inf.writelines('*DATABASE_EXTENT_BINARY\n') 
-        inf.writelines('$#   neiph     neips    maxint    strflg    sigflg    epsflg    rltflg    engflg\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
-        str(self.intp_db), '0', str(self.sigflg), str(self.epsflg), str(self.rltflg),'1'))    
-        inf.writelines('$#  cmpflg    ieverp    beamip     dcomp      shge     stssz    n3thdt   ialemat\n') 
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
-        '0', '1', '1', '1', '2','1')) 
-        inf.writelines('$# nintsld   pkp_sen      sclp     hydro     msscl     therm    intout    nodout\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
-        '1.0', '0', '0', '0', self.intout, self.nodout))
-        inf.writelines('$#    dtdt    resplt     neipb\n')    
-        inf.writelines("{:>10}{:>10}{:>10}\n".format('0', '0', '0'))
+        if self._writes_database('NODOUT'):
+            block.append('*DATABASE_NODOUT\n')            
+            block.append('$#      dt    binary      lcur     ioopt   option1   option2 \n')
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1','0.0','0'))
+
+        if self._writes_database('RWFORC'):
+            block.append('*DATABASE_RWFORC\n')            
+            block.append('$#      dt    binary      lcur     ioopt\n')
+            block.append("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1'))  
+
+        if self._writes_database('SECFORC'):
+            block.append('*DATABASE_SECFORC\n')            
+            block.append('$#      dt    binary      lcur     ioopt\n')
+            block.append("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1'))
+
+        if self._writes_database('SLEOUT'):
+            block.append('*DATABASE_SLEOUT\n')            
+            block.append('$#      dt    binary      lcur     ioopt\n')
+            block.append("{:>10}{:>10}{:>10}{:>10}\n".format(str(self.database_dtime), bin_asc, '0', '1'))
+
+        if self.consider_d3plot == True and self._writes_database('D3PLOT'):
+            block.append('*DATABASE_BINARY_D3PLOT\n')    
+            block.append('$#      dt      lcdt      beam     npltc    psetid\n')    
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(self.d3plot_dtime), '0', '0', '0', '0'))    
+            block.append('$#   ioopt\n');block.append('         0\n')              
+
+        if self.cons_d3thdt == True and self._writes_database('D3THDT'):
+            block.append('*DATABASE_BINARY_D3THDT\n')    
+            block.append('$#      dt      lcdt      beam     npltc    psetid\n')    
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(self.d3thdt_dtime), '0', '0', '0', '0'))    
+
+        if self._writes_database('EXTENT_BINARY'):
+            block.append('*DATABASE_EXTENT_BINARY\n') 
+            block.append('$#   neiph     neips    maxint    strflg    sigflg    epsflg    rltflg    engflg\n')
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
+            str(self.intp_db), '0', str(self.sigflg), str(self.epsflg), str(self.rltflg),'1'))    
+            block.append('$#  cmpflg    ieverp    beamip     dcomp      shge     stssz    n3thdt   ialemat\n') 
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
+            '0', '1', '1', '1', '2','1')) 
+            block.append('$# nintsld   pkp_sen      sclp     hydro     msscl     therm    intout    nodout\n')
+            block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
+            '1.0', '0', '0', '0', self.intout, self.nodout))
+            block.append('$#    dtdt    resplt     neipb\n')    
+            block.append("{:>10}{:>10}{:>10}\n".format('0', '0', '0'))
         # !! Cannot recogenized by OpenRadioss
         # !! nodfor gives time histories of contact forces at nodes.
-        # inf.writelines('*DATABASE_MASSOUT\n') 
-        # inf.writelines('$#   setid     ndflg     rbflg\n')     
-        # inf.writelines("{:>10}{:>10}{:>10}\n".format('0', '1', '0')) 
+        # block.append('*DATABASE_MASSOUT\n') 
+        # block.append('$#   setid     ndflg     rbflg\n')     
+        # block.append("{:>10}{:>10}{:>10}\n".format('0', '1', '0')) 
         
     # ----------- Contact
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$                                   Contact                                   $')
-        inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-        inf.write('\n$\n')
-        inf.writelines('*CONTACT_AUTOMATIC_SINGLE_SURFACE\n')     
-        inf.writelines('$#    ssid      msid     sstyp     mstyp    sboxid    mboxid       spr       mpr\n')       
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$                                   Contact                                   $')
+        block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+        block.append('\n$\n')
+        block.append('*CONTACT_AUTOMATIC_SINGLE_SURFACE\n')     
+        block.append('$#    ssid      msid     sstyp     mstyp    sboxid    mboxid       spr       mpr\n')       
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0','0', \
         '0', '0', '0', '0', '0','0')) 
-        inf.writelines('$#      fs        fd        dc        vc       vdc    penchk        bt        dt\n')       
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.08','0.8', \
+        block.append('$#      fs        fd        dc        vc       vdc    penchk        bt        dt\n')       
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.08','0.8', \
         '0.0', '0.0', '0.0', '0', '0.0','1.0E20'))    
-        inf.writelines('$#     sfs       sfm       sst       mst      sfst      sfmt       fsf       vsf\n')
-        inf.writelines("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.0','1.0', \
+        block.append('$#     sfs       sfm       sst       mst      sfst      sfmt       fsf       vsf\n')
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.0','1.0', \
         '0.0', '0.0', '1.0', '1.0', '1.0','1.0')) 
-        inf.write('$\n')
-        inf.write('*END')   
-        inf.close()
-
-    def _write_material(self):
-        adr = os.path.join(os.getcwd(),'material.k')
-        inf = open(adr, 'w')
-        inf.write('$#  units:' + self.units + '\n')
-        inf.write('*KEYWORD\n')    
-        inf.write('*MAT_PIECEWISE_LINEAR_PLASTICITY\n') 
-        inf.write('$#     mid        ro         e        pr      sigy      etan      fail      tdel\n')
-        inf.write("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(int(self.mat_id)),\
+        block.append('$\n')
+        block.append('*END')   
+        return ''.join(block)
+
+    def _render_material(self):
+        block = []
+        block.append('$#  units:' + self.units + '\n')
+        block.append('*KEYWORD\n')    
+        block.append('*MAT_PIECEWISE_LINEAR_PLASTICITY\n') 
+        block.append('$#     mid        ro         e        pr      sigy      etan      fail      tdel\n')
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(int(self.mat_id)),\
                     str(self.mat_density), str(self.mat_young_mod), str(self.mat_poisson_r), str(self.mat_yield_initial), 
                     str(self.mat_tang_mod), str(self.mat_failure_pstrain), str(self.tdel)))
-        inf.write('$#       c         p      lcss      lcsr        vp\n') 
-        inf.write("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(int(self.mat_cowper_symond_c)),\
+        block.append('$#       c         p      lcss      lcsr        vp\n') 
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(int(self.mat_cowper_symond_c)),\
                 str(self.mat_cowper_symond_p), str(int(self.mat_load_curve_id)), '0', 
                 str(int(self.mat_vp_rate_efffect))))
-        inf.write('$#    eps1      eps2      eps3      eps4      eps5      eps6      eps7      eps8\n')
-        inf.write("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.0','0.0', \
+        block.append('$#    eps1      eps2      eps3      eps4      eps5      eps6      eps7      eps8\n')
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.0','0.0', \
                 '0.0', '0.0', '0.0', '0.0', '0.0','0.0'))  
-        inf.write('$#     es1       es2       es3       es4       es5       es6       es7       es8\n')
-        inf.write("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.0','0.0', \
+        block.append('$#     es1       es2       es3       es4       es5       es6       es7       es8\n')
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format('0.0','0.0', \
                 '0.0', '0.0', '0.0', '0.0', '0.0','0.0'))     
-        inf.write('*DEFINE_CURVE\n') 
-        inf.write('$#    lcid      sidr       sfa       sfo      offa      offo    dattyp\n') 
-        inf.write("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(int(self.mat_load_curve_id)),
+        block.append('*DEFINE_CURVE\n') 
+        block.append('$#    lcid      sidr       sfa       sfo      offa      offo    dattyp\n') 
+        block.append("{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(str(int(self.mat_load_curve_id)),
                 '0', '1.0', '1.0', '0.0', '0.0', '0'))   
-        inf.write('$#                a1                  o1\n')
+        block.append('$#                a1                  o1\n')
         for i in range(np.size(self.mat_effective_plastic_strain_stress,0)):
-            inf.write("{:>20}{:>20}\n".format(str(self.mat_effective_plastic_strain_stress[i,0]),
+            block.append("{:>20}{:>20}\n".format(str(self.mat_effective_plastic_strain_stress[i,0]),
                     str(self.mat_effective_plastic_strain_stress[i,1])))     
-        inf.write('*END')   
-        inf.close()
+        block.append('*END')   
+        return ''.join(block)
 
-    def _write_nodal_force_top(self):
+    def _render_nodal_force_top(self):
         """
         writes set of node list to calculate the external nodal forces on the top
         of the structure. In py_mesh node set at the bottom have id = 102, this will be
         the id of the node set for which the nodal force group will be calculated.
         Inputs                          
         """
-        adr = os.path.join(os.getcwd(),'nodal_force_top.k') 
-        inf = open(adr, 'w')
-        inf.write('*KEYWORD\n')
+        block = []
+        block.append('*KEYWORD\n')
         if self.write_nod_force_top == True:
-            inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-            inf.write('\n$                           Nodal forces at top                                $')
-            inf.write('\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$\n')   
-            inf.write('$#\n')
+            block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+            block.append('\n$                           Nodal forces at top                                $')
+            block.append('\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$\n')   
+            block.append('$#\n')
             added_id = 101
-            inf.write('*DATABASE_NODAL_FORCE_GROUP\n')
-            inf.write('$#    nsid       cid\n')
-            inf.write("{:>10}{:>10}\n".format(str(added_id),'0'))
-            inf.write('$\n')                   
-        inf.write('*END')   
-        inf.close()       
-
-    def _write_nodal_force_bottom(self):
+            block.append('*DATABASE_NODAL_FORCE_GROUP\n')
+            block.append('$#    nsid       cid\n')
+            block.append("{:>10}{:>10}\n".format(str(added_id),'0'))
+            block.append('$\n')                   
+        block.append('*END')   
+        return ''.join(block)
+
+    def _render_nodal_force_bottom(self):
         """
         writes set of node list to calculate the external nodal forces on the bottom
         of the structure. In py_mesh node set at the bottom have id = 102, this will be
         the id of the node set for which the nodal force group will be calculated.
         Inputs                          
         """
-        adr = os.path.join(os.getcwd(),'nodal_force_bottom.k') 
-        inf = open(adr, 'w')
-        inf.write('*KEYWORD\n')
+        block = []
+        block.append('*KEYWORD\n')
         if self.write_nod_force_bottom == True:
-            inf.write('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
-            inf.write('\n$                          Nodal forces at bottom                              $')
-            inf.write('\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$\n')   
-            inf.write('$#\n')
+            block.append('$\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$')
+            block.append('\n$                          Nodal forces at bottom                              $')
+            block.append('\n$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$\n')   
+            block.append('$#\n')
             added_id = 102
-            inf.write('*DATABASE_NODAL_FORCE_GROUP\n')
-            inf.write('$#    nsid       cid\n')
-            inf.write("{:>10}{:>10}\n".format(str(added_id),'0'))        
-            inf.write('$\n')                   
-        inf.write('*END')   
-        inf.close()
-
-    def write_input_files(self):
-        self._write_bc_wall()
-        self._write_dcc()
-        self._write_nodal_force_top()
-        self._write_nodal_force_bottom() # Cannot recogenized by OpenRadioss
-        self._write_material()
+            block.append('*DATABASE_NODAL_FORCE_GROUP\n')
+            block.append('$#    nsid       cid\n')
+            block.append("{:>10}{:>10}\n".format(str(added_id),'0'))        
+            block.append('$\n')                   
+        block.append('*END')   
+        return ''.join(block)
+
+    def write_input_files(self, output_dir='.', shared_dir=None):
+        """
+        Writes the mesh and all the input files of the model into output_dir (default: the current working directory).
+        Nothing depends on the current working directory, so the input decks of several models can be written concurrently.
+        With shared_dir, only mesh.k is written into output_dir, the other files are hard links to the copy
+        written once into shared_dir by write_shared_includes.
+        """
+        self.mesh.write_mesh_file(output_dir)
+        if shared_dir is None:
+            for file_name, block in self._deck_files().items():
+                _write_bytes(os.path.join(output_dir, file_name), block)
+        else:
+            include_dir = self.write_shared_includes(shared_dir)
+            for file_name in self._rendered_blocks():
+                _link_or_copy(os.path.join(include_dir, file_name), os.path.join(output_dir, file_name))
+
+    def _deck_files(self):
+        # bytes of the keyword files other than mesh.k
+        files = {}
+        for file_name, block in self._rendered_blocks().items():
+            if file_name == 'bc_wall.k':
+                block = _encode(block.format(wall_loc=str(self.wall_loc)))
+            files[file_name] = block
+        return files
+
+    def write_shared_includes(self, shared_dir):
+        """
+        Write the keyword files other than mesh.k once into a subdirectory of shared_dir named after a hash of
+        their content, so that all the decks of models with the same parameters share one copy.
+
+        Parameters:
+            shared_dir (str): Directory of the shared keyword files.
+
+        Returns:
+            str: The directory of the keyword files of this model.
+        """
+        files = self._deck_files()
+        digest = hashlib.sha256()
+        for file_name, block in files.items():
+            digest.update(file_name.encode() + b'\0' + block + b'\0')
+        include_dir = os.path.join(shared_dir, digest.hexdigest()[:16])
+        if not os.path.isdir(include_dir):
+            # written into a temporary directory renamed at once, so that concurrent writers never see partial files
+            os.makedirs(shared_dir, exist_ok=True)
+            temporary_dir = tempfile.mkdtemp(dir=shared_dir)
+            for file_name, block in files.items():
+                _write_bytes(os.path.join(temporary_dir, file_name), block)
+            try:
+                os.rename(temporary_dir, include_dir)
+            except OSError:
+                # written meanwhile by another deck
+                shutil.rmtree(temporary_dir)
+        return include_dir
+
+    def _render_combine(self):
         """
         Combines file together. combine is ready to be run via LS_Dyna
         """
-        adr = os.path.join(os.getcwd(),'combine.k') 
-        inf = open(adr, 'w')
-        inf.write('*KEYWORD\n')
-        inf.writelines('*INCLUDE\n')
-        inf.writelines('mesh.k\n')
-        inf.writelines('material.k\n')
-        inf.writelines('bc_wall.k\n')  
-        inf.writelines('dcc.k\n')
-        # inf.writelines('nodal_force_top.k\n')
-        # inf.writelines('nodal_force_bottom.k\n')
-        inf.write('*END')   
-        inf.close()
+        block = []
+        block.append('*KEYWORD\n')
+        block.append('*INCLUDE\n')
+        block.append('mesh.k\n')
+        block.append('material.k\n')
+        block.append('bc_wall.k\n')  
+        block.append('dcc.k\n')
+        # block.append('nodal_force_top.k\n')
+        # block.append('nodal_force_bottom.k\n')
+        block.append('*END')   
+        return ''.join(block)
 
 class CrashTubeModel(StarBoxModel):
-    def __init__(self, mesh: CrashTubeMesh, **kwargs) -> None:
-        self.mesh = mesh
-        mesh.write_mesh_file()
-        # mesh.units =  '  kg  mm  ms  kN  GPa  kN-mm'
-        self.units = mesh.units
-        # Define default parameters for load_impactor
-        self.impactor_defaults = {
-            'wall_n_id': 999999,
-            'wall_loc': self.mesh.extrusion_length+1,
-            'wall_mass': 300.0,
-            'wall_vel': 8.33,
-        }
-        
-        # Define default parameters for load_database
-        self.database_defaults = {
-            'end_time': 50.0,
-            'database_dtime': 0.05,
-            'consider_d3plot': True, # cons_d3plot
-            'd3plot_dtime': 0.5, # d3plot_dtime
-            'cons_d3thdt' : False,
-            'd3thdt_dtime': 10000, # d3thdt_dt
-            'shell_warping': 1,
-            'binary_ascii': 2,
-            'write_cshell':True,
-            'tdel': 0.0
-            # Add other default parameters here
-        }
-        
-        self.shell_warping = 1    # BWC, lsdyna default is 2. if there is warping set it to 1
-        self.binary_ascii = 2  # 1: only ascii   2: only binary   3: both ascii and binary
-        self.write_cshell = True   
-        self.tdel = 0.0
+    # Define default parameters for load_impactor, 'wall_loc' is added when the model is initialized.
+    impactor_defaults = {
+        'wall_n_id': 999999,
+        'wall_mass': 300.0,
+        'wall_vel': 8.33,
+    }
 
-        self.intout = 'STRESS'
-        self.nodout = 'STRESS' 
+    # Define default parameters for load_database
+    database_defaults = dict(StarBoxModel.database_defaults, end_time=50.0)
 
-        self.intp_db = 3
-        self.sigflg = 1
-        self.epsflg = 1
-        self.rltflg = 1
+class ThreePointBendingModel():
+    '''
+    Three point bending model: the base starter deck lib/ThreePointBending_base.rad, whose reinforcement parts
+    t1 to t5 (/PART/8 to /PART/12) use the shell properties 5 to 9. The properties are not in the base deck,
+    they are cloned from the tube property /PROP/SHELL/4 with the thickness of the design.
 
-        # Define default parameters for load_material
-        self.material_defaults = {
-            'mat_id': 999,
-            'mat_density': 7.83E-6,
-            'mat_young_mod': 200.0,
-            'mat_poisson_r': 0.3,
-            'mat_yield_initial': 0.366,
-            'mat_tang_mod': 0.0,
-            'mat_failure_pstrain': 1.0E+21,
-            'mat_cowper_symond_c': 40.0,
-            'mat_cowper_symond_p': 5.0,
-            'mat_vp_rate_efffect': 1,
-            'mat_load_curve_id': 1,
-            'mat_effective_plastic_strain_stress': np.array([[0., 0.366], [2.5e-2, 0.4240],
-                                                             [4.9e-2, 0.476], [7.2e-2, 0.507],
-                                                             [9.5e-2, 0.529], [0.118, 0.546],
-                                                             [0.140, 0.559], [0.182, 0.584]]),
-            # Add other default parameters here
-        }
+    The byte offsets of /PROP/SHELL/4 in the memory-mapped base deck are looked up in its DeckIndex once per
+    process. A deck is written by copying the base deck around the insertion point and splicing in the cloned
+    cards, whose only change is the fixed-width thickness field.
+    '''
+    base_deck_path = os.path.join(os.path.dirname(__file__), 'lib', 'ThreePointBending_base.rad')
+    engine_file_path = os.path.join(os.path.dirname(__file__), 'lib', 'ThreePointBending_0001.rad')
+    starter_file_name = 'ThreePointBending_0000.rad'
 
-        self._load_impactor(**kwargs)
-        self._load_database(**kwargs)
-        self._load_material(**kwargs)
+    # property ids of the parts t1 to t5, and the property they are cloned from
+    reinforcement_prop_ids = [5, 6, 7, 8, 9]
+    template_prop_id = 4
+    # thickness of the reinforcements which don't vary, the middle of the range of the thickness (0.5, 3)
+    default_thickness = 1.75
 
-        # ------- nodal forces
-        self.write_nod_force_top = False
-        self.write_nod_force_bottom = True
\ No newline at end of file
+    # Index of the base deck, see _base_deck, and the engine file of the 'objective' output profile
+    _base = None
+    _objective_engine = None
+    _base_lock = threading.Lock()
+
+    def __init__(self, variable_array, output_profile='full') -> None:
+        self.variable_array = variable_array
+        # output profile, see OUTPUT_PROFILES: the 'objective' profile writes the engine file without the
+        # animation outputs (/ANIM), the time history is unchanged
+        if output_profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Invalid output_profile '{output_profile}', the options are {OUTPUT_PROFILES}")
+        self.output_profile = output_profile
+        self.dimension = len(variable_array)
+        self.thicknesses = self._determine_thicknesses()
+
+    def _determine_thicknesses(self):
+        '''
+        1 -> all 5 shell thickness vary with same value.
+        2 -> only first and the last shell thickness vary, other fixed with middle value.
+        3 -> the first, middle, and last shell thickness vary.
+        4 -> expect for middle shell, the other 4 shell thickness vary.
+        5 -> all shell thickness vary.
+        '''
+        t = self.default_thickness
+        if self.dimension == 1:
+            thicknesses = [self.variable_array[0]]*5
+        elif self.dimension == 2:
+            thicknesses = [self.variable_array[0], t, t, t, self.variable_array[1]]
+        elif self.dimension == 3:
+            thicknesses = [self.variable_array[0], t, self.variable_array[1], t, self.variable_array[2]]
+        elif self.dimension == 4:
+            thicknesses = [self.variable_array[0], self.variable_array[1], t, self.variable_array[2], self.variable_array[3]]
+        elif self.dimension == 5:
+            thicknesses = list(self.variable_array)
+        else:
+            raise ValueError(f'Invalid dimension {self.dimension} of the three point bending model')
+        return [float(thickness) for thickness in thicknesses]
+
+    @classmethod
+    def _base_deck(cls):
+        """
+        Index the base deck and the card of the template property, once per process.
+
+        Returns:
+            dict: 'data' (the memory-mapped deck), 'insert_at' (offset after the template card, where the cloned
+            cards are spliced in), 'card' (the template card without its keyword line, split around the thickness
+            field) and 'has_end' (whether the deck ends with /END).
+        """
+        with cls._base_lock:
+            if cls._base is None:
+                # package data: the index isn't persisted next to the installed deck, it is built once per process
+                index = DeckIndex(cls.base_deck_path, persist=False)
+                keyword = f'/PROP/SHELL/{cls.template_prop_id}'
+                if not index.blocks(keyword):
+                    raise ValueError(f'{keyword} not found in {cls.base_deck_path}')
+                start, _ = index.blocks(keyword)[0]
+                thick_start, thick_end = index.prop_shell(cls.template_prop_id)['thickness_field']
+                # the card ends with the line of the thickness
+                insert_at = index.data_lines(keyword)[3][1] + 1
+                data = index.buffer
+                cls._base = {
+                    'data': data,
+                    'insert_at': insert_at,
+                    'card': (bytes(data[start+len(keyword)+1:thick_start]), bytes(data[thick_end:insert_at])),
+                    'has_end': bool(index.blocks('/END')),
+                }
+            return cls._base
+
+    @classmethod
+    def _engine_without_animations(cls):
+        # bytes of the engine file without the /ANIM blocks, once per process
+        with cls._base_lock:
+            if cls._objective_engine is None:
+                with DeckIndex(cls.engine_file_path, persist=False) as index:
+                    data = index.buffer
+                    kept = [bytes(data[start:end]) for keyword, start, end
+                            in zip(index.keywords, index.starts.tolist(), index.ends.tolist())
+                            if not keyword.startswith('/ANIM')]
+                    cls._objective_engine = bytes(data[:int(index.starts[0])]) + b''.join(kept)
+                    del data
+            return cls._objective_engine
+
+    def _property_cards(self, base):
+        before, after = base['card']
+        cards = []
+        for prop_id, thickness in zip(self.reinforcement_prop_ids, self.thicknesses):
+            # fixed-width field of 20 characters
+            cards.append(b'/PROP/SHELL/%d\n' % prop_id + before + b'%20.6f' % thickness + after)
+        return b''.join(cards)
+
+    def write_input_files(self, output_dir='.'):
+        """
+        Writes the starter deck of the design and the engine file into output_dir (default: the current working directory).
+        """
+        base = self._base_deck()
+        data = base['data']
+        with open(os.path.join(output_dir, self.starter_file_name), 'wb') as f:
+            f.write(data[:base['insert_at']])
+            f.write(self._property_cards(base))
+            f.write(data[base['insert_at']:])
+            if not base['has_end']:
+                f.write(b'/END\n')
+        engine_file_path = os.path.join(output_dir, os.path.basename(self.engine_file_path))
+        if self.output_profile == 'full':
+            _link_or_copy(self.engine_file_path, engine_file_path)
+        else:
+            _write_bytes(engine_file_path, self._engine_without_animations())
@@ -0,0 +1,110 @@
+"""
+Loader of the time history (T01) written by OpenRadioss and converted to CSV by the batch script.
+
+The CSV is parsed once: only the requested columns, with the fastest available pandas engine, and the parsed
+columns are kept in a sidecar next to it (<csv>.npz, the same layout as the histories of the EvaluationCache).
+The sidecar is used as long as the CSV has the same size and modification time.
+"""
+
+import os
+import csv
+import tempfile
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401, multithreaded CSV parser of pandas
+    DEFAULT_ENGINE = 'pyarrow'
+except ImportError:
+    DEFAULT_ENGINE = 'c'
+
+SIDECAR_SUFFIX = '.npz'
+
+def _clean(name):
+    # the column names are used without spaces, e.g. 'DATABASE_HISTORY_NODE1001 Z' -> 'DATABASE_HISTORY_NODE1001Z'
+    return name.replace(' ', '')
+
+def read_header(path):
+    """
+    Read the column names of a time history without parsing the values.
+
+    Returns:
+        list: The column names, with spaces removed.
+    """
+    return [_clean(name) for name in _raw_header(path)]
+
+def _raw_header(path):
+    with open(path, newline='') as f:
+        return next(csv.reader(f))
+
+def _signature(path):
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+def _load_sidecar(path):
+    # columns of the sidecar of an unchanged CSV, None otherwise
+    try:
+        with np.load(path + SIDECAR_SUFFIX) as data:
+            if not np.array_equal(data['signature'], _signature(path)):
+                return None
+            return dict(zip(data['columns'].tolist(), data['values'].T))
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _save_sidecar(path, columns):
+    # written to a temporary file and renamed, the sidecar may be read by another process meanwhile
+    names = list(columns)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=SIDECAR_SUFFIX)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, signature=_signature(path), columns=np.array(names, dtype=str),
+                     values=np.column_stack([columns[name] for name in names]))
+        os.replace(tmp_path, path + SIDECAR_SUFFIX)
+    except OSError:
+        pass
+
+def load_time_history(path, usecols=None, dtype=np.float64, engine=None, sidecar=True):
+    """
+    Load a time history CSV into a DataFrame whose column names have no spaces.
+
+    Parameters:
+        path (str): Path of the CSV file, e.g. combineT01.csv.
+        usecols (list or callable): Names of the columns to load (without spaces), or a function which selects
+            a column from its name. Default: all the columns.
+        dtype: Type of the values, np.float32 halves the memory of long histories. Default: np.float64.
+        engine (str): Parser engine of pandas.read_csv. Default: 'pyarrow' if installed, 'c' otherwise.
+        sidecar (bool): Use and update the parsed columns kept in <path>.npz.
+
+    Returns:
+        pandas.DataFrame: The time history.
+    """
+    header = read_header(path)
+    if usecols is None:
+        names = header
+    elif callable(usecols):
+        names = [name for name in header if usecols(name)]
+    else:
+        names = list(usecols)
+        missing = set(names) - set(header)
+        if missing:
+            raise KeyError(f'Columns {sorted(missing)} not found in {path}')
+
+    parsed = (_load_sidecar(path) if sidecar else None) or {}
+    parsed = {name: values for name, values in parsed.items() if values.dtype == dtype}
+    to_parse = [name for name in names if name not in parsed]
+    if to_parse:
+        raw_of = dict(zip(header, _raw_header(path)))
+        frame = pd.read_csv(path, usecols=[raw_of[name] for name in to_parse], dtype=dtype,
+                            engine=engine or DEFAULT_ENGINE)
+        for raw_name in frame.columns:
+            parsed[_clean(raw_name)] = frame[raw_name].to_numpy()
+        if sidecar:
+            _save_sidecar(path, parsed)
+    return pd.DataFrame({name: parsed[name] for name in names}, columns=names)
+
+def peak_abs(values):
+    """
+    Returns:
+        float: The largest absolute value, e.g. the intrusion from the displacement of the tracked node.
+    """
+    return float(np.abs(np.asarray(values)).max())
@@ -0,0 +1,139 @@
+"""
+Append-only journal of the evaluations of a campaign, to restart it after a crash without running again the
+designs already evaluated.
+
+The journal is a JSON lines file with one record per event of an evaluation, each written and fsync'd at once:
+- 'start': the deck of the design has been generated, with the design variables (search space and FEM space),
+  the directory and the run id of the deck, or the design has been submitted to a broker, with the id of its job.
+- 'finish': the design is evaluated, with the status of the run ('ok', 'stopped', 'failed', 'error'), the
+  objective (a list for a list of output data, None if the evaluation raised), the runtime, the directory and
+  the run id of the deck.
+
+A design is identified by the key of the EvaluationCache (see cache.evaluation_key). When the journal is opened
+again, the finished designs with an objective are skipped, and the designs started but never finished are
+in flight: OptiProblem reattaches them if their job has written its time history meanwhile, waits again for
+their job on the broker, and runs them again otherwise. A truncated last line (the process died while writing it) is ignored.
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from .cache import evaluation_key
+
+class EvaluationJournal():
+    '''
+    Append-only journal of evaluations, see the module docstring.
+
+    Parameters:
+        path (str): Path of the journal file, created if it doesn't exist.
+        decimals (int): Decimals of the design variables in the keys, see cache.evaluation_key.
+    '''
+    def __init__(self, path='sob_journal.jsonl', decimals=6) -> None:
+        self.path = path
+        self.decimals = decimals
+
+        # key -> last 'finish' record, and key -> 'start' record of the designs not finished
+        self._finished = {}
+        self._started = {}
+        self._load()
+        # the designs in flight when the journal was opened, started by a previous session
+        self._previous = dict(self._started)
+
+        # the file is shared by the threads of a batch evaluation
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            # complete the truncated last line, the next record starts on its own line
+            self._file.write('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        return len(self._finished)
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        if record.get('event') == 'start':
+            self._started[record['key']] = record
+        elif record.get('event') == 'finish':
+            self._started.pop(record['key'], None)
+            self._finished[record['key']] = record
+
+    def _append(self, record):
+        line = json.dumps(record, default=lambda value: np.asarray(value).tolist())
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._apply(record)
+
+    def key(self, problem, fem_space_variable_array):
+        return evaluation_key(problem, fem_space_variable_array, self.decimals)
+
+    def completed(self, key):
+        """
+        Returns:
+            dict: The 'finish' record of the design if it has been evaluated, None otherwise.
+        """
+        record = self._finished.get(key)
+        if record is None or record.get('objective') is None:
+            return None
+        return record
+
+    def in_flight(self, key=None):
+        """
+        Returns:
+            dict: The 'start' record of the design if a previous session started it and nobody finished it since,
+            None otherwise. Without key, the list of the 'start' records of all these designs.
+        """
+        if key is None:
+            return [record for key, record in self._previous.items() if self._started.get(key) is record]
+        record = self._previous.get(key)
+        if record is None or self._started.get(key) is not record:
+            return None
+        return record
+
+    def start(self, key, variable_array, fem_space_variable_array, working_dir=None, run_id=None, job_id=None):
+        self._append({'event': 'start', 'key': key, 'time': time.time(),
+                      'variables': np.asarray(variable_array, dtype=float).tolist(),
+                      'fem_variables': np.asarray(fem_space_variable_array, dtype=float).tolist(),
+                      'working_dir': working_dir, 'run_id': run_id, 'job_id': job_id})
+
+    def finish(self, key, status, objective=None, runtime=None, working_dir=None, message=''):
+        # the directory and run id of the deck recorded when the design was started
+        started = self._started.get(key, {})
+        self._append({'event': 'finish', 'key': key, 'time': time.time(), 'status': status,
+                      'objective': None if objective is None else np.asarray(objective, dtype=float).tolist(),
+                      'runtime': runtime, 'working_dir': working_dir or started.get('working_dir'),
+                      'run_id': started.get('run_id'), 'message': message})
+
+    def records(self):
+        """
+        Returns:
+            list: The last 'finish' record of each finished design.
+        """
+        return list(self._finished.values())
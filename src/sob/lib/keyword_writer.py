@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming writer of the mesh.k keyword file of py_mesh and py_mesh_v2.
+
+The *NODE and *ELEMENT_SHELL blocks are formatted in bulk, chunk by chunk, with one printf-style
+format string per chunk, and written directly to the file. The output is identical to the line by
+line formatting the meshers used before.
+"""
+import numpy as np
+
+# number of lines formatted at once
+CHUNK_LINES = 100000
+
+def _write_id_list(fo, keyword, sid, field, ids):
+    # *SET_PART_LIST / *SET_NODE_LIST: the ids 8 per line
+    fo.write('{0:}\n'.format(keyword))
+    fo.write('${0:->9}\n'.format('sid'))
+    fo.write('{0:>10}\n'.format(sid))
+    fo.write('${0:->9}{1:->10}{2:->10}{3:->10}'.format(field+'1', field+'2', field+'3', field+'4'))
+    fo.write('{0:->10}{1:->10}{2:->10}{3:->10}\n'.format(field+'5', field+'6', field+'7', field+'8'))
+    ids = [int(i) for i in ids]
+    full_lines = len(ids) // 8
+    fo.write(('%10d'*8 + '\n')*full_lines % tuple(ids[:full_lines*8]))
+    if len(ids) > full_lines*8:
+        fo.write('%10d'*(len(ids) - full_lines*8) % tuple(ids[full_lines*8:]) + '\n')
+
+def _write_parts(fo, cells, mid, elform, shrf, nip):
+    for pid in sorted(cells.keys()):
+        secid = pid
+        thickness = cells[pid]['thickness']
+
+        fo.write('*PART\n')
+        fo.write('Part_{0:}\n'.format(pid))
+        fo.write('${0:->9}{1:->10}{2:->10}\n'.format('pid', 'secid', 'mid'))
+        fo.write('{0:>10}{1:>10}{2:>10}\n'.format(pid, secid, mid))
+
+        fo.write('*SECTION_SHELL\n')
+        fo.write('${0:->9}{1:->10}{2:->10}{3:->10}\n'.format('secid', 'elform', 'shrf', 'nip'))
+        fo.write('{0:>10}{1:>10}{2:>10}{3:>10}\n'.format(secid, elform, shrf, nip))
+
+        fo.write('${0:->9}{1:->10}{2:->10}{3:->10}\n'.format('t1', 't2', 't3', 't4'))
+        fo.write('{0:>10}{0:>10}{0:>10}{0:>10}\n'.format(thickness))
+
+def write_element_shell(fo, element_ids, shells):
+    """
+    Write the *ELEMENT_SHELL block.
+
+    Parameters:
+        fo (file): Text file open for writing.
+        element_ids (array-like): Ids of the elements, shape (M,).
+        shells (array-like): [pid, n1, n2, n3, n4] of the elements, shape (M,5).
+    """
+    fo.write('*ELEMENT_SHELL\n')
+    fo.write('${0:->7}{1:->8}'.format('eid', 'pid'))
+    fo.write('{0:->8}{1:->8}{2:->8}{3:->8}\n'.format('n1', 'n2', 'n3', 'n4'))
+    rows = np.column_stack((element_ids, shells)).astype(np.int64)
+    for start in range(0, len(rows), CHUNK_LINES):
+        chunk = rows[start:start+CHUNK_LINES]
+        fo.write('%8d%8d%8d%8d%8d%8d\n'*len(chunk) % tuple(chunk.ravel().tolist()))
+
+def write_node(fo, node_ids, coordinates):
+    """
+    Write the *NODE block.
+
+    Parameters:
+        fo (file): Text file open for writing.
+        node_ids (array-like): Ids of the nodes, shape (N,).
+        coordinates (array-like): x, y, z of the nodes, shape (N,3).
+    """
+    fo.write('*NODE\n')
+    fo.write('${0:->7}{1:->16}{2:->16}{3:->16}\n'.format('nid', 'x', 'y', 'z'))
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    coordinates = np.asarray(coordinates, dtype=float)
+    for start in range(0, len(node_ids), CHUNK_LINES):
+        ids = node_ids[start:start+CHUNK_LINES].tolist()
+        xyz = coordinates[start:start+CHUNK_LINES].tolist()
+        fo.write('%8d%16.7f%16.7f%16.7f\n'*len(ids) % tuple(value for i, (x, y, z) in zip(ids, xyz) for value in (i, x, y, z)))
+
+def write_mesh(path, mesh):
+    """
+    Write the mesh.k keyword file: part set, node sets, parts and sections, shells and nodes.
+
+    Parameters:
+        path (str): Path of the keyword file.
+        mesh (dict): The mesh, as returned by generate_mesh of py_mesh or py_mesh_v2.
+    """
+    cells = mesh['cells']
+    with open(path, 'w') as fo:
+        fo.write('*KEYWORD\n')
+        # Part sets
+        _write_id_list(fo, '*SET_PART_LIST', 101, 'pid', sorted(cells.keys()))
+        # Node sets
+        for sid in mesh['set_nodes']:
+            _write_id_list(fo, '*SET_NODE_LIST', sid, 'nid', np.unique(mesh['set_nodes'][sid]))
+        # Parts
+        _write_parts(fo, cells, mesh['mid'], mesh['elform'], mesh['shrf'], mesh['nip'])
+        # Elements
+        write_element_shell(fo, mesh['element_ids'], mesh['shells'])
+        # Nodes
+        write_node(fo, mesh['node_ids'], mesh['coordinates'])
+        fo.write('*END\n')
@@ -8,18 +8,27 @@ Created on October 2016
 Modified by K.Komeilizadeh
 """
 from __future__ import print_function #  K.Komeilizadeh
+import os
 import sys
 import numpy as np
-
-def py_mesh(var_file, save=True):
-
+try:
+    from .keyword_writer import write_mesh
+except ImportError: # run as a script
+    from keyword_writer import write_mesh
+
+def read_py_mesh_input(var_file):
+    '''
+    Parse a py_mesh.input file.
+
+    Returns:
+        tuple: (variables, grids, cells), the input of generate_mesh.
+    '''
     # Reading variables
     # reads var_file line by line and processes its contents. 
     variables = {} # variables dictionary
     grids = {}
     cells = {}
 
-    make_triggers = False
     multiple_triggers = False
     with open(var_file) as fi:
         for line in fi:
@@ -42,9 +51,11 @@ def py_mesh(var_file, save=True):
             if 'id_min' == tmp[0]:
                 variables['id_min'] = int(tmp[1])
 
+            if 'num_elements_line' == tmp[0]:
+                variables['num_elements_line'] = int(tmp[1])
+
             if 'trigger_depth' == tmp[0]:
                 variables['trigger_depth'] = float(tmp[1])
-                make_triggers = True # ??
             
 
             if 'trigger_rows' == tmp[0]:
@@ -102,6 +113,24 @@ def py_mesh(var_file, save=True):
                     sys.exit(1)
     #print
     # ---- read file finished, all data is stored in "variables", "grids", and "cells"
+    return variables, grids, cells
+
+def generate_mesh(variables, grids, cells):
+    '''
+    Mesh the extruded cross section, without any file access.
+
+    Parameters:
+        variables (dict): Meshing, trigger, material and section parameters, keyed as in py_mesh.input.
+        grids (dict): Vertices of the cross section, {gid: [x, y]}.
+        cells (dict): Edges of the cross section, {cid: {'line': [g0, g1], 'thickness': t}}.
+
+    Returns:
+        dict: The mesh. 'node_ids' (N,) and 'coordinates' (N,3) of the nodes sorted by id, 'element_ids' (M,)
+        and 'shells' (M,5) [pid, n1, n2, n3, n4] of the elements, the node sets 'set_nodes', the nodes at
+        the top and bottom of each part, and 'cells', 'mid', 'elform', 'shrf', 'nip' of the parts.
+    '''
+
+    make_triggers = 'trigger_depth' in variables
 
     # Meshing parameters
     elsize = variables['elsize']
@@ -144,6 +173,8 @@ def py_mesh(var_file, save=True):
     set_nodes = {}
     set_nodes[101] = []
     set_nodes[102] = []
+    # membership of the node sets, set_nodes keeps the order in which the nodes are added
+    set_nodes_seen = {101: set(), 102: set()}
     
     # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! added K.Komeilizadeh
     nodes_of_parts_at_top = {}  # set of nodes at top that belongs to each part
@@ -187,9 +218,9 @@ def py_mesh(var_file, save=True):
 
         '''
         Define the number of elements along the line (num_elements_line) 
-        Calculate the element size (elsize_line) along the line based on the specified value of 12.
+        Calculate the element size (elsize_line) along the line based on the specified value (default 12).
         '''
-        num_elements_line = 12
+        num_elements_line = variables.get('num_elements_line', 12)
         elsize_line = length/num_elements_line
         '''
         Modified, the element size along the line adapts to the line length
@@ -274,7 +305,8 @@ def py_mesh(var_file, save=True):
         #         database_nodes.append(n)
 
         for n in nodes_ids[0,:]:
-            if n not in set_nodes[101]:
+            if n not in set_nodes_seen[101]:
+                set_nodes_seen[101].add(n)
                 set_nodes[101].append(n)
                 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! added by K.Komeilizadeh 
                 nodes_of_parts_at_bottom[pid].append(n)
@@ -282,7 +314,8 @@ def py_mesh(var_file, save=True):
                 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!   [pid]=[] 
                 
         for n in nodes_ids[-1,:]:
-            if n not in set_nodes[102]:
+            if n not in set_nodes_seen[102]:
+                set_nodes_seen[102].add(n)
                 set_nodes[102].append(n)
                 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! added by K.Komeilizadeh
                 nodes_of_parts_at_top[pid].append(n) 
@@ -323,126 +356,32 @@ def py_mesh(var_file, save=True):
                 shells[eid] = [pid, n1, n2, n3, n4]
                 eid += 1
 
-    # Write mesh
-    l = ''
-
-    l += '*KEYWORD\n'
-
-    # # Database nodes
-    # l += '*DATABASE_HISTORY_NODE\n'
-    # l += '${0:->9}{1:->10}{2:->10}{3:->10}'.format('nid1',
-    #                                                'nid2',
-    #                                                'nid3',
-    #                                                'nid4')
-    # l += '{0:->10}{1:->10}{2:->10}{3:->10}\n'.format('nid5',
-    #                                                  'nid6',
-    #                                                  'nid7',
-    #                                                  'nid8')
-    # database_nodes.sort()
-    # for i in range(0, len(database_nodes), 8):
-    #     chunk = database_nodes[i:i+8]
-    #     for n in chunk:
-    #         l += '{0:>10}'.format(n)
-    #     l += '\n'
-
-    # Part sets
-    l += '*SET_PART_LIST\n'
-    l += '${0:->9}\n'.format('sid')
-    l += '{0:>10}\n'.format(101)
-    l += '${0:->9}{1:->10}{2:->10}{3:->10}'.format('pid1',
-                                                   'pid2',
-                                                   'pid3',
-                                                   'pid4')
-    l += '{0:->10}{1:->10}{2:->10}{3:->10}\n'.format('pid5',
-                                                     'pid6',
-                                                     'pid7',
-                                                     'pid8')
-    set_pids = sorted(cells.keys())
-    for i in range(0, len(set_pids), 8):
-        chunk = set_pids[i:i+8]
-        for p in chunk:
-            l += '{0:>10}'.format(p)
-        l += '\n'
-
-    # Node sets
-    for sid in set_nodes:
-        l += '*SET_NODE_LIST\n'
-        l += '${0:->9}\n'.format('sid')
-        l += '{0:>10}\n'.format(sid)
-        l += '${0:->9}{1:->10}{2:->10}{3:->10}'.format('nid1',
-                                                       'nid2',
-                                                       'nid3',
-                                                       'nid4')
-        l += '{0:->10}{1:->10}{2:->10}{3:->10}\n'.format('nid5',
-                                                         'nid6',
-                                                         'nid7',
-                                                         'nid8')
-        set_nodes[sid].sort()
-        for i in range(0, len(set_nodes[sid]), 8):
-            chunk = set_nodes[sid][i:i+8]
-            for n in chunk:
-                l += '{0:>10}'.format(n)
-            l += '\n'
-
-    # Parts
-    for pid in sorted(cells.keys()):
-        secid = pid
-        thickness = cells[pid]['thickness']
-
-        l += '*PART\n'
-        l += 'Part_{0:}\n'.format(pid)
-        l += '${0:->9}{1:->10}{2:->10}\n'.format('pid', 'secid', 'mid')
-        l += '{0:>10}{1:>10}{2:>10}\n'.format(pid, secid, mid)
-
-        l += '*SECTION_SHELL\n'
-        l += '${0:->9}{1:->10}{2:->10}{3:->10}\n'.format('secid',
-                                                         'elform',
-                                                         'shrf',
-                                                         'nip')
-        l += '{0:>10}{1:>10}{2:>10}{3:>10}\n'.format(secid, elform, shrf, nip)
-
-        l += '${0:->9}{1:->10}{2:->10}{3:->10}\n'.format('t1', 't2', 't3', 't4')
-        l += '{0:>10}{0:>10}{0:>10}{0:>10}\n'.format(thickness)
-
-    # Elements
-    l += '*ELEMENT_SHELL\n'
-    l += '${0:->7}{1:->8}'.format('eid', 'pid')
-    l += '{0:->8}{1:->8}{2:->8}{3:->8}\n'.format('n1', 'n2', 'n3', 'n4')
-
-    for s in sorted(shells.keys()):
-        eid = s
-        pid = shells[s][0]
-        n1 = shells[s][1]
-        n2 = shells[s][2]
-        n3 = shells[s][3]
-        n4 = shells[s][4]
-        l += '{0:>8}{1:>8}'.format(eid, pid)
-        l += '{0:>8}{1:>8}{2:>8}{3:>8}\n'.format(n1, n2, n3, n4)
-
-    # Nodes
-    l += '*NODE\n'
-    l += '${0:->7}{1:->16}{2:->16}{3:->16}\n'.format('nid', 'x', 'y', 'z')
-    for n in sorted(nodes.keys()):
-        nid = n
-        x = nodes[n][0]
-        y = nodes[n][1]
-        z = nodes[n][2]
-        l += '{0:>8}{1:16.7f}{2:16.7f}{3:16.7f}\n'.format(nid, x, y, z)
-		
-	# added !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+    element_ids = np.array(sorted(shells.keys()), dtype=int)
+    node_ids = np.array(sorted(nodes.keys()), dtype=int)
+    mesh = {'node_ids': node_ids, 'coordinates': np.array([nodes[nid] for nid in node_ids]),
+            'element_ids': element_ids, 'shells': np.array([shells[eid] for eid in element_ids], dtype=int)}
+    mesh.update({'set_nodes': set_nodes,
+                 'nodes_of_parts_at_top': nodes_of_parts_at_top,
+                 'nodes_of_parts_at_bottom': nodes_of_parts_at_bottom,
+                 'nodes_of_parts_at_top_coordinate': nodes_of_parts_at_top_coordinate,
+                 'nodes_of_parts_at_bottom_coordinate': nodes_of_parts_at_bottom_coordinate,
+                 'cells': cells, 'mid': mid, 'elform': elform, 'shrf': shrf, 'nip': nip})
+    return mesh
 
-    #       !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!	
-    
-    l +='*END\n'
+def py_mesh(var_file, save=True, output_dir='.'):
+    variables, grids, cells = read_py_mesh_input(var_file)
+    mesh = generate_mesh(variables, grids, cells)
 
+    # Write mesh
     if save:
-        with open('mesh.k', 'w') as fo:
-            fo.write(l)
+        # written into output_dir rather than the current working directory, so that
+        # several meshes can be generated concurrently
+        write_mesh(os.path.join(output_dir, 'mesh.k'), mesh)
 
     #return l
     # !!!!!!!!!!!!!!!!!!!!!!!!!!!!! added by K.Komeilizadeh
-    return nodes_of_parts_at_top, nodes_of_parts_at_bottom,\
-           nodes_of_parts_at_top_coordinate, nodes_of_parts_at_bottom_coordinate
+    return mesh['nodes_of_parts_at_top'], mesh['nodes_of_parts_at_bottom'],\
+           mesh['nodes_of_parts_at_top_coordinate'], mesh['nodes_of_parts_at_bottom_coordinate']
     # !!!!!!!!!!!!!!!!!!!!!!!
 
 def main():
@@ -10,18 +10,27 @@ Modified by K.Komeilizadeh
 Modified by Feifan Li
 """
 from __future__ import print_function #  K.Komeilizadeh
+import os
 import sys
 import numpy as np
-
-def py_mesh_v2(var_file, save=True):
-
+try:
+    from .keyword_writer import write_mesh
+except ImportError: # run as a script
+    from keyword_writer import write_mesh
+
+def read_py_mesh_input(var_file):
+    '''
+    Parse a py_mesh.input file.
+
+    Returns:
+        tuple: (variables, grids, cells), the input of generate_mesh.
+    '''
     # Reading variables
     # reads var_file line by line and processes its contents. 
     variables = {} # variables dictionary
     grids = {}
     cells = {}
 
-    make_triggers = False
     with open(var_file) as fi:
         for line in fi:
 
@@ -42,10 +51,12 @@ def py_mesh_v2(var_file, save=True):
 
             if 'id_min' == tmp[0]:
                 variables['id_min'] = int(tmp[1])
+
+            if 'num_elements_line' == tmp[0]:
+                variables['num_elements_line'] = int(tmp[1])
             # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! newer added, Li
             if 'trigger_positions' == tmp[0]:
                 variables['trigger_positions'] = np.array(list(map(float, tmp[1:4])))
-                make_triggers = True 
             if 'trigger_depths' == tmp[0]:
                 variables['trigger_depths'] = np.array(list(map(float, tmp[1:4])))
             # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
@@ -104,6 +115,24 @@ def py_mesh_v2(var_file, save=True):
                     sys.exit(1)
     #print
     # ---- read file finished, all data is stored in "variables", "grids", and "cells"
+    return variables, grids, cells
+
+def generate_mesh(variables, grids, cells):
+    '''
+    Mesh the extruded cross section, without any file access.
+
+    Parameters:
+        variables (dict): Meshing, trigger, material and section parameters, keyed as in py_mesh.input.
+        grids (dict): Vertices of the cross section, {gid: [x, y]}.
+        cells (dict): Edges of the cross section, {cid: {'line': [g0, g1], 'thickness': t}}.
+
+    Returns:
+        dict: The mesh. 'node_ids' (N,) and 'coordinates' (N,3) of the nodes sorted by id, 'element_ids' (M,)
+        and 'shells' (M,5) [pid, n1, n2, n3, n4] of the elements, the node sets 'set_nodes', the nodes at
+        the top and bottom of each part, and 'cells', 'mid', 'elform', 'shrf', 'nip' of the parts.
+    '''
+
+    make_triggers = 'trigger_positions' in variables
 
     # Meshing parameters
     elsize = variables['elsize']
@@ -136,15 +165,19 @@ def py_mesh_v2(var_file, save=True):
         nip = 5
 
     # Mesh generation
-
-    nodes = {}
-    shells = {}
+    # The nodes are generated as one (N,3) array of coordinates with the matching array of ids, and the
+    # shells as one (M,5) array of [pid, n1, n2, n3, n4], the element ids being id_min, id_min+1, ...
+    node_id_blocks = []
+    node_coordinate_blocks = []
+    shell_blocks = []
 
     common_nodes = {}
 
     set_nodes = {}
     set_nodes[101] = []
     set_nodes[102] = []
+    # membership of the node sets, set_nodes keeps the order in which the nodes are added
+    set_nodes_seen = {101: set(), 102: set()}
     
     # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! added K.Komeilizadeh
     nodes_of_parts_at_top = {}  # set of nodes at top that belongs to each part
@@ -155,7 +188,7 @@ def py_mesh_v2(var_file, save=True):
         nodes_of_parts_at_top[pid]=[]  
         nodes_of_parts_at_bottom[pid]=[]   
     # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
- 
+
     # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! from newer py_mesh, K.Komeilizadeh
     database_grids = variables['database']
     database_nodes = []
@@ -164,9 +197,15 @@ def py_mesh_v2(var_file, save=True):
         trigger_cells = variables['trigger']
     else:
         trigger_cells = []
+
+    if make_triggers:
+        trigger_distance_default = extrusion_length/4
+        trigger_distance_default_el = int(round(trigger_distance_default/elsize))
+        trigger_depths = variables['trigger_depths']
+        trigger_position_vars = variables['trigger_positions']
+        trigger_position_vars_el = np.round(trigger_position_vars / elsize).astype(int)
 		
     nid = id_min
-    eid = id_min
 
     # "grids"(1001 to 1008) store the ids and coordinates of nodes which define the geometry
     # "cells"(101 to 108): each cell related to two nodes(from 1001 to 1008), and thickness
@@ -188,9 +227,9 @@ def py_mesh_v2(var_file, save=True):
 
         '''
         Define the number of elements along the line (num_elements_line) 
-        Calculate the element size (elsize_line) along the line based on the specified value of 12.
+        Calculate the element size (elsize_line) along the line based on the specified value (default 12).
         '''
-        num_elements_line = 12
+        num_elements_line = variables.get('num_elements_line', 12)
         elsize_line = length/num_elements_line
         '''
         Modified, the element size along the line adapts to the line length
@@ -210,267 +249,108 @@ def py_mesh_v2(var_file, save=True):
         nodes_ids = np.zeros((num_elements_ext+1, num_elements_line+1),
                              dtype=int)
 
-        if grid0 in common_nodes and not grid1 in common_nodes:
-            nodes_ids[:,0] = np.array(common_nodes[grid0])
-            for j in range(num_elements_ext+1):
-                z = j*elsize_ext
-                for i in range(1, num_elements_line+1):
-                    pi = p0 + i*elsize_line*line_dir
-                    grid = np.append(pi, z)
-                    nodes[nid] = grid
-                    nodes_ids[j, i] = nid
-                    nid += 1
-            edge1 = nodes_ids[:,-1]
-            common_nodes[grid1] = edge1
-        elif grid1 in common_nodes and not grid0 in common_nodes:
-            nodes_ids[:,-1] = np.array(common_nodes[grid1])
-            for j in range(num_elements_ext+1):
-                z = j*elsize_ext
-                for i in range(num_elements_line):
-                    pi = p0 + i*elsize_line*line_dir
-                    grid = np.append(pi, z)
-                    nodes[nid] = grid
-                    nodes_ids[j, i] = nid
-                    nid += 1
-            edge0 = nodes_ids[:,0]
-            common_nodes[grid0] = edge0
-        elif grid0 in common_nodes and grid1 in common_nodes:
-            nodes_ids[:,0] = np.array(common_nodes[grid0])
-            nodes_ids[:,-1] = np.array(common_nodes[grid1])
-            for j in range(num_elements_ext+1):
-                z = j*elsize_ext
-                for i in range(1, num_elements_line):
-                    pi = p0 + i*elsize_line*line_dir
-                    grid = np.append(pi, z)
-                    nodes[nid] = grid
-                    nodes_ids[j, i] = nid
-                    nid += 1
-        else:
-            for j in range(num_elements_ext+1):
-                z = j*elsize_ext
-                for i in range(num_elements_line+1):
-                    pi = p0 + i*elsize_line*line_dir
-                    grid = np.append(pi, z)
-                    nodes[nid] = grid
-                    nodes_ids[j, i] = nid
-                    nid += 1
-            edge0 = nodes_ids[:,0]
-            edge1 = nodes_ids[:,-1]
-            common_nodes[grid0] = edge0
-            common_nodes[grid1] = edge1
-
-        nid_replace0 = nodes_ids[-1,  0]
-        nid_replace1 = nodes_ids[-1, -1]
-        nodes[grid0] = nodes.pop(nid_replace0)
-        nodes[grid1] = nodes.pop(nid_replace1)
-        nodes_ids[-1,  0] = grid0
-        nodes_ids[-1, -1] = grid1
-
-        # if grid0 in database_grids:
-        #     n = nodes_ids[-1, 0]
-        #     if n not in database_nodes:
-        #         database_nodes.append(n)
-        # if grid1 in database_grids:
-        #     n = nodes_ids[-1, -1]
-        #     if n not in database_nodes:
-        #         database_nodes.append(n)
-
-        for n in nodes_ids[0,:]:
-            if n not in set_nodes[101]:
+        # the edge of a grid which has already been meshed by a previous cell is shared,
+        # new nodes are only generated for the other columns
+        first_column = 0
+        last_column = num_elements_line
+        if grid0 in common_nodes:
+            nodes_ids[:,0] = common_nodes[grid0]
+            first_column = 1
+        if grid1 in common_nodes:
+            nodes_ids[:,-1] = common_nodes[grid1]
+            last_column = num_elements_line-1
+        i = np.arange(first_column, last_column+1)
+        j = np.arange(num_elements_ext+1)
+
+        # node coordinates of the new columns, broadcast over the rows (j) and columns (i)
+        coordinates = np.empty((len(j), len(i), 3))
+        coordinates[:, :, :2] = p0 + (i*elsize_line)[:, np.newaxis]*line_dir
+        coordinates[:, :, 2] = (j*elsize_ext)[:, np.newaxis]
+        # node ids are numbered row by row
+        ids = (nid + np.arange(coordinates.shape[0]*coordinates.shape[1])).reshape(coordinates.shape[:2])
+        nid += ids.size
+
+        # the nodes at the top of a new edge take the id of the grid
+        if first_column == 0:
+            ids[-1, 0] = grid0
+        if last_column == num_elements_line:
+            ids[-1, -1] = grid1
+        nodes_ids[:, first_column:last_column+1] = ids
+        if grid0 not in common_nodes:
+            common_nodes[grid0] = nodes_ids[:,0].copy()
+        if grid1 not in common_nodes:
+            common_nodes[grid1] = nodes_ids[:,-1].copy()
+
+        # the shared columns have been added to the node sets by the cell which generated them,
+        # so the coordinates of the nodes added here are always in the new columns
+        for column, n in enumerate(nodes_ids[0,:]):
+            if n not in set_nodes_seen[101]:
+                set_nodes_seen[101].add(n)
                 set_nodes[101].append(n)
                 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! added by K.Komeilizadeh 
                 nodes_of_parts_at_bottom[pid].append(n)
-                nodes_of_parts_at_bottom_coordinate[n] = nodes[n]
+                nodes_of_parts_at_bottom_coordinate[n] = coordinates[0, column-first_column].copy()
                 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!   [pid]=[] 
                 
-        for n in nodes_ids[-1,:]:
-            if n not in set_nodes[102]:
+        for column, n in enumerate(nodes_ids[-1,:]):
+            if n not in set_nodes_seen[102]:
+                set_nodes_seen[102].add(n)
                 set_nodes[102].append(n)
                 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! added by K.Komeilizadeh
                 nodes_of_parts_at_top[pid].append(n) 
-                nodes_of_parts_at_top_coordinate[n] = nodes[n]
+                nodes_of_parts_at_top_coordinate[n] = coordinates[-1, column-first_column].copy()
                 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!   
-#        # !!!!!!!!!!!!!!!!!!!!!!!!!!!!! original trigger        
-#        if make_triggers:
-#            trigger_nodes = nodes_ids[-3,1:-1]
-#            for i in range(1, trigger_rows):
-#                trigger_nodes = np.append(trigger_nodes, nodes_ids[-3-i,1:-1])
-#            for gid in trigger_nodes:
-#                xy = nodes[gid][:2]
-#                z = nodes[gid][2]
-#                xy_t = xy + trigger_depth*line_perp
-#                grid = np.append(xy_t, z)
-#                nodes[gid] = grid
-		# !!!!!!!!!!!!!!!!!!!!!!!!!!!!! new pymesh trigger, K.Komeilizadeh
-        
-        # if make_triggers:
-        #     if pid in trigger_cells:
-        #         trigger_nodes = nodes_ids[-6,1:-1]  #!!!!!!!!! changed from -3 to -6
-        #         for i in range(1, trigger_rows):
-        #             trigger_nodes = np.append(trigger_nodes, nodes_ids[-6-i,1:-1]) #!!!!!!!!! changed from -3 to -6
-        #         for gid in trigger_nodes:
-        #             xy = nodes[gid][:2]
-        #             z = nodes[gid][2]
-        #             xy_t = xy + trigger_depth*line_perp
-        #             grid = np.append(xy_t, z)
-        #             nodes[gid] = grid
-        # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!1
         '''
         Modified trigger generation: New parameters of trigger width and trigger depth added
         '''
-        if make_triggers:
-            trigger_distance_default = extrusion_length/4
-            trigger_distance_default_el = int(round(trigger_distance_default/elsize))
-            # test variables
-            # trigger_depths = np.array([-4, 2, 4])
-            # trigger_position_vars = np.array([10, -10, 10])
-            trigger_depths = variables['trigger_depths']
-            trigger_position_vars = variables['trigger_positions']
-            print(trigger_position_vars)
-            trigger_position_vars_el = np.round(trigger_position_vars / elsize).astype(int)
-            if pid in trigger_cells:
-                for j in range(1,4): # three triggers
-                    # the trigger position varies based on the default
-                    trigger_position = trigger_distance_default_el*j + trigger_position_vars_el[j-1]
-                    trigger_nodes = nodes_ids[trigger_position,1:-1]  #!!!!!!!!! changed from -3 to -6
-                    for i in range(1, trigger_rows):
-                        trigger_nodes = np.append(trigger_nodes, nodes_ids[trigger_position+i,1:-1]) #!!!!!!!!! changed from -3 to -6
-                    for gid in trigger_nodes:
-                        xy = nodes[gid][:2]
-                        z = nodes[gid][2]
-                        xy_t = xy + trigger_depths[j-1]*line_perp
-                        grid = np.append(xy_t, z)
-                        nodes[gid] = grid
-            # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!       
-        for i in range(len(nodes_ids)-1):
-            for j in range(len(nodes_ids[i])-1):
-                n1 = nodes_ids[i  , j  ]
-                n2 = nodes_ids[i  , j+1]
-                n3 = nodes_ids[i+1, j+1]
-                n4 = nodes_ids[i+1, j  ]
-                shells[eid] = [pid, n1, n2, n3, n4]
-                eid += 1
-
-    # Write mesh
-    l = ''
-
-    l += '*KEYWORD\n'
-
-    # # Database nodes
-    # l += '*DATABASE_HISTORY_NODE\n'
-    # l += '${0:->9}{1:->10}{2:->10}{3:->10}'.format('nid1',
-    #                                                'nid2',
-    #                                                'nid3',
-    #                                                'nid4')
-    # l += '{0:->10}{1:->10}{2:->10}{3:->10}\n'.format('nid5',
-    #                                                  'nid6',
-    #                                                  'nid7',
-    #                                                  'nid8')
-    # database_nodes.sort()
-    # for i in range(0, len(database_nodes), 8):
-    #     chunk = database_nodes[i:i+8]
-    #     for n in chunk:
-    #         l += '{0:>10}'.format(n)
-    #     l += '\n'
-
-    # Part sets
-    l += '*SET_PART_LIST\n'
-    l += '${0:->9}\n'.format('sid')
-    l += '{0:>10}\n'.format(101)
-    l += '${0:->9}{1:->10}{2:->10}{3:->10}'.format('pid1',
-                                                   'pid2',
-                                                   'pid3',
-                                                   'pid4')
-    l += '{0:->10}{1:->10}{2:->10}{3:->10}\n'.format('pid5',
-                                                     'pid6',
-                                                     'pid7',
-                                                     'pid8')
-    set_pids = sorted(cells.keys())
-    for i in range(0, len(set_pids), 8):
-        chunk = set_pids[i:i+8]
-        for p in chunk:
-            l += '{0:>10}'.format(p)
-        l += '\n'
-
-    # Node sets
-    for sid in set_nodes:
-        l += '*SET_NODE_LIST\n'
-        l += '${0:->9}\n'.format('sid')
-        l += '{0:>10}\n'.format(sid)
-        l += '${0:->9}{1:->10}{2:->10}{3:->10}'.format('nid1',
-                                                       'nid2',
-                                                       'nid3',
-                                                       'nid4')
-        l += '{0:->10}{1:->10}{2:->10}{3:->10}\n'.format('nid5',
-                                                         'nid6',
-                                                         'nid7',
-                                                         'nid8')
-        set_nodes[sid].sort()
-        for i in range(0, len(set_nodes[sid]), 8):
-            chunk = set_nodes[sid][i:i+8]
-            for n in chunk:
-                l += '{0:>10}'.format(n)
-            l += '\n'
-
-    # Parts
-    for pid in sorted(cells.keys()):
-        secid = pid
-        thickness = cells[pid]['thickness']
-
-        l += '*PART\n'
-        l += 'Part_{0:}\n'.format(pid)
-        l += '${0:->9}{1:->10}{2:->10}\n'.format('pid', 'secid', 'mid')
-        l += '{0:>10}{1:>10}{2:>10}\n'.format(pid, secid, mid)
-
-        l += '*SECTION_SHELL\n'
-        l += '${0:->9}{1:->10}{2:->10}{3:->10}\n'.format('secid',
-                                                         'elform',
-                                                         'shrf',
-                                                         'nip')
-        l += '{0:>10}{1:>10}{2:>10}{3:>10}\n'.format(secid, elform, shrf, nip)
-
-        l += '${0:->9}{1:->10}{2:->10}{3:->10}\n'.format('t1', 't2', 't3', 't4')
-        l += '{0:>10}{0:>10}{0:>10}{0:>10}\n'.format(thickness)
-
-    # Elements
-    l += '*ELEMENT_SHELL\n'
-    l += '${0:->7}{1:->8}'.format('eid', 'pid')
-    l += '{0:->8}{1:->8}{2:->8}{3:->8}\n'.format('n1', 'n2', 'n3', 'n4')
-
-    for s in sorted(shells.keys()):
-        eid = s
-        pid = shells[s][0]
-        n1 = shells[s][1]
-        n2 = shells[s][2]
-        n3 = shells[s][3]
-        n4 = shells[s][4]
-        l += '{0:>8}{1:>8}'.format(eid, pid)
-        l += '{0:>8}{1:>8}{2:>8}{3:>8}\n'.format(n1, n2, n3, n4)
-
-    # Nodes
-    l += '*NODE\n'
-    l += '${0:->7}{1:->16}{2:->16}{3:->16}\n'.format('nid', 'x', 'y', 'z')
-    for n in sorted(nodes.keys()):
-        nid = n
-        x = nodes[n][0]
-        y = nodes[n][1]
-        z = nodes[n][2]
-        l += '{0:>8}{1:16.7f}{2:16.7f}{3:16.7f}\n'.format(nid, x, y, z)
-		
-	# added !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+        if make_triggers and pid in trigger_cells:
+            # the inner columns of the cell (1:-1) are always new nodes
+            inner_columns = slice(1-first_column, num_elements_line-first_column)
+            for j in range(1,4): # three triggers
+                # the trigger position varies based on the default
+                trigger_position = trigger_distance_default_el*j + trigger_position_vars_el[j-1]
+                trigger_rows_range = trigger_position + np.arange(trigger_rows)
+                coordinates[trigger_rows_range, inner_columns, :2] += trigger_depths[j-1]*line_perp
+
+        node_id_blocks.append(ids.ravel())
+        node_coordinate_blocks.append(coordinates.reshape(-1, 3))
+        # shells of the cell, numbered row by row
+        shell_blocks.append(np.stack([np.full(num_elements_ext*num_elements_line, pid),
+                                      nodes_ids[:-1, :-1].ravel(), nodes_ids[:-1, 1:].ravel(),
+                                      nodes_ids[1:, 1:].ravel(), nodes_ids[1:, :-1].ravel()], axis=1))
+
+    node_ids = np.concatenate(node_id_blocks)
+    node_coordinates = np.concatenate(node_coordinate_blocks)
+    order = np.argsort(node_ids)
+    node_ids = node_ids[order]
+    node_coordinates = node_coordinates[order]
+    shells = np.concatenate(shell_blocks)
+
+    # the elements are numbered consecutively from id_min, in the order they have been generated
+    mesh = {'node_ids': node_ids, 'coordinates': node_coordinates,
+            'element_ids': np.arange(id_min, id_min+len(shells)), 'shells': shells}
+    mesh.update({'set_nodes': set_nodes,
+                 'nodes_of_parts_at_top': nodes_of_parts_at_top,
+                 'nodes_of_parts_at_bottom': nodes_of_parts_at_bottom,
+                 'nodes_of_parts_at_top_coordinate': nodes_of_parts_at_top_coordinate,
+                 'nodes_of_parts_at_bottom_coordinate': nodes_of_parts_at_bottom_coordinate,
+                 'cells': cells, 'mid': mid, 'elform': elform, 'shrf': shrf, 'nip': nip})
+    return mesh
 
-    #       !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!	
-    
-    l +='*END\n'
+def py_mesh_v2(var_file, save=True, output_dir='.'):
+    variables, grids, cells = read_py_mesh_input(var_file)
+    mesh = generate_mesh(variables, grids, cells)
 
+    # Write mesh
     if save:
-        with open('mesh.k', 'w') as fo:
-            fo.write(l)
+        # written into output_dir rather than the current working directory, so that
+        # several meshes can be generated concurrently
+        write_mesh(os.path.join(output_dir, 'mesh.k'), mesh)
 
     #return l
     # !!!!!!!!!!!!!!!!!!!!!!!!!!!!! added by K.Komeilizadeh
-    return nodes_of_parts_at_top, nodes_of_parts_at_bottom,\
-           nodes_of_parts_at_top_coordinate, nodes_of_parts_at_bottom_coordinate
+    return mesh['nodes_of_parts_at_top'], mesh['nodes_of_parts_at_bottom'],\
+           mesh['nodes_of_parts_at_top_coordinate'], mesh['nodes_of_parts_at_bottom_coordinate']
     # !!!!!!!!!!!!!!!!!!!!!!!
 
 def main():
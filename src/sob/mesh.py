@@ -1,10 +1,97 @@
 import numpy as np
 import os
 
-from .lib.py_mesh import py_mesh
-from .lib.py_mesh_v2 import py_mesh_v2
+from .lib.py_mesh import py_mesh, generate_mesh
+from .lib.py_mesh_v2 import py_mesh_v2, generate_mesh as generate_mesh_v2
+from .lib.keyword_writer import write_mesh
+
+def perimeter(grid_pts):
+    """
+    Perimeter of the closed polygon(s) defined by the grid points.
+
+    Parameters:
+        grid_pts (numpy.ndarray): Vertices of shape (n_vertices, 2), or (n_designs, n_vertices, 2) for a batch.
+
+    Returns:
+        float or numpy.ndarray: The perimeter of each polygon.
+    """
+    # Calculate the distance between consecutive vertices, closing the polygon
+    distances = np.linalg.norm(np.roll(grid_pts, -1, axis=-2) - grid_pts, axis=-1)
+    # Sum the distances to get the perimeter. Summed edge by edge, so that a design gets the
+    # same value whether it is evaluated alone or in a batch (np.sum's order depends on the shape).
+    result = distances[..., 0]
+    for i in range(1, distances.shape[-1]):
+        result = result + distances[..., i]
+    return result
+
+def shell_volume(mesh):
+    """
+    Volume of the shell elements of a mesh: the area of each quad times the thickness of its part, summed
+    in one vectorized pass. Unlike volume(), it accounts for the trigger dents of the generated mesh.
+
+    Parameters:
+        mesh (dict): The mesh, as returned by generate_mesh of py_mesh or py_mesh_v2.
+
+    Returns:
+        float: The volume of the shells.
+    """
+    shells = mesh['shells']
+    # coordinates of the 4 nodes of each shell, (M,4,3), the node ids of the mesh are sorted
+    corners = mesh['coordinates'][np.searchsorted(mesh['node_ids'], shells[:, 1:])]
+    # area of a quad, also of a slightly warped one: half the norm of the cross product of its diagonals
+    areas = 0.5*np.linalg.norm(np.cross(corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 1]), axis=1)
+    part_ids = np.array(sorted(mesh['cells'].keys()))
+    part_thicknesses = np.array([mesh['cells'][pid]['thickness'] for pid in part_ids])
+    thicknesses = part_thicknesses[np.searchsorted(part_ids, shells[:, 0])]
+    return np.sum(areas*thicknesses)
+
+def _input_float(value):
+    # value as read back from py_mesh.input, where it is written with %f
+    return float('%f' % value)
+
+def _mesher_input(mesh):
+    """
+    Variables, grids and cells of the mesher common to the star box and the crash tube, equal to the ones
+    py_mesh parses from the file written by write_py_mesh_input.
+    """
+    variables = {
+        'extrusion_length': _input_float(mesh.extrusion_length),
+        'elform': int(mesh.elform),
+        'nip': int(mesh.nip),
+        'shrf': _input_float(mesh.shrf),
+        'elsize': _input_float(mesh.elsize),
+        'id_min': int(mesh.id_min),
+        'num_elements_line': int(mesh.num_elements_line),
+        'trigger_rows': int(mesh.trigger_rows),
+        'trigger': [int(cid) for cid in mesh.cell[:,0]],
+        'mid': int(mesh.mat_id),
+        'database': [int(nid) for nid in mesh.database],
+    }
+    # the grid coordinates are written as integers
+    grids = {int(gid): [float(int(x)), float(int(y))] for gid, x, y in mesh.grid}
+    cells = {int(cid): {'line': [int(g0), int(g1)], 'thickness': float(t)} for cid, g0, g1, t in mesh.cell}
+    return variables, grids, cells
 
 class StarBoxMesh():
+    # Default values for configuration parameters
+    default_parameters = {
+        'thickness': 1.2,
+        'elsize': 4,
+        'extrusion_length': 120,
+        'node_starting_id': 1001,
+        'part_starting_id': 101,
+        'id_min': 1000001,
+        'trigger_height': 12,  # 3 * elsize = 3 * 4 = 12
+        'elform': 2,
+        'nip': 3,
+        'shrf': 0.83333,
+        'mat_id': 999,
+        'node_starting_id': 1001,
+        'part_starting_id': 101
+    }
+    # number of elements along each edge of the cross section, overridden by the num_elements_line keyword argument
+    num_elements_line = 12
+
     def __init__(self, variable_array, crossing_wall=False, **kwargs) -> None:
         # Optimization problem parameters
         self.variable_array = variable_array
@@ -15,33 +102,41 @@ class StarBoxMesh():
         self.grid_pts = self._determine_grid_points()
         self._determine_trigger_depth(**kwargs)
 
-        # Default values for configuration parameters
-        self.default_parameters = {
-            'thickness': 1.2,
-            'elsize': 4,
-            'extrusion_length': 120,
-            'node_starting_id': 1001,
-            'part_starting_id': 101,
-            'id_min': 1000001,
-            'trigger_height': 12,  # 3 * elsize = 3 * 4 = 12
-            'elform': 2,
-            'nip': 3,
-            'shrf': 0.83333,
-            'mat_id': 999,
-            'node_starting_id': 1001,
-            'part_starting_id': 101
-        }
         self._set_parameters(**kwargs)
         self._generate_database_and_grid(crossing_wall)
+        # mesh generated by generate_mesh
+        self._mesh = None
 
     def volume(self):
-        # Calculate the distance between consecutive vertices
-        distances = np.linalg.norm(np.diff(self.grid_pts, axis=0, append=[self.grid_pts[0]]), axis=1)
-        # Sum the distances to get the perimeter
-        perimeter = np.sum(distances)
-        result = perimeter*self.extrusion_length*self.thickness
+        result = perimeter(self.grid_pts)*self.extrusion_length*self.thickness
         return result
 
+    @classmethod
+    def batch_volume(cls, variable_arrays, **kwargs):
+        """
+        Vectorized counterpart of volume() for a batch of designs, computed without generating any mesh.
+
+        Parameters:
+            variable_arrays (array-like): Design variables in the FEM space, one design per row.
+            **kwargs (dict): Mesh parameters overriding the defaults, as accepted by the constructor.
+
+        Returns:
+            numpy.ndarray: The volume of each design.
+        """
+        variable_arrays = np.atleast_2d(np.asarray(variable_arrays, dtype=float))
+        parameters = dict(cls.default_parameters, **kwargs)
+        elsize = parameters['elsize']
+        if 'extrusion_length' in kwargs:
+            extrusion_length = int(float(kwargs['extrusion_length']) / elsize) * elsize
+        else:
+            extrusion_length = elsize * 30
+
+        if variable_arrays.shape[1] in [3, 5]:
+            thickness = variable_arrays[:, -1]
+        else:
+            thickness = parameters['thickness']
+        return perimeter(cls.grid_points(variable_arrays))*extrusion_length*thickness
+
     def _determine_grid_points(self):
         """
         Determine the coordinates of the grid points to define the shape of the star box.
@@ -51,6 +146,19 @@ class StarBoxMesh():
 
         Raises:
             ValueError: If the dimension is invalid or not supported.
+        """
+        return self.grid_points(np.asarray(self.variable_array, dtype=float).reshape(1, -1))[0]
+
+    @staticmethod
+    def grid_points(variable_arrays):
+        """
+        Determine the grid points of a batch of star boxes, see _determine_grid_points.
+
+        Parameters:
+            variable_arrays (numpy.ndarray): Design variables in the FEM space, one design per row.
+
+        Returns:
+            numpy.ndarray: Array of shape (n_designs, n_vertices, 2).
 
         Notes:
             - For 1D problems, the grid points are calculated based on the length of the star box.
@@ -58,32 +166,37 @@ class StarBoxMesh():
             - For 4D and 5D problems, a specialized method `_create_grid_pts_Hunkler` is called to determine
             the grid points.
         """
-        if self.dimension == 1:
-            length = self.variable_array[0] / 2
-            return np.array([[-length, length], [length, length],
-                                      [length, -length], [-length, -length]])
-        elif self.dimension in [2, 3]:
-            length = self.variable_array[0] / 2
-            width = self.variable_array[1] / 2
-            return np.array([[-length, width], [length, width],
-                                      [length, -width], [-length, -width]])
-        elif self.dimension in [4, 5]:
-            return self._create_grid_pts_Hunkler()
+        dimension = np.shape(variable_arrays)[1]
+        if dimension == 1:
+            length = variable_arrays[:, 0] / 2
+            grid_pts = [[-length, length], [length, length],
+                        [length, -length], [-length, -length]]
+        elif dimension in [2, 3]:
+            length = variable_arrays[:, 0] / 2
+            width = variable_arrays[:, 1] / 2
+            grid_pts = [[-length, width], [length, width],
+                        [length, -width], [-length, -width]]
+        elif dimension in [4, 5]:
+            grid_pts = StarBoxMesh._create_grid_pts_Hunkler(variable_arrays)
         else:
             raise ValueError('Invalid dimension. The dimensions of the problem can only be in [1, 5]')
+        # (n_vertices, 2, n_designs) -> (n_designs, n_vertices, 2)
+        return np.moveaxis(np.array(grid_pts), -1, 0)
         
-    def _create_grid_pts_Hunkler(self):
+    @staticmethod
+    def _create_grid_pts_Hunkler(variable_arrays):
         """
         this function creates vertices for the hunkler star model. these vertices will
         be connected by the py_mesh to create the cross section of the crash box, which then 
         will be extruded later
         """
-        a = self.variable_array[0]
-        b = self.variable_array[1]
-        u = self.variable_array[2]
-        v = self.variable_array[3]
-        return  np.array([[b/2.,a/2.],[0,a/2.-u],[-b/2.,a/2.],[-b/2.+v,0],
-                        [-b/2.,-a/2.],[0,-a/2.+u],[b/2.,-a/2.],[b/2.-v,0]])
+        a = variable_arrays[:, 0]
+        b = variable_arrays[:, 1]
+        u = variable_arrays[:, 2]
+        v = variable_arrays[:, 3]
+        zero = np.zeros_like(a)
+        return [[b/2.,a/2.],[zero,a/2.-u],[-b/2.,a/2.],[-b/2.+v,zero],
+                [-b/2.,-a/2.],[zero,-a/2.+u],[b/2.,-a/2.],[b/2.-v,zero]]
     
     def _determine_trigger_depth(self, **kwargs):
         """
@@ -200,11 +313,12 @@ class StarBoxMesh():
                     cell_id += 1
                     self.cell = np.vstack((self.cell,np.array([cell_id, node_hist[-1], self.node_starting_id+j, self.thickness])))
 
-    def write_py_mesh_input(self): 
+    def write_py_mesh_input(self, output_dir='.'): 
         """ 
         writes py_mesh.input file 
         
         Inputs: 
+        output_dir (directory of py_mesh.input, default: the current working directory)
         element_size
         element_form
         intergration_points
@@ -219,7 +333,7 @@ class StarBoxMesh():
         Outputs
         
         """  
-        adr = os.path.join(os.getcwd(),'py_mesh.input')
+        adr = os.path.join(output_dir,'py_mesh.input')
         inf = open(adr,'w')
         inf.writelines('#  units:' + self.units + '\n')
         inf.writelines('\n# ----- height of the structure (i.e. extrusion length)\n')
@@ -230,6 +344,7 @@ class StarBoxMesh():
         inf.writelines('nip, %d\n' %self.nip)  
         inf.writelines('shrf, %f\n' %self.shrf)   
         inf.writelines('elsize, %f\n' %self.elsize) 
+        inf.writelines('num_elements_line, %d\n' %self.num_elements_line)
         inf.writelines('\n# ----- The id number for the first node and shell\n')
         inf.writelines('id_min, %d\n' %self.id_min)
         # ----- trigger 
@@ -266,12 +381,72 @@ class StarBoxMesh():
                             str(int(self.cell[i,1]))+',', str(int(self.cell[i,2]))+',',str(self.cell[i,3])))          
         inf.close()
 
-    def write_mesh_file(self):
-        # ---- running py_mesh
-        self.write_py_mesh_input()
-        py_mesh('py_mesh.input')
+    def mesher_input(self):
+        """
+        Returns:
+            tuple: (variables, grids, cells) of py_mesh, as parsed from the file of write_py_mesh_input.
+        """
+        variables, grids, cells = _mesher_input(self)
+        variables['trigger_depth'] = _input_float(self.trigger_depth)
+        return variables, grids, cells
+
+    def generate_mesh(self):
+        """
+        Mesh the star box in memory, the mesh is generated once and reused.
+
+        Returns:
+            dict: The mesh, see py_mesh.generate_mesh.
+        """
+        if self._mesh is None:
+            self._mesh = generate_mesh(*self.mesher_input())
+        return self._mesh
+
+    def mesh_volume(self):
+        # volume of the shells of the generated mesh, see shell_volume
+        return shell_volume(self.generate_mesh())
+
+    def write_mesh_file(self, output_dir='.', write_input=False):
+        """
+        Mesh the star box and write mesh.k into output_dir.
+
+        Parameters:
+            output_dir (str): Directory of mesh.k, default: the current working directory.
+            write_input (bool): Also write py_mesh.input, as a debug artifact. The mesher gets its input in memory.
+
+        Returns:
+            dict: The mesh, see py_mesh.generate_mesh.
+        """
+        if write_input:
+            self.write_py_mesh_input(output_dir)
+        mesh = self.generate_mesh()
+        write_mesh(os.path.join(output_dir, 'mesh.k'), mesh)
+        return mesh
         
 class CrashTubeMesh():
+    # Default values for configuration parameters
+    default_parameters = {
+        'thickness': 1.2,
+        'elsize': 4,
+        'extrusion_length': 800,
+        'node_starting_id': 1001,
+        'part_starting_id': 101,
+        'id_min': 1000001,
+        'trigger_height': 12,  # 3 * elsize = 3 * 4 = 12
+        'elform': 2,
+        'nip': 3,
+        'shrf': 0.83333,
+        'mat_id': 999,
+        'node_starting_id': 1001,
+        'part_starting_id': 101
+    }
+
+    # number of elements along each edge of the cross section, overridden by the num_elements_line keyword argument
+    num_elements_line = 12
+
+    # size of the crash tube
+    grid_pts = np.array([[-120 / 2, 80 / 2], [120 / 2, 80 / 2],
+                         [120 / 2, -80 / 2], [-120 / 2, -80 / 2]])
+
     def __init__(self, variable_array, **kwargs) -> None:
         # Optimization problem parameters
         self.variable_array = variable_array
@@ -279,38 +454,36 @@ class CrashTubeMesh():
 
         self.units =  '  kg  mm  ms  kN  GPa  kN-mm'
 
-        # size of the crash tube
-        length = 120 / 2
-        width = 80 / 2
-        self.grid_pts = np.array([[-length, width], [length, width],
-                                    [length, -width], [-length, -width]])
         self.trigger_positions, self.trigger_depths = self._determine_trigger_depths_and_position()
-        # Default values for configuration parameters
-        self.default_parameters = {
-            'thickness': 1.2,
-            'elsize': 4,
-            'extrusion_length': 800,
-            'node_starting_id': 1001,
-            'part_starting_id': 101,
-            'id_min': 1000001,
-            'trigger_height': 12,  # 3 * elsize = 3 * 4 = 12
-            'elform': 2,
-            'nip': 3,
-            'shrf': 0.83333,
-            'mat_id': 999,
-            'node_starting_id': 1001,
-            'part_starting_id': 101
-        }
         self._set_parameters(**kwargs)
         self._generate_database_and_grid()
+        # mesh generated by generate_mesh
+        self._mesh = None
         
     def volume(self):
-        # Calculate the distance between consecutive vertices
-        distances = np.linalg.norm(np.diff(self.grid_pts, axis=0, append=[self.grid_pts[0]]), axis=1)
-        # Sum the distances to get the perimeter
-        perimeter = np.sum(distances)
-        result = perimeter*self.extrusion_length*self.thickness
+        result = perimeter(self.grid_pts)*self.extrusion_length*self.thickness
         return result
+
+    @classmethod
+    def batch_volume(cls, variable_arrays, **kwargs):
+        """
+        Vectorized counterpart of volume() for a batch of designs, computed without generating any mesh.
+
+        Parameters:
+            variable_arrays (array-like): Design variables in the FEM space, one design per row.
+            **kwargs (dict): Mesh parameters overriding the defaults, as accepted by the constructor.
+
+        Returns:
+            numpy.ndarray: The volume of each design.
+        """
+        variable_arrays = np.atleast_2d(np.asarray(variable_arrays, dtype=float))
+        parameters = dict(cls.default_parameters, **kwargs)
+        if variable_arrays.shape[1] in [3, 5]:
+            thickness = variable_arrays[:, -1]
+        else:
+            thickness = parameters['thickness']
+        grid_pts = np.broadcast_to(cls.grid_pts, (len(variable_arrays),) + cls.grid_pts.shape)
+        return perimeter(grid_pts)*parameters['extrusion_length']*thickness
     
     def _determine_trigger_depths_and_position(self):
         '''
@@ -413,11 +586,12 @@ class CrashTubeMesh():
         self.cell = np.vstack((self.cell, cell_row))
 
 
-    def write_py_mesh_input(self): 
+    def write_py_mesh_input(self, output_dir='.'): 
         """ 
         writes py_mesh.input file 
         
         Inputs: 
+        output_dir (directory of py_mesh.input, default: the current working directory)
         element_size
         element_form
         intergration_points
@@ -432,7 +606,7 @@ class CrashTubeMesh():
         Outputs
         
         """  
-        adr = os.path.join(os.getcwd(),'py_mesh.input')
+        adr = os.path.join(output_dir,'py_mesh.input')
         inf = open(adr,'w')
         inf.writelines('#  units:' + self.units + '\n')
         inf.writelines('\n# ----- height of the structure (i.e. extrusion length)\n')
@@ -443,6 +617,7 @@ class CrashTubeMesh():
         inf.writelines('nip, %d\n' %self.nip)  
         inf.writelines('shrf, %f\n' %self.shrf)   
         inf.writelines('elsize, %f\n' %self.elsize) 
+        inf.writelines('num_elements_line, %d\n' %self.num_elements_line)
         inf.writelines('\n# ----- The id number for the first node and shell\n')
         inf.writelines('id_min, %d\n' %self.id_min)
         # ----- trigger 
@@ -485,7 +660,44 @@ class CrashTubeMesh():
                             str(int(self.cell[i,1]))+',', str(int(self.cell[i,2]))+',',str(self.cell[i,3])))          
         inf.close()
 
-    def write_mesh_file(self):
-        # ---- running py_mesh
-        self.write_py_mesh_input()
-        py_mesh_v2('py_mesh.input')
\ No newline at end of file
+    def mesher_input(self):
+        """
+        Returns:
+            tuple: (variables, grids, cells) of py_mesh_v2, as parsed from the file of write_py_mesh_input.
+        """
+        variables, grids, cells = _mesher_input(self)
+        variables['trigger_positions'] = np.array([float(position) for position in self.trigger_positions][:3])
+        variables['trigger_depths'] = np.array([float(depth) for depth in self.trigger_depths][:3])
+        return variables, grids, cells
+
+    def generate_mesh(self):
+        """
+        Mesh the crash tube in memory, the mesh is generated once and reused.
+
+        Returns:
+            dict: The mesh, see py_mesh_v2.generate_mesh.
+        """
+        if self._mesh is None:
+            self._mesh = generate_mesh_v2(*self.mesher_input())
+        return self._mesh
+
+    def mesh_volume(self):
+        # volume of the shells of the generated mesh, see shell_volume
+        return shell_volume(self.generate_mesh())
+
+    def write_mesh_file(self, output_dir='.', write_input=False):
+        """
+        Mesh the crash tube and write mesh.k into output_dir.
+
+        Parameters:
+            output_dir (str): Directory of mesh.k, default: the current working directory.
+            write_input (bool): Also write py_mesh.input, as a debug artifact. The mesher gets its input in memory.
+
+        Returns:
+            dict: The mesh, see py_mesh_v2.generate_mesh.
+        """
+        if write_input:
+            self.write_py_mesh_input(output_dir)
+        mesh = self.generate_mesh()
+        write_mesh(os.path.join(output_dir, 'mesh.k'), mesh)
+        return mesh
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""
+Monitoring of a running OpenRadioss job, to stop it once its objective is determined.
+
+The engine writes a line per printout cycle into its listing (<root>_0001.out): the time, the internal energy,
+the kinetic energy and the external work of the model. The RunMonitor tails the listing while the job runs and
+evaluates the stop criteria on the values read so far. When a criterion fires, it writes the /STOP command into
+the engine control file (<root>_0001.ctl): the engine stops cleanly and the batch script still converts the time
+history written so far. A job which hasn't stopped after the grace period is killed.
+
+A criterion is a function of the monitor returning True when the run can be stopped, e.g. velocity_reversal().
+"""
+
+import re
+import time
+import subprocess
+import numpy as np
+from .solver import run_files, kill_process_group
+
+# a cycle line of the engine listing:
+#   CYCLE  TIME  TIME-STEP  ELEMENT  ERROR  I-ENERGY  K-ENERGY T  K-ENERGY R  EXT-WORK  MAS.ERR
+CYCLE_LINE = re.compile(rb'^\s*(\d+)\s+(\S+)\s+\S+\s+.*?%\s+(\S+)\s+(\S+)\s+\S+\s+(\S+)')
+
+def engine_files(input_file_path):
+    """
+    Returns:
+        tuple: Paths of the engine listing and of the engine control file of an input deck,
+        e.g. combine.k -> combine_0001.out, combine_0001.ctl.
+    """
+    files = run_files(input_file_path)
+    return files['listing'], files['control']
+
+class RunMonitor():
+    '''
+    Tails the engine listing of a running job and stops the job when one of the criteria fires.
+
+    The values read from the listing are in time, internal_energy, kinetic_energy and external_work (NumPy
+    arrays, one value per printout cycle). stopped is the name of the criterion which stopped the run, None if
+    the run went to its end time.
+    '''
+    def __init__(self, input_file_path, criteria, wall_mass=None, initial_energy=None, poll_interval=1.0, grace_period=30.0) -> None:
+        self.listing_path, self.control_path = engine_files(input_file_path)
+        self.criteria = list(criteria)
+        # mass of the impactor and kinetic energy of the model at the start, used by the criteria
+        self.wall_mass = wall_mass
+        self.initial_energy = initial_energy
+        self.poll_interval = poll_interval
+        self.grace_period = grace_period
+
+        self.reset()
+
+    def reset(self):
+        # forget the listing read so far, e.g. before the job is run again
+        self.stopped = None
+        self._offset = 0
+        self._rows = []
+
+    @property
+    def time(self):
+        return np.array([row[0] for row in self._rows])
+
+    @property
+    def internal_energy(self):
+        return np.array([row[1] for row in self._rows])
+
+    @property
+    def kinetic_energy(self):
+        return np.array([row[2] for row in self._rows])
+
+    @property
+    def external_work(self):
+        return np.array([row[3] for row in self._rows])
+
+    def update(self):
+        """
+        Read the cycle lines appended to the listing since the last update.
+
+        Returns:
+            int: The number of new cycle lines.
+        """
+        try:
+            with open(self.listing_path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        # only the complete lines, the engine may be writing the last one
+        data = data[:data.rfind(b'\n') + 1]
+        self._offset += len(data)
+        count = 0
+        for line in data.splitlines():
+            match = CYCLE_LINE.match(line)
+            if match is None:
+                continue
+            try:
+                self._rows.append(tuple(float(value) for value in match.group(2, 3, 4, 5)))
+            except ValueError:
+                continue
+            count += 1
+        return count
+
+    def intrusion(self):
+        """
+        Estimate of the crush distance so far: the wall speed from the kinetic energy, sqrt(2*K/wall_mass),
+        integrated over time. The structure is light compared to the impactor, its kinetic energy is neglected.
+        """
+        if len(self._rows) < 2:
+            return 0.0
+        speed = np.sqrt(2*np.maximum(self.kinetic_energy, 0.0)/self.wall_mass)
+        return float(np.sum((speed[1:] + speed[:-1])/2*np.diff(self.time)))
+
+    def check(self):
+        """
+        Returns:
+            str: The name of the first criterion which fires, None if none does.
+        """
+        if not self._rows:
+            return None
+        for criterion in self.criteria:
+            if criterion(self):
+                return getattr(criterion, '__name__', 'criterion')
+        return None
+
+    def stop(self, process):
+        """
+        Ask the engine to stop through its control file, and kill the job if it is still running after the grace period.
+        """
+        with open(self.control_path, 'w') as f:
+            f.write('/STOP\n')
+        try:
+            process.wait(self.grace_period)
+        except subprocess.TimeoutExpired:
+            kill_process_group(process)
+            process.wait()
+
+    def watch(self, process, timeout=None):
+        """
+        Monitor a job started with subprocess.Popen until it terminates.
+
+        Parameters:
+            timeout (float): Wall-clock limit in seconds, subprocess.TimeoutExpired is raised when it is
+                exceeded (the job is left running). Default: no limit.
+
+        Returns:
+            int: The return code of the job.
+        """
+        start = time.monotonic()
+        while process.poll() is None:
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise subprocess.TimeoutExpired(process.args, timeout)
+            time.sleep(self.poll_interval)
+            if self.update() and self.stopped is None:
+                self.stopped = self.check()
+                if self.stopped is not None:
+                    self.stop(process)
+        self.update()
+        return process.returncode
+
+def energy_absorbed(fraction=0.99):
+    """
+    Stop once the internal energy of the structure has reached the fraction of the initial kinetic energy.
+    """
+    def energy_absorbed(monitor):
+        return monitor.internal_energy.max() >= fraction*monitor.initial_energy
+    return energy_absorbed
+
+def velocity_reversal(fraction=0.05, tolerance=0.01):
+    """
+    Stop once the wall rebounds: the kinetic energy has fallen below the fraction of the initial kinetic energy,
+    and has risen again by more than the tolerance (relative to the initial kinetic energy) from its minimum.
+    """
+    def velocity_reversal(monitor):
+        kinetic_energy = monitor.kinetic_energy
+        lowest = kinetic_energy.min()
+        return (lowest <= fraction*monitor.initial_energy and
+                kinetic_energy[-1] - lowest > tolerance*monitor.initial_energy)
+    return velocity_reversal
+
+def intrusion_exceeds(threshold):
+    """
+    Stop once the estimated intrusion exceeds the threshold, e.g. the best intrusion found so far.
+    """
+    def intrusion_exceeds(monitor):
+        return monitor.intrusion() > threshold
+    return intrusion_exceeds
@@ -0,0 +1,108 @@
+"""
+Registry of the outputs a problem can evaluate: OBJECTIVES maps the name of an output data to the function which
+computes it and to whether it needs a simulation.
+
+The function is called as function(problem, fem_space_variable_array, history) with the design variables in the
+FEM space and the time history of the simulation of the design (pandas.DataFrame, None for the outputs which
+don't need a simulation). Several outputs of one design are computed from the same simulation, see
+OptiProblem with a list of output data.
+
+The crash outputs are computed from the crush displacement of the tracked node (the column of the intrusion)
+and the force on the moving rigid wall: the normal force FNX, FNY, FNZ of the columns of wall_force_key
+(*DATABASE_RWFORC, written by the decks of StarBox and CrashTube), else the deceleration of the wall node
+(wall_node_key, with the 'full' output profile) times the wall mass. The energy absorbed in the run is the work
+of that force over the displacement of the wall node (over the crush displacement without its columns), whereas
+absorbed_energy is the initial kinetic energy of the wall, which needs no simulation.
+"""
+
+import numpy as np
+
+OBJECTIVES = {}
+
+def register_objective(name, needs_simulation=True):
+    """
+    Decorator registering an output data, see the module docstring for the signature of the function.
+
+    Parameters:
+        name (str): Name of the output data, as given to get_problem.
+        needs_simulation (bool): Whether the output is computed from the time history of the simulation.
+    """
+    def decorator(function):
+        OBJECTIVES[name] = (function, needs_simulation)
+        return function
+    return decorator
+
+def needs_simulation(name):
+    if name not in OBJECTIVES:
+        raise ValueError(f"Invalid output data '{name}', the options are {sorted(OBJECTIVES)}")
+    return OBJECTIVES[name][1]
+
+def _crush(problem, history):
+    # time and crush displacement of the tracked node
+    matching_columns = [col for col in history.columns if problem.track_node_key in col]
+    return history.iloc[:, 0].to_numpy(dtype=float), np.abs(history[matching_columns[2]].to_numpy(dtype=float))
+
+def _wall_force(problem, history):
+    # crush force history: the norm of the normal force FNX, FNY, FNZ of the rigid wall, else the wall mass times
+    # the deceleration of the wall node
+    if problem.wall_force_key is not None:
+        matching_columns = [col for col in history.columns if problem.wall_force_key in col]
+        normal_columns = [col for component in ('FNX', 'FNY', 'FNZ') for col in matching_columns if col.endswith(component)]
+        if len(normal_columns) == 3:
+            return np.linalg.norm(history[normal_columns].to_numpy(dtype=float), axis=1)
+    displacement = _wall_displacement(problem, history)
+    if displacement is not None:
+        time = history.iloc[:, 0].to_numpy(dtype=float)
+        acceleration = np.gradient(np.gradient(displacement, time), time)
+        return problem.model_class.impactor_defaults['wall_mass']*np.abs(acceleration)
+    raise KeyError(f"No normal force columns of the rigid wall '{problem.wall_force_key}' nor columns of the wall "
+                   f"node '{problem.wall_node_key}' in the time history")
+
+def _wall_displacement(problem, history):
+    # displacement of the wall node along the crush direction, None without its columns
+    if problem.wall_node_key is not None:
+        matching_columns = [col for col in history.columns if problem.wall_node_key in col]
+        if matching_columns:
+            return history[matching_columns[2]].to_numpy(dtype=float)
+    return None
+
+def _run_energy(problem, history):
+    # work of the crush force over the displacement of the wall (trapezoidal rule), the crush displacement of
+    # the tracked node standing in for it without the columns of the wall node
+    force = _wall_force(problem, history)
+    displacement = _wall_displacement(problem, history)
+    if displacement is None:
+        displacement = _crush(problem, history)[1]
+    return float(np.sum((force[1:] + force[:-1])*np.diff(np.abs(displacement)))/2)
+
+@register_objective('mass', needs_simulation=False)
+def mass(problem, fem_space_variable_array, history):
+    return problem._evaluate_analytic_batch(np.atleast_2d(fem_space_variable_array), 'mass')[0]
+
+@register_objective('absorbed_energy', needs_simulation=False)
+def absorbed_energy(problem, fem_space_variable_array, history):
+    return problem._evaluate_analytic_batch(np.atleast_2d(fem_space_variable_array), 'absorbed_energy')[0]
+
+@register_objective('intrusion')
+def intrusion(problem, fem_space_variable_array, history):
+    return problem._intrusion(history)
+
+@register_objective('peak_wall_force')
+def peak_wall_force(problem, fem_space_variable_array, history):
+    return float(_wall_force(problem, history).max())
+
+@register_objective('mean_crush_force')
+def mean_crush_force(problem, fem_space_variable_array, history):
+    # energy absorbed in the run over the crush distance
+    return _run_energy(problem, history)/intrusion(problem, fem_space_variable_array, history)
+
+@register_objective('specific_energy_absorption')
+def specific_energy_absorption(problem, fem_space_variable_array, history):
+    # energy absorbed in the run per unit mass of the structure
+    return _run_energy(problem, history)/mass(problem, fem_space_variable_array, history)
+
+@register_objective('crush_efficiency')
+def crush_efficiency(problem, fem_space_variable_array, history):
+    # crush force efficiency, mean over peak crush force
+    return (mean_crush_force(problem, fem_space_variable_array, history)/
+            peak_wall_force(problem, fem_space_variable_array, history))
@@ -1,9 +1,44 @@
 import os
+import time
+import errno
+import asyncio
+import hashlib
+import itertools
+import numpy as np
 import pandas as pd
-from .solver import run_radioss
+from concurrent.futures import ThreadPoolExecutor
+from .solver import run_radioss, arun_radioss, run_files, termination_status, RunResult, SimulationError
+from .cache import EvaluationCache, evaluation_key, load_history
+from .broker import wait_all
+from .tuning import best_split
+from .history import read_header, load_time_history, peak_abs
+from .objectives import OBJECTIVES, needs_simulation
+from .monitor import RunMonitor
 from .mesh import *
 from .fem import *
 
+# Number of hexadecimal digits of the run ids, see OptiProblem._claim_deck_dir
+RUN_ID_LENGTH = 16
+
+# Options of a problem sent to the workers in its spec, see OptiProblem.spec, and those of them which are
+# attributes set after the construction rather than keyword arguments, see worker.problem_from_spec
+SPEC_OPTIONS = ('sp', 'mass_mode', 'shared_includes', 'fidelity', 'output_profile', 'timeout', 'retries', 'failure_penalty',
+                'wall_force_key')
+SPEC_ATTRIBUTES = ('wall_force_key',)
+
+# Seconds a worker may spend on a job besides its simulations (deck generation, conversion, time history), see
+# OptiProblem._stale_after
+STALE_MARGIN = 60
+
+# Fidelity levels of the simulations, for multi-fidelity optimization: the element size along the extrusion and
+# the number of elements along each edge of the cross section, the end time and the output intervals (scaled
+# from the defaults of the model) and the d3plot output. 'high' is the model with its default parameters.
+FIDELITY_LEVELS = {
+    'high': {},
+    'medium': {'elsize': 6, 'num_elements_line': 8, 'end_time_scale': 0.8, 'output_dtime_scale': 2.0},
+    'low': {'elsize': 8, 'num_elements_line': 6, 'end_time_scale': 0.6, 'output_dtime_scale': 4.0, 'consider_d3plot': False},
+}
+
 '''
 Remark: following phases are important 
 
@@ -17,28 +52,134 @@ class OptiProblem():
     The core idea is to generate a specific type of instance, input the variable array then output the evaluation of the desired data type like mass, intrusion, etc.
     The input variables should be in an universal search space, default (-5,5). For the evaluation those variables will be mapped to the real FEM problem space.
     '''
-    def __init__(self, dimension, output_data, batch_file_path) -> None:
+    # The mesh and model classes of the problem, used for the evaluations which don't need a simulation.
+    mesh_class = None
+    model_class = None
+
+    def __init__(self, dimension, output_data, batch_file_path, cache=None, nt=1, nmpi=1, sp='sp', auto_tune=True, mass_mode='analytic', shared_includes=True, stop_criteria=None, fidelity='high', output_profile='full', workspace=None, timeout=None, retries=0, failure_penalty=None, journal=None, broker=None, environment=None) -> None:
         self.dimension = dimension
+        # name of the output data, or a list of names evaluated as a vector from one simulation, see objectives.py
         self.output_data = output_data
+        if isinstance(output_data, (list, tuple)):
+            for name in output_data:
+                needs_simulation(name)
         self.batch_file_path = batch_file_path
+        # EvaluationCache of the simulation results, None to always run the solver.
+        self.cache = cache
+
+        # Resources of one OpenRadioss run: OpenMP threads per MPI process, MPI processes,
+        # and "sp" for single precision (any other value for double precision).
+        self.nt = nt
+        self.nmpi = nmpi
+        self.sp = sp
+        # Use the split of cores recorded by calibrate_throughput (if any) for evaluate_batch.
+        self.auto_tune = auto_tune
+        # Computation of the mass, 'analytic' or 'mesh' (from the shells of the generated mesh), see StarBoxModel.mass.
+        self.mass_mode = mass_mode
+        # Write the keyword files which don't depend on the design once, and hard link them into the decks.
+        self.shared_includes = shared_includes
+        # Criteria stopping a simulation once its objective is determined, see monitor.py. None: run to the end time.
+        self.stop_criteria = stop_criteria
+        # The decks whose simulation has been stopped early -> the name of the criterion which stopped it.
+        self.early_stops = {}
+        # Supervision of the runs, see solver.run_radioss: wall-clock limit of a run in seconds (None: no limit),
+        # number of retries of a failed run with other splits of the cores, and the evaluation of a design whose
+        # run failed (None: SimulationError is raised).
+        self.timeout = timeout
+        self.retries = retries
+        self.failure_penalty = failure_penalty
+        # The decks whose simulation failed -> its RunResult.
+        self.failures = {}
+        # EvaluationJournal of the campaign, see journal.py: the designs it records as evaluated are skipped.
+        self.journal = journal
+        # Fidelity level, a key of FIDELITY_LEVELS or a dict of the same parameters.
+        self.fidelity = fidelity
+        self._mesh_kwargs, self._model_kwargs = self._fidelity_parameters()
+        # Output profile of the simulations, see OUTPUT_PROFILES: 'objective' writes only the time history the
+        # objectives are computed from, no animation nor other databases.
+        if output_profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Invalid output_profile '{output_profile}', the options are {OUTPUT_PROFILES}")
+        self.output_profile = output_profile
+        # Workspace of the decks, see workspace.py. None: the decks are written under the current working
+        # directory and kept.
+        self.workspace = workspace
+        # JobBroker (or BrokerClient) the simulations are submitted to, see broker.py. None: run them here.
+        self.broker = broker
+        # SolverEnvironment running the starter, engine and converters directly, see environment.py. None: the
+        # batch file runs them.
+        self.environment = environment
 
         # The attributes need to be overwritten in teh subclass
-        self.problem_id = None
         self.variable_ranges = None # constraints of the problem
         self.input_file_name = None # input deck name
         self.output_file_name = None # output result name
+        self.track_node_key = None # the key of the intrusion in the output csv file
+        self.wall_force_key = None # the key of the rigid wall force in the output csv file
+        self.wall_node_key = None # the key of the wall node in the output csv file, the wall force from its deceleration otherwise
 
         # The attributes will be loaded if the function _write_input_file has been called. 
         # Used for mass calculation.
         self.mesh = None
         self.model = None
 
+        # The run id and the directory of the input deck generated last by generate_input_deck.
+        self.run_id = None
+        self.working_dir = None
+
         # The attributes will be loaded if the function run_simulation has been called.
         self.output_data_frame = None
         
         # Universal design variable search space
         self.search_space = (-5.0, 5.0)
 
+    def _fidelity_parameters(self):
+        """
+        Resolve the fidelity level into the parameters of the mesh and of the model.
+
+        Returns:
+            tuple: The keyword arguments of the mesh class and of the model class.
+        """
+        if isinstance(self.fidelity, str):
+            if self.fidelity not in FIDELITY_LEVELS:
+                raise ValueError(f"Invalid fidelity '{self.fidelity}', the options are {list(FIDELITY_LEVELS)}")
+            level = FIDELITY_LEVELS[self.fidelity]
+        else:
+            level = dict(self.fidelity)
+        if not level:
+            return {}, {}
+        if self.mesh_class is None or self.model_class is None:
+            raise ValueError(f"{self.__class__.__name__} only supports the 'high' fidelity")
+
+        mesh_kwargs = {}
+        if 'elsize' in level:
+            # the geometry is kept: extrusion length and trigger height in mm, not in elements
+            defaults = self.mesh_class.default_parameters
+            mesh_kwargs.update(elsize=level['elsize'], extrusion_length=defaults['extrusion_length'],
+                               trigger_height=defaults['trigger_height'])
+        if 'num_elements_line' in level:
+            mesh_kwargs['num_elements_line'] = level['num_elements_line']
+
+        model_kwargs = {}
+        database = self.model_class.database_defaults
+        if 'end_time_scale' in level:
+            model_kwargs['end_time'] = round(database['end_time']*level['end_time_scale'], 6)
+        if 'output_dtime_scale' in level:
+            model_kwargs['database_dtime'] = round(database['database_dtime']*level['output_dtime_scale'], 6)
+            model_kwargs['d3plot_dtime'] = round(database['d3plot_dtime']*level['output_dtime_scale'], 6)
+        if 'consider_d3plot' in level:
+            model_kwargs['consider_d3plot'] = level['consider_d3plot']
+        return mesh_kwargs, model_kwargs
+
+    def _output_kwargs(self):
+        # keyword arguments of the model for the output profile: the 'objective' profile records the rigid wall
+        # force only if the objectives read it
+        if self.output_profile == 'full':
+            return {}
+        databases = list(OBJECTIVE_DATABASES)
+        if self.wall_force_key is not None:
+            databases.append('RWFORC')
+        return {'output_profile': self.output_profile, 'objective_databases': databases}
+
     def _validate_variable_array(self, variable_array):
         """
         Validate the variable array against the search space.
@@ -59,6 +200,32 @@ class OptiProblem():
             if not (lower <= value <= upper):
                 raise ValueError(f"Value at position {i} in variable_array is out of range: {value}. " f"Allowed range is [{lower}, {upper}].")
     
+    def _validate_variable_arrays(self, variable_arrays):
+        """
+        Vectorized counterpart of _validate_variable_array for a batch of designs.
+
+        Parameters:
+            variable_arrays (numpy.ndarray): Variables in the search space, one design per row.
+
+        Raises:
+            ValueError: If the designs are not of the problem dimension or if any variable is out of range.
+        """
+        if self.variable_ranges is None:
+            raise ValueError("variable_ranges must be provided or defined in the subclass.")
+
+        if variable_arrays.ndim != 2:
+            raise ValueError('variable_arrays must be a 2-D array with one design per row')
+        if variable_arrays.shape[1] != self.dimension:
+            raise ValueError('The size of variable array does not match the problem dimension')
+
+        lower, upper = self.search_space
+        # NaN fails both comparisons, so it is out of range as well
+        out_of_range = ~((lower <= variable_arrays) & (variable_arrays <= upper))
+        if out_of_range.any():
+            design, i = np.argwhere(out_of_range)[0]
+            value = variable_arrays[design, i]
+            raise ValueError(f"Value at position {i} in variable_array is out of range: {value}. " f"Allowed range is [{lower}, {upper}].")
+
     def linear_maping_variable(self, search_space_variable, problem_space_range:tuple):
         """
         Map a variable from the search space to the problem space for use in FEM simulation.
@@ -76,56 +243,738 @@ class OptiProblem():
         problem_space_variable = lower + (search_space_variable-self.search_space[0])*scale
         return problem_space_variable
 
-    def generate_input_deck(self, variable_array):
+    def _map_variable_batch(self, variable_arrays):
+        """
+        Map a batch of designs from the search space to the problem space, see linear_maping_variable.
+
+        Parameters:
+            variable_arrays (numpy.ndarray): Variables in the search space, one design per row.
+
+        Returns:
+            numpy.ndarray: Variables mapped to the problem space, one design per row.
+        """
+        fem_space_variable_arrays = np.empty_like(variable_arrays, dtype=float)
+        for i, problem_space_range in enumerate(self.variable_ranges):
+            fem_space_variable_arrays[:, i] = self.linear_maping_variable(variable_arrays[:, i], problem_space_range)
+        return fem_space_variable_arrays
+
+    def _deck_dir(self, run_id):
+        """
+        Create the directory of the deck of a run, with os.mkdir which is atomic, also on a file system shared by
+        several hosts.
+
+        Raises:
+            FileExistsError: The directory already exists, the run id has been claimed by another deck.
+        """
+        dir_name = f'{self.__class__.__name__.lower()}_deck_{run_id}'
+        if self.workspace is not None:
+            return self.workspace.run_dir(dir_name)
+        working_dir = os.path.join(os.getcwd(), dir_name)
+        os.mkdir(working_dir)
+        return working_dir
+
+    def _claim_deck_dir(self, fem_space_variable_array):
+        """
+        Claim the run id and the directory of a new deck of a design. The run id is a hash of the key of the
+        design (see cache.evaluation_key) and of a nonce, the first one whose directory doesn't exist yet: the
+        same design gets the same run ids in the same order in every session, and the threads, processes and
+        hosts sharing the file system never get the same directory.
+
+        Returns:
+            tuple: The run id and the directory of the deck.
+        """
+        key = evaluation_key(self, fem_space_variable_array)
+        for nonce in itertools.count():
+            run_id = hashlib.sha256(f'{key}:{nonce}'.encode()).hexdigest()[:RUN_ID_LENGTH]
+            try:
+                return run_id, self._deck_dir(run_id)
+            except FileExistsError:
+                continue
+
+    def _includes_dir(self):
+        # shared keyword files of the decks, see StarBoxModel.write_shared_includes
+        if not self.shared_includes:
+            return None
+        dir_name = f'{self.__class__.__name__.lower()}_includes'
+        if self.workspace is not None:
+            # on the file system of the decks, they are hard linked
+            return self.workspace.path(dir_name)
+        return os.path.join(os.getcwd(), dir_name)
+
+    def _release(self, working_dir):
+        # the evaluation of the deck is done: harvest and delete its directory if the problem has a workspace
+        if self.workspace is not None:
+            self.workspace.release(working_dir)
+
+    def _map_variable(self, variable_array):
         self._validate_variable_array(variable_array)
 
         fem_space_variable_array = [] # to get the variables in the FEM space
         for i, var in enumerate(variable_array):
             mapped_var = self.linear_maping_variable(var, self.variable_ranges[i])
             fem_space_variable_array.append(mapped_var)
+        return fem_space_variable_array
 
-        original_dir = os.getcwd()
-        dir_name = f'{self.__class__.__name__.lower()}_deck{self.problem_id}'
-        working_dir = os.path.join(os.getcwd(), dir_name)
-        if not os.path.exists(working_dir):
-            os.makedirs(working_dir)
-        os.chdir(working_dir)
-        self._write_input_file(fem_space_variable_array)
-        os.chdir(original_dir)
+    def generate_input_deck(self, variable_array):
+        """
+        Write the input deck of a design into a new directory, <problem>_deck_<run id>, see _claim_deck_dir.
+        The run id is kept in self.run_id.
 
-        self.problem_id += 1 # update the problem id for the input deck generation
+        Returns:
+            str: The directory of the input deck.
+        """
+        return self._generate_input_deck(variable_array)[1]
+
+    def _generate_input_deck(self, variable_array):
+        # run id and directory of the new deck, safe to call from several threads
+        fem_space_variable_array = self._map_variable(variable_array)
+        run_id, working_dir = self._claim_deck_dir(fem_space_variable_array)
+        self._write_input_file(fem_space_variable_array, working_dir)
+
+        self.run_id, self.working_dir = run_id, working_dir
+        return run_id, working_dir
         
 
-    def _write_input_file(self, fem_space_variable_array):
+    def _write_input_file(self, fem_space_variable_array, working_dir):
         raise NotImplementedError("Subclasses must implement _write_input_file method")
-    
-    def run_simulation(self):
+
+    def _solve(self, working_dir, nt=None, nmpi=None, objective_only=False, monitor=None, timeout=None):
+        """
+        Run OpenRadioss on the input deck in working_dir and load the simulation result.
+
+        Parameters:
+            working_dir (str): Directory of the input deck.
+            nt (int): Number of OpenMP threads per MPI process. Default: self.nt.
+            nmpi (int): Number of MPI processes. Default: self.nmpi.
+            objective_only (bool): Load only the columns the intrusion is computed from, see _load_output.
+            monitor (RunMonitor): Monitor stopping the run early, see _monitor. Default: run to the end time.
+            timeout (float): Wall-clock limit of the run in seconds. Default: self.timeout.
+
+        Returns:
+            pandas.DataFrame: The simulation result, with spaces removed from the column names and the timings of
+            the run in attrs['timings'] (see RunResult.timings). None if the run
+            has been stopped early and killed before its time history was converted, or if the run failed (it is
+            recorded in self.failures, and SimulationError is raised without failure_penalty).
+        """
+        run = run_radioss(self._input_file_path(working_dir), self.batch_file_path, nt=nt or self.nt, np=nmpi or self.nmpi,
+                          sp=self.sp, monitor=monitor, timeout=timeout or self.timeout, retries=self.retries,
+                          environment=self.environment)
+        return self._solved(working_dir, run, objective_only, monitor)
+
+    async def _asolve(self, working_dir, nt=None, nmpi=None, objective_only=False, timeout=None):
+        # asynchronous counterpart of _solve without monitor: the run is awaited as RadiossJobs (see
+        # solver.arun_radioss), the simulation result is loaded in the default executor
+        run = await arun_radioss(self._input_file_path(working_dir), self.batch_file_path, nt=nt or self.nt,
+                                 np=nmpi or self.nmpi, sp=self.sp, timeout=timeout or self.timeout, retries=self.retries)
+        return await asyncio.get_running_loop().run_in_executor(None, self._solved, working_dir, run, objective_only)
+
+    def _input_file_path(self, working_dir):
         if self.input_file_name is None:
             raise ValueError("input_file_name must be provided or defined in the subclass.")
-        # make problem id back to original, since it has been updated when generate_input_deck has been called
-        self.problem_id -= 1
-        dir_name = f'{self.__class__.__name__.lower()}_deck{self.problem_id}'
-        working_dir = os.path.join(os.getcwd(), dir_name)
-        input_file_path = os.path.join(working_dir, self.input_file_name)
-        run_radioss(input_file_path, self.batch_file_path)
-        # load simulation result dataframe and make it cleaner
+        return os.path.join(working_dir, self.input_file_name)
+
+    def _solved(self, working_dir, run, objective_only=False, monitor=None):
+        # simulation result of a terminated run, see _solve
+        if not run.ok:
+            return self._failed(working_dir, run)
+        if monitor is not None and monitor.stopped is not None:
+            self.early_stops[working_dir] = monitor.stopped
+            if not os.path.exists(os.path.join(working_dir, self.output_file_name)):
+                return None
+        output_data_frame = self._load_output(working_dir, objective_only)
+        output_data_frame.attrs['timings'] = run.timings
+        return output_data_frame
+
+    def _failed(self, working_dir, run):
+        # record a failed run, raise SimulationError without failure_penalty
+        self.failures[working_dir] = run
+        if self.failure_penalty is None:
+            raise SimulationError(run)
+        return None
+
+    def _failed_result(self, working_dir, run_id):
+        # evaluation and simulation result of a design whose run failed: the penalty, and an empty time history
+        # with the RunResult in attrs['failed']
+        output_data_frame = pd.DataFrame()
+        output_data_frame.attrs['failed'] = self.failures[working_dir]
+        output_data_frame.attrs['run_id'] = run_id
+        return self.failure_penalty, output_data_frame
+
+    def _monitor(self, working_dir):
+        # RunMonitor of the simulation of the deck in working_dir, None without stop criteria
+        if not self.stop_criteria:
+            return None
+        impactor = getattr(self.model_class, 'impactor_defaults', {})
+        wall_mass, wall_vel = impactor.get('wall_mass'), impactor.get('wall_vel')
+        initial_energy = None if wall_mass is None else wall_mass*wall_vel**2/2
+        return RunMonitor(os.path.join(working_dir, self.input_file_name), self.stop_criteria,
+                          wall_mass=wall_mass, initial_energy=initial_energy)
+
+    def _load_output(self, working_dir, objective_only=False):
+        # load simulation result dataframe, with the column names cleaned, see history.load_time_history
+        # objective_only: the first column (time) and the ones of the tracked node and of the wall force only
         output_file_path = os.path.join(working_dir, self.output_file_name)
-        self.output_data_frame = pd.read_csv(output_file_path)
-        self.output_data_frame.columns = self.output_data_frame.columns.str.replace(' ', '')
-        # update problem id again
-        self.problem_id += 1
+        usecols = None
+        if objective_only and self.track_node_key is not None:
+            header = read_header(output_file_path)
+            keys = [key for key in [self.track_node_key, self.wall_force_key, self.wall_node_key] if key is not None]
+            usecols = header[:1] + [name for name in header[1:] if any(key in name for key in keys)]
+        return load_time_history(output_file_path, usecols=usecols)
+    
+    def run_simulation(self, working_dir=None, nt=None, nmpi=None):
+        """
+        Run the simulation of an input deck, by default the one generated last by generate_input_deck.
+        """
+        if working_dir is None:
+            if self.working_dir is None:
+                raise ValueError("No input deck has been generated, call generate_input_deck first.")
+            working_dir = self.working_dir
+        self.output_data_frame = self._solve(working_dir, nt, nmpi)
+
+    def _simulate(self, variable_array, nt=None, nmpi=None, timeout=None):
+        """
+        Evaluate the intrusion of a design, from the cache if the design has already been simulated.
+
+        Parameters:
+            variable_array (list): The variables in the search space.
+            nt (int): Number of OpenMP threads per MPI process. Default: self.nt.
+            nmpi (int): Number of MPI processes. Default: self.nmpi.
+            timeout (float): Wall-clock limit of the run in seconds. Default: self.timeout.
+
+        Returns:
+            tuple: The intrusion and the simulation result (pandas.DataFrame of the time and the columns of the
+            tracked node). A simulation stopped early by the stop criteria is recorded in self.early_stops, its
+            intrusion is the one reached when it was stopped (estimated from the monitor if the run had to be
+            killed, the simulation result is None then), and it isn't cached. A design whose run failed is
+            evaluated to failure_penalty and isn't cached either, and so is a design whose deck doesn't fit in the
+            quota of the workspace. With a workspace, the directory of the deck is released once the simulation
+            result is loaded, see Workspace.release. The run id of the deck is in
+            the attrs['run_id'] of the simulation result.
+        """
+        key, run_id, working_dir, evaluation = self._prepare_simulation(variable_array)
+        if evaluation is not None:
+            return evaluation
+        monitor = self._monitor(working_dir)
+        try:
+            output_data_frame = self._solve(working_dir, nt, nmpi, objective_only=True, monitor=monitor, timeout=timeout)
+        finally:
+            self._release(working_dir)
+        return self._simulation_result(key, run_id, working_dir, output_data_frame, monitor)
+
+    async def _asimulate(self, variable_array, nt=None, nmpi=None, timeout=None):
+        # asynchronous counterpart of _simulate without stop criteria: the deck is generated in the default
+        # executor and the run is awaited, see _asolve
+        loop = asyncio.get_running_loop()
+        key, run_id, working_dir, evaluation = await loop.run_in_executor(None, self._prepare_simulation, variable_array)
+        if evaluation is not None:
+            return evaluation
+        try:
+            output_data_frame = await self._asolve(working_dir, nt, nmpi, objective_only=True, timeout=timeout)
+        finally:
+            self._release(working_dir)
+        return self._simulation_result(key, run_id, working_dir, output_data_frame)
+
+    def _prepare_simulation(self, variable_array):
+        """
+        Look up the cache and, on a miss, generate the deck of a design and record its start in the journal.
+
+        Returns:
+            tuple: The cache key, the run id and the directory of the deck, and the evaluation and simulation
+            result of a design which isn't run (cached, or failed for lack of room in the workspace), None
+            otherwise.
+        """
+        key, cached = self._cache_lookup(variable_array)
+        if cached is not None:
+            return key, None, None, cached
+        try:
+            run_id, working_dir = self._generate_input_deck(variable_array)
+        except OSError as e:
+            if e.errno != errno.ENOSPC or self.workspace is None:
+                raise
+            # no room for the deck within the quota of the workspace: a failed run, see Workspace.run_dir
+            working_dir = e.filename
+            self._failed(working_dir, RunResult(os.path.join(working_dir, self.input_file_name), 'error', message=str(e)))
+            return key, None, working_dir, self._failed_result(working_dir, None)
+        if self.journal is not None:
+            fem_space_variable_array = self._map_variable(variable_array)
+            self.journal.start(self.journal.key(self, fem_space_variable_array), variable_array,
+                               fem_space_variable_array, working_dir, run_id)
+        return key, run_id, working_dir, None
+
+    def _simulation_result(self, key, run_id, working_dir, output_data_frame, monitor=None):
+        # intrusion and simulation result of a terminated run, cached unless it failed or was stopped early
+        if working_dir in self.failures:
+            return self._failed_result(working_dir, run_id)
+        if output_data_frame is None:
+            if self._is_multi_objective() and self.failure_penalty is None and self._needs_history():
+                # the other outputs can't be computed without the time history
+                run = RunResult(os.path.join(working_dir, self.input_file_name), 'stopped',
+                                message=f'{self.early_stops[working_dir]}: killed before its time history was written')
+                self._failed(working_dir, run)
+            return monitor.intrusion(), None
+        output_data_frame.attrs['run_id'] = run_id
+        result = self._intrusion(output_data_frame)
+        if working_dir in self.early_stops:
+            output_data_frame.attrs['stopped'] = self.early_stops[working_dir]
+        elif key is not None:
+            self.cache.put(key, result, output_data_frame)
+        return result, output_data_frame
+
+    def _cache_lookup(self, variable_array):
+        """
+        Returns:
+            tuple: The cache key of the design (None without cache) and the cached (result, output_data_frame) or None.
+        """
+        if self.cache is None or not self.cache.enabled:
+            return None, None
+        key = self.cache.key(self, self._map_variable(variable_array))
+        return key, self.cache.get(key)
+
+    def _is_multi_objective(self):
+        return isinstance(self.output_data, (list, tuple))
+
+    def spec(self):
+        """
+        Returns:
+            dict: What a worker needs to build this problem on its own machine, see worker.problem_from_spec: the
+            problem type, dimension, output data and the options of the simulations. The batch file, cache,
+            journal, workspace, solver environment and stop criteria (functions) are the worker's own.
+        """
+        output_data = list(self.output_data) if self._is_multi_objective() else self.output_data
+        options = {name: getattr(self, name) for name in SPEC_OPTIONS}
+        return {'problem': self.__class__.__name__, 'dimension': self.dimension, 'output_data': output_data,
+                'options': options}
+
+    def _needs_simulation(self):
+        if self._is_multi_objective():
+            return any(needs_simulation(name) for name in self.output_data)
+        return self.output_data == 'intrusion'
+
+    def _evaluate_simulated(self, variable_array, nt=None, nmpi=None, timeout=None):
+        """
+        Evaluate the output data of a design which needs a simulation, recording the evaluation in the journal.
+
+        Returns:
+            tuple: The evaluation (a vector for a list of output data) and the simulation result, None if the
+            evaluation is read from the journal.
+        """
+        evaluate = self._evaluate_objectives if self._is_multi_objective() else self._simulate
+        if self.broker is not None:
+            evaluate = self._evaluate_remote
+        if self.journal is None:
+            return evaluate(variable_array, nt, nmpi, timeout)
+        key, journaled = self._journal_lookup(variable_array)
+        if journaled is not None:
+            return journaled
+        start = time.perf_counter()
+        try:
+            result, output_data_frame = evaluate(variable_array, nt, nmpi, timeout)
+        except Exception as e:
+            self.journal.finish(key, 'error', runtime=time.perf_counter() - start, message=str(e))
+            raise
+        self.journal.finish(key, self._run_status(output_data_frame), result, time.perf_counter() - start)
+        return result, output_data_frame
+
+    async def _aevaluate_simulated(self, variable_array, nt=None, nmpi=None, timeout=None):
+        # asynchronous counterpart of _evaluate_simulated, for a problem without broker, solver environment nor
+        # stop criteria, see acall
+        loop = asyncio.get_running_loop()
+        evaluate = self._aevaluate_objectives if self._is_multi_objective() else self._asimulate
+        if self.journal is None:
+            return await evaluate(variable_array, nt, nmpi, timeout)
+        key, journaled = await loop.run_in_executor(None, self._journal_lookup, variable_array)
+        if journaled is not None:
+            return journaled
+        start = time.perf_counter()
+        try:
+            result, output_data_frame = await evaluate(variable_array, nt, nmpi, timeout)
+        except Exception as e:
+            self.journal.finish(key, 'error', runtime=time.perf_counter() - start, message=str(e))
+            raise
+        self.journal.finish(key, self._run_status(output_data_frame), result, time.perf_counter() - start)
+        return result, output_data_frame
+
+    def _evaluate_remote(self, variable_array, nt=None, nmpi=None, timeout=None):
+        """
+        Evaluate the output data of a design on a worker: submit it to the broker and wait for its job, see
+        broker.wait_all.
+
+        Returns:
+            tuple: The evaluation and the simulation result: the time history sent back by the worker (empty if
+            the job didn't ask for it), with the run id and the worker in attrs. A failed or stopped run is
+            recorded in self.failures or self.early_stops under the directory of its deck on the worker, and
+            SimulationError is raised for a run which failed without failure_penalty.
+        """
+        key, cached = self._cache_lookup(variable_array)
+        if cached is not None:
+            return self._cached_evaluation(variable_array, cached)
+        job_id = self._submit(self.spec(), variable_array, nt, nmpi)
+        job = next(wait_all(self.broker, [job_id], stale_after=self._stale_after()))
+        return self._remote_evaluation(job, variable_array, key)
+
+    def _evaluate_remote_batch(self, variable_arrays, nt=None, nmpi=None):
+        """
+        Evaluate the output data of a batch of designs on the workers: submit all the designs which aren't in
+        the journal nor in the cache at once, then collect their jobs in a single polling loop which queues
+        again the jobs of the workers which died, see broker.wait_all.
+
+        Returns:
+            list: The evaluation and the simulation result of each design, see _evaluate_remote.
+
+        Raises:
+            TimeoutError: Jobs aren't finished after the timeout of the broker.
+            SimulationError, RuntimeError: The first design whose evaluation failed, once all the jobs are collected.
+        """
+        spec = self.spec()
+        evaluations = [None]*len(variable_arrays)
+        # job id -> index, design, cache key, journal key and submission time
+        jobs = {}
+        for index, variable_array in enumerate(variable_arrays):
+            journal_key = None
+            if self.journal is not None:
+                journal_key, evaluations[index] = self._journal_lookup(variable_array)
+                if evaluations[index] is not None:
+                    continue
+            key, cached = self._cache_lookup(variable_array)
+            if cached is not None:
+                evaluations[index] = self._cached_evaluation(variable_array, cached)
+                if journal_key is not None:
+                    self.journal.finish(journal_key, self._run_status(evaluations[index][1]), evaluations[index][0], 0.0)
+                continue
+            job_id = self._submit(spec, variable_array, nt, nmpi)
+            jobs[job_id] = (index, variable_array, key, journal_key, time.perf_counter())
+
+        error = None
+        for job in wait_all(self.broker, list(jobs), stale_after=self._stale_after()):
+            index, variable_array, key, journal_key, start = jobs[job['id']]
+            try:
+                evaluations[index] = self._remote_evaluation(job, variable_array, key)
+            except Exception as e:
+                if journal_key is not None:
+                    self.journal.finish(journal_key, 'error', runtime=time.perf_counter() - start, message=str(e))
+                error = error or e
+                continue
+            if journal_key is not None:
+                result, output_data_frame = evaluations[index]
+                self.journal.finish(journal_key, self._run_status(output_data_frame), result, time.perf_counter() - start)
+        if error is not None:
+            raise error
+        return evaluations
+
+    def _submit(self, spec, variable_array, nt=None, nmpi=None):
+        """
+        Submit a design to the broker and record its job in the journal. The job of a design which a previous
+        session left in flight is waited for again instead of being submitted twice (if its worker died, it is
+        queued again by wait_all), unless the broker doesn't know it or cancelled it.
+
+        Returns:
+            int: The id of the job.
+        """
+        job_id = None
+        if self.journal is not None:
+            fem_space_variable_array = self._map_variable(variable_array)
+            key = self.journal.key(self, fem_space_variable_array)
+            record = self.journal.in_flight(key)
+            if record is not None and record.get('job_id') is not None and self._job_resumable(record['job_id']):
+                job_id = record['job_id']
+        if job_id is None:
+            job_id = self.broker.submit(spec, variable_array, nt or self.nt, nmpi or self.nmpi)
+        if self.journal is not None:
+            self.journal.start(key, variable_array, fem_space_variable_array, job_id=job_id)
+        return job_id
+
+    def _job_resumable(self, job_id):
+        # whether the broker still has a job which wasn't cancelled, see broker.JobBroker.cancel
+        try:
+            job = self.broker.get(job_id)
+        except (KeyError, RuntimeError):
+            return False
+        return not (job['status'] == 'failed' and job['result'] == {'message': 'cancelled'})
+
+    def _stale_after(self):
+        # seconds after which a running job is queued again: the broker's, else the longest a live worker may
+        # spend on it (every attempt killed at the timeout). None (never) without either.
+        if self.broker.stale_after is not None:
+            return self.broker.stale_after
+        if self.timeout is not None:
+            return self.timeout*(self.retries + 1) + STALE_MARGIN
+        return None
+
+    def _cached_evaluation(self, variable_array, cached):
+        result, output_data_frame = cached
+        if self._is_multi_objective():
+            result = self._objective_vector(variable_array, output_data_frame)
+        return result, output_data_frame
+
+    def _remote_evaluation(self, job, variable_array, key):
+        # evaluation and simulation result of a finished job, see _evaluate_remote
+        report = job['result']
+        if job['status'] == 'failed':
+            if report.get('run') is not None:
+                run = RunResult.from_dict(report['run'])
+                self.failures[run.input_file_path] = run
+                raise SimulationError(run)
+            raise RuntimeError(f"Job {job['id']} failed on worker {report.get('worker')}: {report.get('message')}")
+
+        output_data_frame = load_history(job['history'])
+        if output_data_frame is None:
+            output_data_frame = pd.DataFrame()
+        output_data_frame.attrs['run_id'] = report['run_id']
+        output_data_frame.attrs['worker'] = report['worker']
+        output_data_frame.attrs['timings'] = report['timings']
+        if report['run'] is not None:
+            self.failures[report['working_dir']] = output_data_frame.attrs['failed'] = RunResult.from_dict(report['run'])
+        elif report['status'] == 'stopped':
+            self.early_stops[report['working_dir']] = output_data_frame.attrs['stopped'] = report['stopped']
+        elif key is not None and not output_data_frame.empty:
+            self.cache.put(key, self._intrusion(output_data_frame), output_data_frame)
+        result = report['objective']
+        return (np.array(result) if self._is_multi_objective() else result), output_data_frame
+
+    def _journal_lookup(self, variable_array):
+        """
+        Returns:
+            tuple: The journal key of the design and, if the journal records it as evaluated or its job started
+            by a previous session has finished meanwhile (it is reattached), the evaluation and the simulation
+            result (None from the journal). None otherwise: the design is evaluated, or run again if it was in
+            flight (with a broker, its job is waited for again, see _submit).
+        """
+        key = self.journal.key(self, self._map_variable(variable_array))
+        record = self.journal.completed(key)
+        if record is not None:
+            objective = record['objective']
+            return key, (np.array(objective) if self._is_multi_objective() else objective, None)
+        record = self.journal.in_flight(key)
+        if record is not None:
+            output_data_frame = self._reattach(record['working_dir'])
+            if output_data_frame is not None:
+                if self._is_multi_objective():
+                    result = self._objective_vector(variable_array, output_data_frame)
+                else:
+                    result = self._intrusion(output_data_frame)
+                self.journal.finish(key, 'ok', result, message='reattached')
+                return key, (result, output_data_frame)
+        return key, None
+
+    def _reattach(self, working_dir):
+        # simulation result of a deck whose job has terminated normally, None if it is missing or still running
+        if working_dir is None:
+            return None
+        input_file_path = os.path.join(working_dir, self.input_file_name)
+        listing_path = run_files(input_file_path)['listing']
+        if os.path.exists(listing_path) and termination_status(input_file_path) != 'normal':
+            return None
+        if not os.path.exists(os.path.join(working_dir, self.output_file_name)):
+            return None
+        return self._load_output(working_dir, objective_only=True)
+
+    def _run_status(self, output_data_frame):
+        # status of an evaluation for the journal
+        if output_data_frame is None or 'stopped' in output_data_frame.attrs:
+            return 'stopped'
+        if 'failed' in output_data_frame.attrs:
+            return 'failed'
+        return 'ok'
+
+    def _needs_history(self):
+        # whether outputs other than the intrusion are computed from the time history
+        return any(needs_simulation(name) for name in self.output_data if name != 'intrusion')
+
+    def _objective_vector(self, variable_array, output_data_frame, intrusion_estimate=None):
+        # the outputs of self.output_data, computed from the same simulation result, see objectives.py
+        # the outputs which need a simulation are failure_penalty if the run failed; for a run stopped and killed
+        # before its time history was written (intrusion_estimate from the monitor), the intrusion is the
+        # estimate and the other outputs which need a simulation are failure_penalty
+        fem_space_variable_array = np.asarray(self._map_variable(variable_array), dtype=float)
+        if output_data_frame is None and intrusion_estimate is not None:
+            return np.array([intrusion_estimate if name == 'intrusion' else
+                             self.failure_penalty if needs_simulation(name) else
+                             OBJECTIVES[name][0](self, fem_space_variable_array, None) for name in self.output_data])
+        failed = output_data_frame is not None and 'failed' in output_data_frame.attrs
+        return np.array([self.failure_penalty if failed and needs_simulation(name) else
+                         OBJECTIVES[name][0](self, fem_space_variable_array, output_data_frame) for name in self.output_data])
+
+    def _evaluate_objectives(self, variable_array, nt=None, nmpi=None, timeout=None):
+        """
+        Evaluate the list of output data of a design, running at most one simulation.
+
+        Parameters:
+            variable_array (list): The variables in the search space.
+            nt (int): Number of OpenMP threads per MPI process. Default: self.nt.
+            nmpi (int): Number of MPI processes. Default: self.nmpi.
+            timeout (float): Wall-clock limit of the run in seconds. Default: self.timeout.
+
+        Returns:
+            tuple: The outputs (numpy.ndarray, in the order of self.output_data) and the simulation result
+            (None if none of the outputs needs a simulation, or if the run was stopped early and killed before
+            its time history was written: the intrusion is then estimated by the monitor, and the other outputs
+            which need a simulation are failure_penalty, SimulationError is raised without failure_penalty).
+        """
+        if not any(needs_simulation(name) for name in self.output_data):
+            return self._objective_vector(variable_array, None), None
+        return self._objectives_of_run(variable_array, *self._simulate(variable_array, nt, nmpi, timeout))
+
+    async def _aevaluate_objectives(self, variable_array, nt=None, nmpi=None, timeout=None):
+        # asynchronous counterpart of _evaluate_objectives, see _asimulate
+        return self._objectives_of_run(variable_array, *await self._asimulate(variable_array, nt, nmpi, timeout))
+
+    def _objectives_of_run(self, variable_array, intrusion, output_data_frame):
+        # outputs of a design from its simulation, see _evaluate_objectives
+        if output_data_frame is None:
+            return self._objective_vector(variable_array, None, intrusion), None
+        return self._objective_vector(variable_array, output_data_frame), output_data_frame
+
+    def _intrusion(self, output_data_frame):
+        matching_columns = [col for col in output_data_frame.columns if self.track_node_key in col]
+        return peak_abs(output_data_frame[matching_columns[2]])
+
+    def _evaluate_analytic_batch(self, fem_space_variable_arrays, output_data=None):
+        """
+        Evaluate 'mass' or 'absorbed_energy' of a batch of designs in one vectorized pass, without generating any input deck.
+
+        Parameters:
+            fem_space_variable_arrays (numpy.ndarray): Variables in the FEM space, one design per row.
+            output_data (str): 'mass' or 'absorbed_energy'. Default: self.output_data.
+
+        Returns:
+            numpy.ndarray: The evaluation of each design.
+        """
+        output_data = output_data or self.output_data
+        if self.mesh_class is None or self.model_class is None:
+            raise NotImplementedError(f"{self.__class__.__name__} doesn't support the evaluation of '{output_data}' without simulation")
+        if output_data == 'mass' and self.mass_mode == 'mesh':
+            # meshed in memory, still without writing any input deck
+            return np.array([self.model_class(self.mesh_class(fem_space_variable_array, **self._mesh_kwargs), mass_mode='mesh').mass()
+                             for fem_space_variable_array in fem_space_variable_arrays])
+        elif output_data == 'mass':
+            volume = self.mesh_class.batch_volume(fem_space_variable_arrays, **self._mesh_kwargs)
+            return volume*self.model_class.material_defaults['mat_density']
+        elif output_data == 'absorbed_energy':
+            # initial kinetic energy, the design variables don't influence the mass and velocity of the wall
+            impactor = self.model_class.impactor_defaults
+            return np.full(len(fem_space_variable_arrays), impactor['wall_mass']*impactor['wall_vel']**2/2)
+        else:
+            raise ValueError(f"'{output_data}' can't be evaluated without simulation")
+
+    def evaluate_batch(self, variable_arrays, max_jobs=None, cores_per_job=None, return_run_ids=False):
+        """
+        Evaluate a batch of designs, e.g. the population of one generation of a population-based optimizer.
+
+        For 'mass' and 'absorbed_energy' no input deck is generated and the solver is skipped, the whole batch
+        is computed in one vectorized pass. For 'intrusion' the input deck generation and the OpenRadioss job
+        of each design are run on a bounded thread pool, and so are they for a list of output data which needs
+        a simulation.
+
+        Parameters:
+            variable_arrays (array-like): 2-D array of variables in the search space, one design per row.
+            max_jobs (int): Maximum number of OpenRadioss jobs running at the same time.
+                Default: the number of CPU cores divided by the cores per job. With a broker, max_jobs is
+                ignored: all the designs are submitted at once and collected in one polling loop, the workers
+                bound the number of jobs running (see _evaluate_remote_batch).
+            cores_per_job (int): Number of OpenMP threads given to each OpenRadioss job (with one MPI process).
+                Default: self.nt threads and self.nmpi MPI processes.
+                If neither max_jobs nor cores_per_job are given and auto_tune is set, the split of cores which
+                maximized the throughput in calibrate_throughput is used, if this machine has been calibrated.
+            return_run_ids (bool): Also return the run id of the deck of each design, see generate_input_deck.
+
+        Returns:
+            numpy.ndarray: The evaluation of each design, in the order of the input rows (one row of outputs per
+            design for a list of output data). With return_run_ids, a tuple of the evaluations and the list of
+            the run ids, None for the designs which haven't been simulated (no simulation needed, or read from the
+            cache or the journal).
+        """
+        variable_arrays = np.atleast_2d(np.asarray(variable_arrays, dtype=float))
+        self._validate_variable_arrays(variable_arrays)
+
+        # the evaluations which don't need a simulation
+        results = None
+        if self._is_multi_objective():
+            if not any(needs_simulation(name) for name in self.output_data):
+                results = np.array([self._evaluate_objectives(variable_array)[0] for variable_array in variable_arrays])
+        elif self.output_data in ['mass', 'absorbed_energy']:
+            results = self._evaluate_analytic_batch(self._map_variable_batch(variable_arrays))
+        elif self.output_data != 'intrusion':
+            results = np.full(len(variable_arrays), None)
+        if results is not None:
+            return (results, [None]*len(results)) if return_run_ids else results
+
+        nt, nmpi = self.nt, self.nmpi
+        if cores_per_job is not None:
+            nt, nmpi = cores_per_job, 1
+        if self.broker is not None:
+            # the workers bound the number of simulations running at the same time
+            evaluations = self._evaluate_remote_batch(variable_arrays, nt, nmpi)
+        else:
+            if max_jobs is None and cores_per_job is None and self.auto_tune:
+                split = best_split(self.__class__.__name__, self.fidelity)
+                if split is not None:
+                    nt, nmpi, max_jobs = split['nt'], split['nmpi'], split['max_jobs']
+            if max_jobs is None:
+                max_jobs = max(1, (os.cpu_count() or 1) // (nt*nmpi))
+            with ThreadPoolExecutor(max_workers=max_jobs) as pool:
+                # deck generation of one design overlaps with the simulations of the others
+                evaluations = list(pool.map(lambda variable_array: self._evaluate_simulated(variable_array, nt, nmpi), variable_arrays))
+        results = np.array([result for result, _ in evaluations])
+        if return_run_ids:
+            run_ids = [None if output_data_frame is None else output_data_frame.attrs.get('run_id')
+                       for _, output_data_frame in evaluations]
+            return results, run_ids
+        return results
+
+    async def acall(self, variable_array, nt=None, nmpi=None, timeout=None):
+        """
+        Asynchronous counterpart of __call__, for drivers keeping many evaluations in flight in one event loop.
+
+        The evaluation goes through the same path as __call__: cache, journal, supervision of the run (timeout,
+        retries, failure check) and failure_penalty. The input deck is generated in the default executor of the
+        event loop and OpenRadioss is run as RadiossJobs awaited from the event loop (see solver.arun_radioss), so
+        the number of simulations in flight isn't bounded by threads; cancelling the task kills the run. With a
+        broker, a solver environment or stop criteria (whose RunMonitor watches the process from a thread), the
+        whole evaluation is run in the default executor instead.
+
+        Parameters:
+            variable_array (list): The variables in the search space.
+            nt (int): Number of OpenMP threads per MPI process. Default: self.nt.
+            nmpi (int): Number of MPI processes. Default: self.nmpi.
+            timeout (float): Wall-clock limit of the simulation in seconds, the job is killed when it is
+                exceeded. Default: self.timeout (with a broker, the timeout of the problem is always used).
+
+        Returns:
+            The evaluation of the design, as returned by __call__. A failed run is handled as by __call__:
+            failure_penalty, or SimulationError.
+        """
+        loop = asyncio.get_running_loop()
+        if not self._needs_simulation():
+            return await loop.run_in_executor(None, self, variable_array)
+        if self.broker is not None or self.environment is not None or self.stop_criteria:
+            result, self.output_data_frame = await loop.run_in_executor(None, self._evaluate_simulated, variable_array,
+                                                                        nt, nmpi, timeout)
+        else:
+            result, self.output_data_frame = await self._aevaluate_simulated(variable_array, nt, nmpi, timeout)
+        return result
 
     def __call__(self, variable_array):
+        if self._is_multi_objective():
+            # one simulation for all the outputs which need one
+            if self._needs_simulation():
+                result, self.output_data_frame = self._evaluate_simulated(variable_array)
+            else:
+                result, self.output_data_frame = self._evaluate_objectives(variable_array)
+            return result
+
+        if self.output_data == 'intrusion':
+            result, self.output_data_frame = self._evaluate_simulated(variable_array)
+            return result
+
+        if self.output_data in ['mass', 'absorbed_energy'] and self.mesh_class is not None:
+            # computed from the mapped variables, without generating the input deck
+            return self.evaluate_batch([variable_array])[0]
+
         self.generate_input_deck(variable_array)
         if self.output_data == 'mass':
             result = self.model.mass()
         elif self.output_data == 'absorbed_energy':
             result = self.model.absorbed_energy()
-        elif self.output_data == 'intrusion':
-            self.run_simulation()
-            matching_columns = [col for col in self.output_data_frame.columns if self.track_node_key in col]
-            max_z = max(self.output_data_frame[matching_columns[2]], key=abs)
-            return abs(max_z)
         else:
             result = None
         
@@ -133,9 +982,10 @@ class OptiProblem():
 
 
 class StarBox(OptiProblem):
-    instance_counter = 1
-    def __init__(self, dimension, output_data, batch_file_path) -> None:
-        super().__init__(dimension, output_data, batch_file_path)
+    mesh_class = StarBoxMesh
+    model_class = StarBoxModel
+    def __init__(self, dimension, output_data, batch_file_path, **kwargs) -> None:
+        super().__init__(dimension, output_data, batch_file_path, **kwargs)
         # 1 -> square
         # 2 -> rectangular
         # 3 -> rectangular with varying thickness
@@ -152,19 +1002,24 @@ class StarBox(OptiProblem):
         self.input_file_name = 'combine.k'
         self.output_file_name = 'combineT01.csv'
         self.track_node_key = 'DATABASE_HISTORY_NODE1001' # the key of the intrusion in the output csv file
+        self.wall_force_key = 'DATABASE_RWFORC' # the key of the rigid wall force in the output csv file
+        self.wall_node_key = 'DATABASE_HISTORY_NODE999999' # the key of the wall node in the output csv file
 
-        self.problem_id = StarBox.instance_counter
-        StarBox.instance_counter+=1
-
-    def _write_input_file(self, fem_space_variable_array):
-        self.mesh = StarBoxMesh(fem_space_variable_array) 
-        self.model = StarBoxModel(self.mesh)
-        self.model.write_input_files()
+    def _write_input_file(self, fem_space_variable_array, working_dir):
+        mesh = StarBoxMesh(fem_space_variable_array, **self._mesh_kwargs)
+        model = StarBoxModel(mesh, mass_mode=self.mass_mode, **self._model_kwargs, **self._output_kwargs())
+        model.write_input_files(working_dir, self._includes_dir())
+        self.mesh, self.model = mesh, model
     
 
 class ThreePointBending(OptiProblem):
-    def __init__(self, dimension, output_data, batch_file_path) -> None:
-        super().__init__(dimension, output_data, batch_file_path)
+    def __init__(self, dimension, output_data, batch_file_path, **kwargs) -> None:
+        # the base deck writes no time history of a tracked node nor of a rigid wall, and the model has no mass
+        # nor absorbed energy: the problem only generates input decks, see generate_input_deck
+        if output_data is not None:
+            raise ValueError(f"Output data {output_data!r} isn't supported by ThreePointBending, which only "
+                             f"generates input decks: pass output_data=None")
+        super().__init__(dimension, output_data, batch_file_path, **kwargs)
         # 1 -> all 5 shell thickness vary with same value. 
         # 2 -> only first and the last shell thickness vary, other fixed with middle value. 
         # 3 -> the first, middle, and last shell thickness vary. 
@@ -181,10 +1036,16 @@ class ThreePointBending(OptiProblem):
         self.input_file_name = 'ThreePointBending_0000.rad'
         self.output_file_name = 'ThreePointBendingT01.csv'
 
+    def _write_input_file(self, fem_space_variable_array, working_dir):
+        model = ThreePointBendingModel(fem_space_variable_array, output_profile=self.output_profile)
+        model.write_input_files(working_dir)
+        self.model = model
+
 class CrashTube(OptiProblem):
-    instance_counter = 1
-    def __init__(self, dimension, output_data, batch_file_path) -> None:
-        super().__init__(dimension, output_data, batch_file_path)
+    mesh_class = CrashTubeMesh
+    model_class = CrashTubeModel
+    def __init__(self, dimension, output_data, batch_file_path, **kwargs) -> None:
+        super().__init__(dimension, output_data, batch_file_path, **kwargs)
         # 2 -> three positions and depths vary together with same value. 
         # 3 -> all three trigger positions fixed, the three trigger depth vary. 
         # 4 -> except for middle trigger position and depth, other 4 vary ().
@@ -201,11 +1062,11 @@ class CrashTube(OptiProblem):
         self.input_file_name = 'combine.k'
         self.output_file_name = 'combineT01.csv'
         self.track_node_key = 'DATABASE_HISTORY_NODE1001' # the key of the intrusion in the output csv file
+        self.wall_force_key = 'DATABASE_RWFORC' # the key of the rigid wall force in the output csv file
+        self.wall_node_key = 'DATABASE_HISTORY_NODE999999' # the key of the wall node in the output csv file
 
-        self.problem_id = CrashTube.instance_counter
-        CrashTube.instance_counter+=1
-
-    def _write_input_file(self, fem_space_variable_array):
-        self.mesh = CrashTubeMesh(fem_space_variable_array) 
-        self.model = CrashTubeModel(self.mesh)
-        self.model.write_input_files()
\ No newline at end of file
+    def _write_input_file(self, fem_space_variable_array, working_dir):
+        mesh = CrashTubeMesh(fem_space_variable_array, **self._mesh_kwargs)
+        model = CrashTubeModel(mesh, mass_mode=self.mass_mode, **self._model_kwargs, **self._output_kwargs())
+        model.write_input_files(working_dir, self._includes_dir())
+        self.mesh, self.model = mesh, model
\ No newline at end of file
@@ -1,22 +1,30 @@
+import os
+import re
+import time
+import signal
+import asyncio
 import subprocess
 
-def run_radioss(input_file_path, batch_file_path, isShell = False, write_vtk=False, write_csv = True):
-    
-    nt = "1"
-    np = "1"
-    sp = "sp"  # "sp" or any other value for non-sp
+# bytes read from the end of the engine listing to find its termination
+LISTING_TAIL_BYTES = 1 << 16
+
+def _radioss_command(input_file_path, batch_file_path, write_vtk=False, write_csv=True, nt=1, np=1, sp="sp"):
+
+    nt = str(nt) # number of OpenMP threads per MPI process
+    np = str(np) # number of MPI processes (SPMD domains)
+    sp = str(sp)  # "sp" or any other value for non-sp
 
     if write_vtk:
         # "yes" or "no" depending on whether you want to convert Anim files to vtk (for ParaView)
-        vtk_option = "yes"  
+        vtk_option = "yes"
     else:
         vtk_option = "no"
-    
+
     if write_csv:
         csv_option = "yes"  # "yes" or "no" depending on whether you want to convert TH files to csv
     else:
         csv_option = "no"
-        
+
     starter_option = "no"  # "no" or "yes" depending on whether you are running the starter
 
     # Construct the command to run the batch file with arguments
@@ -30,14 +38,352 @@ def run_radioss(input_file_path, batch_file_path, isShell = False, write_vtk=Fal
         csv_option, # %6
         starter_option # %7
     ]
+    return command
+
+class RunResult():
+    '''
+    Outcome of a supervised OpenRadioss run, see run_radioss.
+
+    status is 'ok', 'stopped' (stopped early by the RunMonitor, the time history written so far is converted),
+    'failed' (non-zero return code, error termination in the listings or no time history), 'timeout' (killed
+    after the wall-clock limit) or 'error' (the batch file could not be started). runtime is the wall-clock
+    time of all the attempts in seconds, attempts the number of runs, and nt and np the split of cores of the
+    last one. The paths of the run are in input_file_path, listing_path and time_history_path.
+
+    timings splits the wall-clock time of the last attempt into steps ('starter', 'engine', 'convert' run by a
+    SolverEnvironment, see environment.py; 'engine' estimated from the listings for a batch file run, see
+    script_timings). variable_time is the time of the engine, the one that scales with the model, and
+    fixed_time the rest of the attempt: the batch file, the starter, the conversion of the time history.
+    '''
+    def __init__(self, input_file_path, status, returncode=None, runtime=0.0, attempts=1, nt=1, np=1, message='', timings=None) -> None:
+        self.input_file_path = input_file_path
+        files = run_files(input_file_path)
+        self.listing_path = files['listing']
+        self.time_history_path = files['time_history']
+        self.status = status
+        self.returncode = returncode
+        self.runtime = runtime
+        self.attempts = attempts
+        self.nt = nt
+        self.np = np
+        self.message = message
+        self.timings = timings or {}
+
+    @property
+    def ok(self):
+        return self.status in ('ok', 'stopped')
+
+    @property
+    def variable_time(self):
+        return self.timings.get('engine')
+
+    @property
+    def fixed_time(self):
+        if 'engine' not in self.timings:
+            return None
+        return self.timings['total'] - self.timings['engine']
+
+    def to_dict(self):
+        # JSON-serializable fields, e.g. to send the run of a worker back to the broker, see from_dict
+        return {'input_file_path': self.input_file_path, 'status': self.status, 'returncode': self.returncode,
+                'runtime': self.runtime, 'attempts': self.attempts, 'nt': self.nt, 'np': self.np, 'message': self.message,
+                'timings': self.timings}
+
+    @classmethod
+    def from_dict(cls, fields):
+        return cls(**fields)
+
+    def __repr__(self):
+        return (f'RunResult({self.input_file_path!r}, status={self.status!r}, returncode={self.returncode}, '
+                f'runtime={self.runtime:.1f}, attempts={self.attempts}, nt={self.nt}, np={self.np})')
+
+class SimulationError(RuntimeError):
+    '''
+    Raised by OptiProblem for a run which failed, without failure_penalty. result is its RunResult.
+    '''
+    def __init__(self, result) -> None:
+        super().__init__(f'OpenRadioss run {result.status}: {result.input_file_path} {result.message}'.rstrip())
+        self.result = result
+
+def run_files(input_file_path):
+    """
+    Returns:
+        dict: The paths of the starter listing, the engine input, the engine listing and control file and the
+        time history CSV of an input deck, e.g. combine.k -> combine_0000.out, combine_0001.rad, combine_0001.out,
+        combine_0001.ctl, combineT01.csv.
+    """
+    root = os.path.splitext(input_file_path)[0]
+    if root.endswith('_0000'):
+        root = root[:-len('_0000')]
+    return {
+        'starter_listing': root + '_0000.out',
+        'engine_input': root + '_0001.rad',
+        'listing': root + '_0001.out',
+        'control': root + '_0001.ctl',
+        'time_history': root + 'T01.csv',
+    }
+
+def termination_status(input_file_path):
+    """
+    Read the termination of a run from the tail of its listings: 'error' if the starter reports errors or the
+    engine an error termination, 'normal' for a normal termination of the engine, None if it can't be told
+    (no listing, e.g. a batch file writing the listings elsewhere).
+    """
+    files = run_files(input_file_path)
+    try:
+        with open(files['starter_listing'], 'rb') as f:
+            errors = re.findall(rb'(\d+)\s+ERROR\(S\)', f.read())
+        if any(int(count) > 0 for count in errors):
+            return 'error'
+    except OSError:
+        pass
+    try:
+        with open(files['listing'], 'rb') as f:
+            f.seek(max(0, os.fstat(f.fileno()).st_size - LISTING_TAIL_BYTES))
+            tail = f.read()
+    except OSError:
+        return None
+    if b'ERROR TERMINATION' in tail or b'ABNORMAL' in tail:
+        return 'error'
+    if b'NORMAL TERMINATION' in tail:
+        return 'normal'
+    return None
+
+def kill_process_group(process):
+    # the batch file starts the starter and engine as child processes, they are put in a new
+    # session so that killing the job kills the whole process group
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+def _retry_splits(nt, np, retries):
+    # splits of cores of the retries: the cores of the job as threads of one process, then half as many
+    # threads, down to one thread, as a crash may come from the domain decomposition or the threading
+    total = nt*np
+    splits = []
+    threads = total
+    while len(splits) < retries:
+        if (threads, 1) != (nt, np) and (threads, 1) not in splits:
+            splits.append((threads, 1))
+        elif threads == 1:
+            splits.append((1, 1))
+        threads = max(1, threads // 2)
+    return splits
+
+def clear_outputs(input_file_path, monitor=None):
+    # the outputs of a previous attempt would hide the failure of this one
+    files = run_files(input_file_path)
+    for name in ['starter_listing', 'listing', 'control', 'time_history']:
+        if os.path.exists(files[name]):
+            os.remove(files[name])
+    if monitor is not None:
+        monitor.reset()
+
+def check_outputs(input_file_path, returncode, write_csv, monitor=None):
+    """
+    Status of a terminated attempt from its return code and its outputs.
+
+    Returns:
+        tuple: (status, message), see RunResult.
+    """
+    if monitor is not None and monitor.stopped is not None:
+        return 'stopped', monitor.stopped
+    if returncode != 0:
+        return 'failed', f'return code {returncode}'
+    if termination_status(input_file_path) == 'error':
+        return 'failed', 'error termination in the listing'
+    time_history_path = run_files(input_file_path)['time_history']
+    if write_csv and not os.path.exists(time_history_path):
+        return 'failed', f'no time history {os.path.basename(time_history_path)}'
+    return 'ok', ''
 
+def script_timings(input_file_path, total):
+    """
+    Timings of a batch file run which took total seconds (see RunResult.timings): the engine time is estimated
+    as the time between the last writes of the starter listing and of the engine listing.
+    """
+    files = run_files(input_file_path)
+    timings = {'total': total}
     try:
-        # Run the batch file and wait for it to complete
-        subprocess.run(command, check=True, shell=isShell)
+        engine = os.path.getmtime(files['listing']) - os.path.getmtime(files['starter_listing'])
+    except OSError:
+        return timings
+    timings['engine'] = min(max(engine, 0.0), total)
+    return timings
+
+def _run_once(command, input_file_path, isShell, write_csv, monitor, timeout):
+    # one attempt of run_radioss: (status, return code, message)
+    clear_outputs(input_file_path, monitor)
+
+    try:
+        process = subprocess.Popen(command, shell=isShell, start_new_session=(os.name == 'posix'))
+    except OSError as e:
+        return 'error', None, str(e)
+    try:
+        if monitor is None:
+            returncode = process.wait(timeout)
+        else:
+            # the RunMonitor may stop the job early, see monitor.py
+            returncode = monitor.watch(process, timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process)
+        process.wait()
+        return 'timeout', process.returncode, f'killed after {timeout} s'
+    except BaseException:
+        # e.g. KeyboardInterrupt, the job doesn't outlive the driver
+        kill_process_group(process)
+        process.wait()
+        raise
+    status, message = check_outputs(input_file_path, returncode, write_csv, monitor)
+    return status, returncode, message
+
+def run_radioss(input_file_path, batch_file_path, isShell = False, write_vtk=False, write_csv = True, nt = 1, np = 1, sp = "sp", monitor=None, timeout=None, retries=0, environment=None):
+    """
+    Run OpenRadioss on an input deck through the batch file, supervised: the job is killed after timeout
+    seconds, a failed or timed out run is retried up to retries times with other splits of the cores, and the
+    termination is checked in the listings.
+
+    Parameters:
+        monitor (RunMonitor): Monitor stopping the run early, see monitor.py.
+        timeout (float): Wall-clock limit of one attempt in seconds. Default: no limit.
+        retries (int): Number of retries of a failed or timed out run. Default: 0.
+        environment (SolverEnvironment): Run the starter, engine and converters directly in this environment
+            instead of the batch file, see environment.py.
+
+    Returns:
+        RunResult: The outcome of the run, with the timings of its last attempt.
+    """
+    splits = [(nt, np)] + _retry_splits(nt, np, retries)
+    start = time.perf_counter()
+    for attempt, (nt, np) in enumerate(splits, 1):
+        attempt_start = time.perf_counter()
+        if environment is None:
+            command = _radioss_command(input_file_path, batch_file_path, write_vtk, write_csv, nt, np, sp)
+            status, returncode, message = _run_once(command, input_file_path, isShell, write_csv, monitor, timeout)
+            timings = script_timings(input_file_path, time.perf_counter() - attempt_start)
+        else:
+            status, returncode, message, timings = environment.run_once(input_file_path, write_vtk, write_csv, nt, np, sp,
+                                                                        monitor, timeout)
+        if status in ('ok', 'stopped', 'error'):
+            break
+        print(f"Error running batch file: {message}, attempt {attempt} of {len(splits)}")
+    result = RunResult(input_file_path, status, returncode, time.perf_counter() - start, attempt, nt, np, message, timings)
+    if result.ok:
         print("Batch file executed successfully.")
+    else:
+        print(f"Error running batch file: {result}")
+    return result
+
+class RadiossJob():
+    '''
+    Non-blocking OpenRadioss run, based on asyncio subprocesses.
+
+    submit() starts the batch file and returns an awaitable future resolving to the return code of the run,
+    so that a driver can keep many jobs in flight from one event loop. poll() returns the return code without
+    waiting (None while the job is running), cancel() kills the run. A job running longer than `timeout`
+    seconds is killed and its future raises asyncio.TimeoutError; a non-zero return code raises
+    subprocess.CalledProcessError.
+    '''
+    def __init__(self, input_file_path, batch_file_path, write_vtk=False, write_csv=True, nt=1, np=1, sp="sp", timeout=None) -> None:
+        self.input_file_path = input_file_path
+        self.batch_file_path = batch_file_path
+        self.command = _radioss_command(input_file_path, batch_file_path, write_vtk, write_csv, nt, np, sp)
+        self.timeout = timeout
+
+        self.process = None
+        self._future = None
+
+    def submit(self):
+        """
+        Start the job, must be called with a running event loop. Calling it again returns the same future.
 
-        # Check if there was an error
+        Returns:
+            asyncio.Task: Resolves to the return code of the run.
+        """
+        if self._future is None:
+            self._future = asyncio.ensure_future(self._run())
+        return self._future
+
+    async def _run(self):
+        # in a new session, see kill_process_group
+        self.process = await asyncio.create_subprocess_exec(*self.command, start_new_session=(os.name == 'posix'))
+        try:
+            returncode = await asyncio.wait_for(self.process.wait(), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._kill()
+            await asyncio.shield(self.process.wait())
+            raise
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.command)
+        return returncode
+
+    def poll(self):
+        """
+        Returns:
+            int: The return code of the run, or None if the job has not been started or is still running.
+        """
+        if self.process is None:
+            return None
+        return self.process.returncode
+
+    def done(self):
+        return self._future is not None and self._future.done()
+
+    def cancel(self):
+        """
+        Kill the run. Awaiting the future afterwards raises asyncio.CancelledError.
+        """
+        if self._future is not None:
+            self._future.cancel()
+
+    def _kill(self):
+        if self.process is None or self.process.returncode is not None:
+            return
+        kill_process_group(self.process)
+
+async def _await_job(job, write_csv):
+    # one attempt of arun_radioss: (status, return code, message); cancelling the awaiting task kills the run
+    try:
+        returncode = await job.submit()
+    except asyncio.CancelledError:
+        job.cancel()
+        raise
+    except asyncio.TimeoutError:
+        return 'timeout', job.poll(), f'killed after {job.timeout} s'
     except subprocess.CalledProcessError as e:
-        print(f"Error running batch file: {e}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
\ No newline at end of file
+        returncode = e.returncode
+    except OSError as e:
+        return 'error', None, str(e)
+    status, message = check_outputs(job.input_file_path, returncode, write_csv)
+    return status, returncode, message
+
+async def arun_radioss(input_file_path, batch_file_path, write_vtk=False, write_csv=True, nt=1, np=1, sp="sp", timeout=None, retries=0):
+    """
+    Asynchronous counterpart of run_radioss: each attempt is a RadiossJob awaited from the event loop, so that
+    many runs are in flight without a thread each, with the same timeout, retries and termination check.
+    Cancelling the awaiting task cancels the job, which kills the run. Without RunMonitor nor SolverEnvironment.
+
+    Returns:
+        RunResult: The outcome of the run, with the timings of its last attempt.
+    """
+    splits = [(nt, np)] + _retry_splits(nt, np, retries)
+    start = time.perf_counter()
+    for attempt, (nt, np) in enumerate(splits, 1):
+        attempt_start = time.perf_counter()
+        clear_outputs(input_file_path)
+        job = RadiossJob(input_file_path, batch_file_path, write_vtk, write_csv, nt, np, sp, timeout)
+        status, returncode, message = await _await_job(job, write_csv)
+        timings = script_timings(input_file_path, time.perf_counter() - attempt_start)
+        if status in ('ok', 'stopped', 'error'):
+            break
+        print(f"Error running batch file: {message}, attempt {attempt} of {len(splits)}")
+    result = RunResult(input_file_path, status, returncode, time.perf_counter() - start, attempt, nt, np, message, timings)
+    if result.ok:
+        print("Batch file executed successfully.")
+    else:
+        print(f"Error running batch file: {result}")
+    return result
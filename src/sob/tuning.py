@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import socket
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from .solver import SimulationError
+from .workspace import Workspace
+
+'''
+Calibration of the throughput of OpenRadioss on the local machine.
+
+A split is the packing of the simulations on the CPU cores: number of MPI processes (nmpi) and OpenMP threads
+(nt) per simulation, and number of simulations run at the same time (max_jobs). calibrate_throughput runs the
+reference decks of the crash models at several splits and records the designs per hour of each one, so that
+OptiProblem.evaluate_batch picks the best split of the machine automatically.
+'''
+
+# Record of the calibrations, per host.
+DEFAULT_RECORD_PATH = os.path.join(os.path.expanduser('~'), '.sob', 'throughput.json')
+
+def default_splits(total_cores):
+    """
+    Candidate splits of total_cores: powers of two of threads or MPI processes per simulation,
+    with as many simulations at the same time as fit on the cores.
+
+    Returns:
+        list: Splits as dicts with the keys 'nmpi', 'nt' and 'max_jobs'.
+    """
+    splits = []
+    cores_per_job = 1
+    while cores_per_job <= total_cores:
+        max_jobs = total_cores // cores_per_job
+        splits.append({'nmpi': 1, 'nt': cores_per_job, 'max_jobs': max_jobs})
+        if cores_per_job > 1:
+            splits.append({'nmpi': cores_per_job, 'nt': 1, 'max_jobs': max_jobs})
+        cores_per_job *= 2
+    return splits
+
+def _load_record(record_path):
+    if not os.path.exists(record_path):
+        return {}
+    with open(record_path) as f:
+        return json.load(f)
+
+def _host_key():
+    return f'{socket.gethostname()}-{os.cpu_count()}cores'
+
+def _problem_key(problem_name, fidelity='high'):
+    # the 'high' fidelity keeps the keys of the existing records, a custom level (dict) is keyed on its parameters
+    if fidelity == 'high':
+        return problem_name
+    if isinstance(fidelity, dict):
+        fidelity = json.dumps(fidelity, sort_keys=True)
+    return f'{problem_name}/{fidelity}'
+
+def best_split(problem_name, fidelity='high', record_path=DEFAULT_RECORD_PATH):
+    """
+    The split with the highest throughput recorded for a problem type on this machine.
+
+    Parameters:
+        problem_name (str): Name of the problem class, e.g. 'StarBox' or 'CrashTube'.
+        fidelity (str or dict): Fidelity level the split has been calibrated at, see get_problem.
+        record_path (str): Path of the calibration record.
+
+    Returns:
+        dict: The split ('nmpi', 'nt', 'max_jobs' and 'designs_per_hour'), or None if not calibrated.
+    """
+    record = _load_record(record_path)
+    return record.get(_host_key(), {}).get(_problem_key(problem_name, fidelity), {}).get('best')
+
+def calibrate_throughput(batch_file_path, model_types=(1, 3), splits=None, total_cores=None, fidelity='high',
+                         record_path=DEFAULT_RECORD_PATH):
+    """
+    Run the reference decks at several splits on the local machine and record the designs per hour of each.
+
+    The reference deck of a model is the design in the middle of the search space of its highest dimension.
+    For each split, max_jobs copies of the deck are simulated at the same time, so the measured throughput
+    accounts for the concurrent jobs competing for memory bandwidth. The decks are run in a temporary Workspace,
+    each one deleted once its split is measured. A split whose runs fail is recorded with its error and no
+    throughput, and the other splits are still measured.
+
+    Parameters:
+        batch_file_path (str): Path to the OpenRadioss batch file.
+        model_types (tuple): Model types to calibrate, see get_problem. Default: star box and crash tube.
+        splits (list): Splits to measure, as dicts with the keys 'nmpi', 'nt' and 'max_jobs'.
+            Default: default_splits(total_cores).
+        total_cores (int): Number of cores to use. Default: all the cores of the machine.
+        fidelity (str or dict): Fidelity level of the reference decks, see get_problem. The splits are recorded
+            per problem and fidelity, see best_split.
+        record_path (str): Path of the calibration record, updated with the results.
+
+    Returns:
+        dict: Per problem name (with the fidelity if it isn't 'high'), the measured splits and the best one
+        (None if every split failed).
+    """
+    from .problems import StarBox, CrashTube
+    reference_problems = {1: (StarBox, 5), 3: (CrashTube, 6)}
+    if total_cores is None:
+        total_cores = os.cpu_count() or 1
+    if splits is None:
+        splits = default_splits(total_cores)
+
+    results = {}
+    with Workspace() as workspace:
+        for model_type in model_types:
+            problem_class, dimension = reference_problems[model_type]
+            problem = problem_class(dimension, 'intrusion', batch_file_path, auto_tune=False, fidelity=fidelity,
+                                    workspace=workspace)
+            reference_design = np.zeros(dimension)
+
+            measured = []
+            for split in splits:
+                measured.append(_measure_split(problem, reference_design, split))
+                if 'error' in measured[-1]:
+                    print(f"{problem_class.__name__} nmpi={split['nmpi']} nt={split['nt']} max_jobs={split['max_jobs']}: "
+                          f"failed, {measured[-1]['error']}")
+                else:
+                    print(f"{problem_class.__name__} nmpi={split['nmpi']} nt={split['nt']} max_jobs={split['max_jobs']}: "
+                          f"{measured[-1]['designs_per_hour']:.1f} designs per hour")
+
+            succeeded = [split for split in measured if 'error' not in split]
+            best = max(succeeded, key=lambda split: split['designs_per_hour']) if succeeded else None
+            results[_problem_key(problem_class.__name__, fidelity)] = {'total_cores': total_cores, 'splits': measured,
+                                                                       'best': best}
+
+    record = _load_record(record_path)
+    record.setdefault(_host_key(), {}).update(results)
+    os.makedirs(os.path.dirname(os.path.abspath(record_path)), exist_ok=True)
+    with open(record_path, 'w') as f:
+        json.dump(record, f, indent=2)
+    return results
+
+def _measure_split(problem, reference_design, split):
+    # designs per hour of max_jobs copies of the reference deck run at the same time, or the error of a failed run
+    working_dirs = [problem.generate_input_deck(reference_design) for _ in range(split['max_jobs'])]
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=split['max_jobs']) as pool:
+            list(pool.map(lambda working_dir: problem.run_simulation(working_dir, split['nt'], split['nmpi']), working_dirs))
+        elapsed = time.perf_counter() - start
+    except SimulationError as e:
+        return dict(split, designs_per_hour=None, error=str(e))
+    finally:
+        for working_dir in working_dirs:
+            problem.workspace.release(working_dir)
+    return dict(split, designs_per_hour=split['max_jobs']/elapsed*3600)
@@ -0,0 +1,206 @@
+"""
+Worker processes evaluating the jobs of a broker, see broker.py.
+
+A worker claims the queued jobs one at a time, rebuilds the problem of each job from its spec with the
+OpenRadioss batch file of its own machine, regenerates the input deck from the design vector, runs the
+simulation and sends back the evaluation and, if the job asks for it, the compressed time history.
+
+Started from the root of the repository, with the database of a JobBroker or the address of a served one:
+
+    python -m src.sob.worker sob_jobs.sqlite --batch-file /path/to/openradioss_run_script_ps.sh --processes 4
+    python -m src.sob.worker head-node:5555 --batch-file /path/to/openradioss_run_script_ps.sh --workspace
+
+With --direct, each worker process sets up the OpenRadioss environment once and runs the starter, the engine and
+th_to_csv directly rather than through the batch file (see environment.py): the processes of the pool stay warm
+between jobs, and the time per run is reported as fixed and variable time.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import traceback
+import multiprocessing
+import numpy as np
+from .problems import StarBox, ThreePointBending, CrashTube, SPEC_OPTIONS, SPEC_ATTRIBUTES
+from .broker import connect
+from .cache import dump_history
+from .solver import SimulationError
+from .workspace import Workspace
+from .environment import SolverEnvironment
+
+# the problems a job may ask for, by name: the spec of a job comes from the broker and is not trusted
+PROBLEM_CLASSES = {problem_class.__name__: problem_class for problem_class in (StarBox, ThreePointBending, CrashTube)}
+
+def problem_from_spec(spec, batch_file_path, **kwargs):
+    """
+    Build the problem of a job, see OptiProblem.spec.
+
+    Parameters:
+        kwargs: Options of the worker's own, e.g. its workspace.
+
+    Raises:
+        ValueError: The spec names a problem which isn't in PROBLEM_CLASSES, or an option which isn't in
+            SPEC_OPTIONS.
+    """
+    if spec['problem'] not in PROBLEM_CLASSES:
+        raise ValueError(f"Invalid problem '{spec['problem']}', the options are {sorted(PROBLEM_CLASSES)}")
+    unknown = set(spec['options']) - set(SPEC_OPTIONS)
+    if unknown:
+        raise ValueError(f'Invalid problem options {sorted(unknown)}, the options are {list(SPEC_OPTIONS)}')
+    problem_class = PROBLEM_CLASSES[spec['problem']]
+    options = dict(spec['options'])
+    attributes = {name: options.pop(name) for name in SPEC_ATTRIBUTES if name in options}
+    problem = problem_class(spec['dimension'], spec['output_data'], batch_file_path, **options, **kwargs)
+    for name, value in attributes.items():
+        setattr(problem, name, value)
+    return problem
+
+class Worker():
+    '''
+    Evaluates the jobs of a broker, see the module docstring.
+
+    Parameters:
+        broker (JobBroker or BrokerClient): The broker the jobs are claimed from.
+        batch_file_path (str): Path to the OpenRadioss batch file of this machine.
+        name (str): Name of the worker recorded with its jobs. Default: <host>:<pid>.
+        workspace (Workspace): Workspace of the decks, see workspace.py. Default: under the current working directory.
+        poll_interval (float): Seconds between two claims when no job is queued.
+        environment (SolverEnvironment): Environment running the solver directly, set up once for all the jobs
+            of the worker, see environment.py. Default: the batch file runs the solver.
+
+    stats counts the jobs done and failed.
+    '''
+    def __init__(self, broker, batch_file_path, name=None, workspace=None, poll_interval=1.0, environment=None) -> None:
+        self.broker = broker
+        self.batch_file_path = batch_file_path
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.workspace = workspace
+        self.poll_interval = poll_interval
+        self.environment = environment
+        self.stats = {'done': 0, 'failed': 0}
+        # spec -> problem, the jobs of a campaign share their problem
+        self._problems = {}
+
+    def _problem(self, spec):
+        key = json.dumps(spec, sort_keys=True)
+        if key not in self._problems:
+            self._problems[key] = problem_from_spec(spec, self.batch_file_path, workspace=self.workspace,
+                                                     environment=self.environment)
+        return self._problems[key]
+
+    def process(self, job):
+        """
+        Evaluate a claimed job and send its result to the broker.
+        """
+        start = time.perf_counter()
+        try:
+            problem = self._problem(job['spec'])
+            result, output_data_frame = problem._evaluate_simulated(job['variables'], job['nt'], job['nmpi'])
+        except Exception as e:
+            run = e.result.to_dict() if isinstance(e, SimulationError) else None
+            self.broker.fail(job['id'], {'message': f'{e.__class__.__name__}: {e}', 'run': run, 'worker': self.name,
+                                         'traceback': traceback.format_exc(), 'runtime': time.perf_counter() - start})
+            self.stats['failed'] += 1
+            return
+        attrs = {} if output_data_frame is None else output_data_frame.attrs
+        failed = attrs.get('failed')
+        history = None
+        if job['history'] and output_data_frame is not None and not output_data_frame.empty:
+            history = dump_history(output_data_frame)
+        self.broker.complete(job['id'], {
+            'objective': np.asarray(result, dtype=float).tolist(), 'status': problem._run_status(output_data_frame),
+            'run_id': attrs.get('run_id'), 'working_dir': problem.working_dir, 'stopped': attrs.get('stopped'),
+            'run': None if failed is None else failed.to_dict(), 'worker': self.name,
+            'timings': failed.timings if failed is not None else attrs.get('timings', {}),
+            'runtime': time.perf_counter() - start}, history)
+        self.stats['done'] += 1
+
+    def run(self, max_jobs=None, idle_timeout=None):
+        """
+        Claim and evaluate jobs until max_jobs are evaluated or no job has been queued for idle_timeout seconds.
+        Default: forever.
+
+        Returns:
+            int: The number of jobs evaluated.
+        """
+        count = 0
+        idle_since = time.monotonic()
+        while max_jobs is None or count < max_jobs:
+            job = self.broker.claim(self.name)
+            if job is None:
+                if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            self.process(job)
+            count += 1
+            idle_since = time.monotonic()
+        return count
+
+def run_worker(address, batch_file_path, name=None, use_workspace=False, results_dir=None, poll_interval=1.0,
+               max_jobs=None, idle_timeout=None, direct=False, openradioss_path=None):
+    """
+    Connect to the broker at address and run a Worker, with a Workspace of its own (deleted when it stops) if
+    use_workspace is set, and with a SolverEnvironment set up once (from openradioss_path, else from the
+    OPENRADIOSS_PATH environment variable or the batch file) if direct is set.
+
+    Returns:
+        int: The number of jobs evaluated.
+    """
+    environment = SolverEnvironment(openradioss_path, batch_file_path) if direct else None
+    broker = connect(address)
+    workspace = Workspace(results_dir=results_dir) if use_workspace else None
+    try:
+        worker = Worker(broker, batch_file_path, name, workspace, poll_interval, environment)
+        count = worker.run(max_jobs, idle_timeout)
+        if environment is not None and environment.stats['runs']:
+            stats = environment.stats
+            print(f"Worker {worker.name}: {stats['runs']} runs, {stats['fixed_time']/stats['runs']:.2f} s fixed and "
+                  f"{stats['variable_time']/stats['runs']:.2f} s variable time per run")
+        return count
+    finally:
+        if workspace is not None:
+            workspace.cleanup()
+        broker.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='sob-worker', description='Evaluate the jobs of a sob broker.')
+    parser.add_argument('broker', help="path of the JobBroker database, or 'host:port' of a served broker")
+    parser.add_argument('--batch-file', help='path to the OpenRadioss batch file of this machine (required without --direct)')
+    parser.add_argument('--processes', type=int, default=1, help='number of worker processes (default 1)')
+    parser.add_argument('--direct', action='store_true',
+                        help='run the starter, engine and converters directly, see environment.py')
+    parser.add_argument('--openradioss-path', help='root of the OpenRadioss installation for --direct')
+    parser.add_argument('--workspace', action='store_true', help='run the decks in a scratch workspace, see workspace.py')
+    parser.add_argument('--results-dir', help='results store the workspace harvests the time histories into')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between two claims when idle')
+    parser.add_argument('--max-jobs', type=int, help='stop after this number of jobs (per process)')
+    parser.add_argument('--idle-timeout', type=float, help='stop when no job has been queued for this number of seconds')
+    args = parser.parse_args(argv)
+    if args.batch_file is None and not args.direct:
+        parser.error('--batch-file is required without --direct')
+
+    kwargs = {'batch_file_path': args.batch_file, 'use_workspace': args.workspace, 'results_dir': args.results_dir,
+              'poll_interval': args.poll_interval, 'max_jobs': args.max_jobs, 'idle_timeout': args.idle_timeout,
+              'direct': args.direct, 'openradioss_path': args.openradioss_path}
+    if args.processes == 1:
+        count = run_worker(args.broker, **kwargs)
+        print(f'Worker {socket.gethostname()}:{os.getpid()} evaluated {count} jobs')
+        return 0
+    workers = [multiprocessing.Process(target=run_worker, args=(args.broker,), kwargs=kwargs)
+               for _ in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+    return max(worker.exitcode or 0 for worker in workers)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Workspace of the evaluations: where the input decks are written and run, and what is kept of them.
+
+Without a Workspace, the decks are written under the current working directory and kept. With a Workspace, the
+run directories are created under a scratch root, by default /dev/shm (tmpfs) where it exists, so that the I/O of
+the solver doesn't load the file system the campaign has been started from. Once a design is evaluated, the
+run directory is released: the requested artifacts (the harvest patterns, e.g. the time history) are copied
+into the results store, <results_dir>/<run directory name>, and the rest is deleted.
+
+The quota bounds the bytes of the run directories of the workspace on the scratch root. A new run directory
+first evicts the oldest run directories kept after their release (keep=True). If the quota is still exceeded,
+it waits for the runs in flight in the other threads (created and not released yet) to be released, and
+OSError (ENOSPC) is raised only if no such run is in flight or none is released within quota_timeout. OptiProblem evaluates such a design as a
+failed run, see failure_penalty.
+"""
+
+import os
+import errno
+import shutil
+import fnmatch
+import tempfile
+import time
+import threading
+
+def default_scratch_root():
+    """
+    Returns:
+        str: /dev/shm if it is a writable directory, the temporary directory of the platform otherwise.
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def directory_size(path):
+    """
+    Returns:
+        int: The bytes of the files under path, each hard linked file counted once.
+    """
+    size = 0
+    seen = set()
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                size += stat.st_size
+    return size
+
+class Workspace():
+    '''
+    Run directories of the evaluations on a scratch root, see the module docstring.
+
+    Parameters:
+        scratch_root (str): Directory the run directories are created in. Default: a new directory of
+            default_scratch_root(), deleted by cleanup.
+        results_dir (str): Results store the artifacts are harvested into, None to harvest nothing.
+        harvest (list): Glob patterns of the file names harvested from a run directory. Default: the time history.
+        keep (bool): Keep the run directories after their release (the quota evicts them), e.g. for debugging.
+        quota (int): Maximum bytes of the run directories on the scratch root. Default: no limit.
+        quota_timeout (float): Seconds a new run directory waits for the runs in flight in the other threads to be
+            released when the quota is exceeded. Default: as long as such runs are in flight.
+
+    stats counts the released runs, the bytes harvested and the bytes deleted from the scratch root.
+    '''
+    def __init__(self, scratch_root=None, results_dir=None, harvest=('*T01.csv',), keep=False, quota=None, quota_timeout=None) -> None:
+        # a directory of its own by default, the workspaces of concurrent campaigns don't collide
+        self._owns_root = scratch_root is None
+        self.scratch_root = scratch_root or tempfile.mkdtemp(prefix='sob_', dir=default_scratch_root())
+        self.results_dir = results_dir
+        self.harvest_patterns = list(harvest)
+        self.keep = keep
+        self.quota = quota
+        self.quota_timeout = quota_timeout
+        self.stats = {'released': 0, 'harvested_bytes': 0, 'deleted_bytes': 0}
+
+        # the run directories of the workspace in creation order, the threads which created them, and those
+        # already released
+        self._run_dirs = []
+        self._creators = {}
+        self._released = set()
+        # the other directories of the workspace, deleted by cleanup
+        self._shared_dirs = set()
+        # shared by the threads of a batch evaluation, notified when a run directory is released
+        self._lock = threading.Lock()
+        self._released_condition = threading.Condition(self._lock)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cleanup()
+
+    def path(self, name):
+        """
+        Returns:
+            str: The path of a directory of the workspace which isn't a run directory, e.g. the shared includes.
+        """
+        path = os.path.join(self.scratch_root, name)
+        self._shared_dirs.add(path)
+        return path
+
+    def run_dir(self, name):
+        """
+        Create the run directory of an evaluation, making room for it within the quota, see the module docstring.
+
+        Returns:
+            str: The path of the run directory.
+
+        Raises:
+            FileExistsError: The directory already exists, it isn't added to the workspace.
+            OSError: ENOSPC, the quota is exceeded and no run in flight has been released to make room. Its
+                filename is the run directory which hasn't been created.
+        """
+        run_dir = os.path.join(self.scratch_root, name)
+        with self._lock:
+            self._make_room(run_dir)
+            os.makedirs(self.scratch_root, exist_ok=True)
+            os.mkdir(run_dir)
+            self._run_dirs.append(run_dir)
+            self._creators[run_dir] = threading.get_ident()
+        return run_dir
+
+    def usage(self):
+        """
+        Returns:
+            int: The bytes of the run directories of the workspace on the scratch root.
+        """
+        return sum(directory_size(run_dir) for run_dir in list(self._run_dirs))
+
+    def _make_room(self, run_dir):
+        # evict the kept run directories, oldest first, until the workspace is within its quota, waiting for the
+        # runs in flight to be released if it is still exceeded
+        if self.quota is None:
+            return
+        deadline = None if self.quota_timeout is None else time.monotonic() + self.quota_timeout
+        while True:
+            usage = self.usage()
+            for released_dir in [released_dir for released_dir in self._run_dirs if released_dir in self._released]:
+                if usage <= self.quota:
+                    break
+                size = directory_size(released_dir)
+                self._remove(released_dir)
+                usage -= size
+            if usage <= self.quota:
+                return
+            # the runs of this thread aren't released while it waits
+            in_flight = any(other_dir not in self._released and self._creators.get(other_dir) != threading.get_ident()
+                            for other_dir in self._run_dirs)
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if not in_flight or (timeout is not None and timeout <= 0):
+                raise OSError(errno.ENOSPC, f'Workspace quota of {self.quota} bytes exceeded ({usage} bytes)', run_dir)
+            self._released_condition.wait(timeout)
+
+    def _remove(self, run_dir):
+        self.stats['deleted_bytes'] += directory_size(run_dir)
+        shutil.rmtree(run_dir, ignore_errors=True)
+        self._run_dirs.remove(run_dir)
+        self._creators.pop(run_dir, None)
+        self._released.discard(run_dir)
+
+    def harvest(self, run_dir):
+        """
+        Copy the files of a run directory matching the harvest patterns into the results store.
+
+        Returns:
+            list: The paths of the harvested files.
+        """
+        if self.results_dir is None or not os.path.isdir(run_dir):
+            return []
+        harvested = []
+        destination_dir = os.path.join(self.results_dir, os.path.basename(run_dir))
+        for name in sorted(os.listdir(run_dir)):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in self.harvest_patterns):
+                os.makedirs(destination_dir, exist_ok=True)
+                destination = os.path.join(destination_dir, name)
+                shutil.copyfile(os.path.join(run_dir, name), destination)
+                harvested.append(destination)
+        with self._lock:
+            self.stats['harvested_bytes'] += sum(os.path.getsize(path) for path in harvested)
+        return harvested
+
+    def release(self, run_dir):
+        """
+        Harvest a run directory once its evaluation is done, and delete it unless the workspace keeps it.
+
+        Returns:
+            list: The paths of the harvested files.
+        """
+        harvested = self.harvest(run_dir)
+        with self._lock:
+            self.stats['released'] += 1
+            if run_dir not in self._run_dirs:
+                return harvested
+            if self.keep:
+                self._released.add(run_dir)
+            else:
+                self._remove(run_dir)
+            self._released_condition.notify_all()
+        return harvested
+
+    def cleanup(self):
+        """
+        Delete all the directories of the workspace, the run directories released or not.
+        """
+        with self._lock:
+            for run_dir in list(self._run_dirs):
+                self._remove(run_dir)
+            for path in self._shared_dirs:
+                shutil.rmtree(path, ignore_errors=True)
+            self._shared_dirs.clear()
+            if self._owns_root:
+                shutil.rmtree(self.scratch_root, ignore_errors=True)
@@ -1,5 +1,7 @@
+import os
 from src import sob
 import numpy as np
+import pandas as pd
 
 batch_file_path = "D:/OpenRadioss/win_scripts_mk3/openradioss_run_script_ps.bat"
 
@@ -12,7 +14,7 @@ def generate_multiple_instances():
     # Generate the second StarBox instance
     b = sob.StarBox(5,'a',batch_file_path)
     b.generate_input_deck([1,2,3,4,5])
-    print(b.problem_id)
+    print(b.run_id)
 
 def check_mass():
     a = sob.StarBox(3,'a',batch_file_path)
@@ -63,6 +65,347 @@ def check_crashtube_mesh_generation():
     d = sob.get_problem(3,6,'mass',batch_file_path)
     d([1,2,3,4,5,-2])
 
+def check_in_memory_mesher():
+    # the mesh written from the in-memory mesher input is the same as the one of the py_mesh.input round-trip
+    from src.sob.lib.py_mesh_v2 import py_mesh_v2
+    mesh = sob.CrashTubeMesh([1,2,3,4,5,-2])
+    os.makedirs('in_memory_mesher', exist_ok=True)
+    mesh.write_mesh_file('in_memory_mesher', write_input=True)
+    in_memory = read_deck('in_memory_mesher')['mesh.k']
+    py_mesh_v2(os.path.join('in_memory_mesher', 'py_mesh.input'), output_dir='in_memory_mesher')
+    print(in_memory == read_deck('in_memory_mesher')['mesh.k'])
+
+def check_three_point_bending_deck():
+    # the properties of the reinforcements t1 to t5 are spliced into the base deck
+    a = sob.get_problem(2,3,None,batch_file_path)
+    working_dir = a.generate_input_deck([-5,0,5])
+    print(a.model.thicknesses)
+    with open(os.path.join(working_dir, 'ThreePointBending_0000.rad')) as f:
+        deck = f.read()
+    print([deck.count(f'/PROP/SHELL/{prop_id}\n') for prop_id in range(3, 10)], deck.endswith('/END\n'))
+    # the deck writes no time history the outputs could be computed from
+    try:
+        sob.get_problem(2,3,'intrusion',batch_file_path)
+    except ValueError as e:
+        print(e)
+
+def check_deck_index():
+    # the nodes and shells read back from the indexed mesh.k are the ones of the mesher
+    mesh = sob.CrashTubeMesh([1,2,3,4,5,-2])
+    os.makedirs('deck_index', exist_ok=True)
+    generated = mesh.write_mesh_file('deck_index')
+    deck = sob.DeckIndex(os.path.join('deck_index', 'mesh.k'))
+    node_ids, coordinates = deck.nodes()
+    element_ids, part_ids, nodes = deck.shells()
+    print(np.array_equal(node_ids, generated['node_ids']), np.allclose(coordinates, generated['coordinates']))
+    print(np.array_equal(np.column_stack((part_ids, nodes)), generated['shells']))
+    print(deck.line('*ELEMENT_SHELL', element_ids[-1]))
+
+    # shell property of the three point bending base deck
+    base = sob.DeckIndex(sob.ThreePointBendingModel.base_deck_path, persist=False)
+    print(base.prop_shell(4)['thickness'], len(base.shells(4)[0]))
+
+def check_time_history():
+    # only the columns of the tracked node are parsed, the second load reads the .npz sidecar
+    from src.sob.history import load_time_history, peak_abs
+    columns = ['time'] + [f'DATABASE_HISTORY_NODE{node} {axis}' for node in [1001, 1002] for axis in 'XYZ']
+    values = np.random.uniform(-50, 50, (1000, len(columns)))
+    pd.DataFrame(values, columns=columns).to_csv('checkT01.csv', index=False)
+    history = load_time_history('checkT01.csv', usecols=['time', 'DATABASE_HISTORY_NODE1001Z'])
+    print(list(history.columns), os.path.exists('checkT01.csv.npz'))
+    print(peak_abs(history['DATABASE_HISTORY_NODE1001Z']) == pd.read_csv('checkT01.csv')['DATABASE_HISTORY_NODE1001 Z'].abs().max())
+    print(load_time_history('checkT01.csv', usecols=['DATABASE_HISTORY_NODE1001Z']).equals(history[['DATABASE_HISTORY_NODE1001Z']]))
+
+def check_multi_objective():
+    # intrusion, mass and the crash outputs of a design from one simulation
+    a = sob.get_problem(1,3,['intrusion','mass','peak_wall_force','mean_crush_force','crush_efficiency'],batch_file_path)
+    print(a([1,2,3]))
+    print(a.evaluate_batch([[1,2,3],[1,2,5]], max_jobs=2))
+    # the crush force is the normal force of the rigid wall, else the wall mass times the deceleration of the wall node
+    peak_wall_force = sob.OBJECTIVES['peak_wall_force'][0]
+    history = a.output_data_frame
+    print(peak_wall_force(a, None, history), peak_wall_force(a, None, history.drop(columns=[col for col in history.columns if a.wall_force_key in col])))
+    # without simulation: no input deck is generated
+    b = sob.get_problem(3,6,['mass','absorbed_energy'],batch_file_path)
+    print(b([1,2,3,4,2,-2]), b.working_dir is None)
+
+def check_rwforc_objectives():
+    # the crash outputs of a stored time history whose rigid wall force has tangential columns before the normal
+    # ones: peak force 10, energy 27.5 (10 over a wall displacement of 2.5, then down to 0 over the next 0.5),
+    # intrusion 3.5
+    from src.sob.history import load_time_history
+    history = load_time_history(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'rwforcT01.csv'),
+                                sidecar=False)
+    a = sob.get_problem(1,3,['intrusion','mass','peak_wall_force','mean_crush_force','specific_energy_absorption'],batch_file_path)
+    fem_space_variable_array = a._map_variable([1,2,3])
+    outputs = [sob.OBJECTIVES[name][0](a, fem_space_variable_array, history) for name in a.output_data]
+    print(np.allclose(outputs, [3.5, outputs[1], 10, 27.5/3.5, 27.5/outputs[1]]))
+
+def check_early_termination():
+    # the run is stopped once the wall rebounds, or once the intrusion exceeds the one of the first design
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,stop_criteria=[sob.velocity_reversal()])
+    intrusion1 = a([1,2,3])
+    b = sob.get_problem(1,3,'intrusion',batch_file_path,stop_criteria=[sob.intrusion_exceeds(intrusion1)])
+    intrusion2 = b([1,2,1])
+    print(intrusion1, a.early_stops)
+    print(intrusion2 > intrusion1, b.early_stops)
+
+def check_stopped_objectives():
+    # the outputs of a run stopped early are computed from the time history written so far; a run killed before
+    # writing it gets the intrusion estimated by the monitor and the penalty for the other outputs
+    a = sob.get_problem(1,3,['intrusion','mass','peak_wall_force'],batch_file_path,
+                        stop_criteria=[sob.velocity_reversal()],failure_penalty=1e3)
+    print(a([1,2,3]), a.early_stops)
+
+def check_fidelity_levels():
+    # the low fidelity deck is coarser and shorter, the mass of the design doesn't change
+    a = sob.get_problem(3,6,'mass',batch_file_path)
+    b = sob.get_problem(3,6,'mass',batch_file_path,fidelity='low')
+    a.generate_input_deck([1,2,3,4,2,-2])
+    b.generate_input_deck([1,2,3,4,2,-2])
+    print(len(a.model.mesh.generate_mesh()['shells']), len(b.model.mesh.generate_mesh()['shells']))
+    print(a.model.end_time, b.model.end_time, b.model.consider_d3plot)
+    print(a([1,2,3,4,2,-2]) == b([1,2,3,4,2,-2]))
+
+def check_output_profile():
+    # the objective-only deck keeps the tracked node and the databases of its time history, nothing else
+    a = sob.get_problem(1,5,'intrusion',batch_file_path)
+    b = sob.get_problem(1,5,'intrusion',batch_file_path,output_profile='objective')
+    deck_a = a.generate_input_deck([1,2,3,4,2])
+    deck_b = b.generate_input_deck([1,2,3,4,2])
+    for deck_dir in [deck_a, deck_b]:
+        with open(os.path.join(deck_dir, 'dcc.k')) as f:
+            print([line.strip() for line in f if line.startswith('*DATABASE')])
+        with open(os.path.join(deck_dir, 'bc_wall.k')) as f:
+            lines = f.read().splitlines()
+        print(lines[lines.index('*DATABASE_HISTORY_NODE') + 2].split())
+    print(a([1,2,3,4,2]) == b([1,2,3,4,2]))
+
+def check_workspace():
+    # the decks are run on the scratch root, only the time history is kept in the results store
+    workspace = sob.Workspace(results_dir='workspace_results')
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,workspace=workspace)
+    print(a.evaluate_batch([[1,2,3],[1,2,5]], max_jobs=2))
+    print(sorted(os.listdir('workspace_results')), [name for name in os.listdir('.') if 'deck' in name])
+    print(workspace.usage(), workspace.stats)
+    workspace.cleanup()
+    print(os.path.exists(workspace.scratch_root))
+
+    # within a quota of one deck, the designs wait for each other's release; a design which finds no room
+    # before quota_timeout gets the penalty instead of stopping the batch
+    workspace = sob.Workspace(quota=1)
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,workspace=workspace,failure_penalty=1e3)
+    print(a.evaluate_batch([[1,2,3],[1,2,5],[-1,2,3]], max_jobs=3))
+    held = workspace.run_dir('held')
+    with open(os.path.join(held, 'data'), 'w') as f:
+        f.write('in flight')
+    workspace.quota_timeout = 0.5
+    print(a.evaluate_batch([[1,2,3]], max_jobs=1), [run.status for run in a.failures.values()])
+    workspace.cleanup()
+
+def check_failed_runs():
+    # a run killed after the timeout is retried, then the design gets the penalty instead of stopping the batch
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,timeout=0.001,retries=1,failure_penalty=1e3)
+    print(a.evaluate_batch([[1,2,3],[1,2,5]], max_jobs=2))
+    print([(run.status, run.attempts) for run in a.failures.values()])
+    b = sob.get_problem(1,3,'intrusion',batch_file_path,timeout=0.001)
+    try:
+        b([1,2,3])
+    except sob.SimulationError as e:
+        print(e.result)
+    # acall handles the failed runs as __call__ does
+    import asyncio
+    print(asyncio.run(a.acall([-1,2,3])), len(a.failures))
+
+def check_journal():
+    # the second campaign reads the evaluations of the first one from the journal, only the new design is run
+    if os.path.exists('check_journal.jsonl'):
+        os.remove('check_journal.jsonl')
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,journal=sob.EvaluationJournal('check_journal.jsonl'))
+    intrusions = a.evaluate_batch([[1,2,3],[1,2,5]], max_jobs=2)
+    a.journal.close()
+    b = sob.get_problem(1,3,'intrusion',batch_file_path,journal=sob.EvaluationJournal('check_journal.jsonl'))
+    print(np.array_equal(b.evaluate_batch([[1,2,3],[1,2,5]]), intrusions), b.working_dir is None)
+    b([1,2,4])
+    print(len(b.journal), [record['status'] for record in b.journal.records()])
+
+def check_run_ids():
+    # the same design gets the same run ids in every session, the decks of concurrent problems never collide
+    a = sob.get_problem(1,3,'intrusion',batch_file_path)
+    b = sob.get_problem(1,3,'intrusion',batch_file_path)
+    results, run_ids = a.evaluate_batch([[1,2,3],[1,2,3],[1,2,5]], max_jobs=3, return_run_ids=True)
+    print(run_ids, len(set(run_ids)) == 3)
+    print(b.generate_input_deck([1,2,3]), b.run_id not in run_ids)
+
+def check_worker_pool():
+    # 3 local worker processes evaluate the designs submitted to the broker, with the same results as here
+    import sys, subprocess
+    for path in ['check_jobs.sqlite', 'check_jobs.sqlite-wal', 'check_jobs.sqlite-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+    broker = sob.JobBroker('check_jobs.sqlite')
+    workers = subprocess.Popen([sys.executable, '-m', 'src.sob.worker', 'check_jobs.sqlite', '--batch-file', batch_file_path,
+                                '--processes', '3', '--idle-timeout', '5'])
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,broker=broker)
+    X = [[1,2,3],[1,2,5],[-1,2,3],[-1,2,5]]
+    intrusions = a.evaluate_batch(X)
+    print(a([1,2,4]), a.output_data_frame.attrs['worker'], list(a.output_data_frame.columns))
+    workers.wait()
+    b = sob.get_problem(1,3,'intrusion',batch_file_path)
+    print(np.array_equal(intrusions, b.evaluate_batch(X)), broker.counts())
+    # the worker rebuilds the problem with the same options, the column of the rigid wall force included
+    from src.sob.worker import problem_from_spec
+    b.wall_force_key = 'DATABASE_RWFORC1'
+    c = problem_from_spec(b.spec(), batch_file_path)
+    print(c.spec() == b.spec(), c.wall_force_key)
+
+def check_broker_timeout():
+    # the job of a worker which died is queued again while it is waited for, and a batch which no worker
+    # evaluates is given up after the timeout of the broker, its queued jobs cancelled
+    for path in ['check_timeout.sqlite', 'check_timeout.sqlite-wal', 'check_timeout.sqlite-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+    broker = sob.JobBroker('check_timeout.sqlite', poll_interval=0.1, timeout=1, stale_after=0.3)
+    job_id = broker.submit({}, [1,2,3])
+    broker.claim('dead-worker')
+    try:
+        list(sob.broker.wait_all(broker, [job_id]))
+    except TimeoutError as e:
+        print(e, broker.get(job_id)['status'], broker.get(job_id)['worker'])
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,broker=broker)
+    try:
+        a.evaluate_batch([[1,2,3],[1,2,5]])
+    except TimeoutError as e:
+        print(e, broker.counts())
+
+def check_journal_broker():
+    # a design submitted by a session which died is waited for again by the next one, not submitted twice
+    import sys, subprocess
+    for path in ['check_resume.sqlite', 'check_resume.sqlite-wal', 'check_resume.sqlite-shm', 'check_resume.jsonl']:
+        if os.path.exists(path):
+            os.remove(path)
+    broker = sob.JobBroker('check_resume.sqlite')
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,broker=broker,journal=sob.EvaluationJournal('check_resume.jsonl'))
+    job_id = a._submit(a.spec(), [1,2,3])
+    a.journal.close()
+    workers = subprocess.Popen([sys.executable, '-m', 'src.sob.worker', 'check_resume.sqlite', '--batch-file', batch_file_path,
+                                '--processes', '1', '--idle-timeout', '3'])
+    b = sob.get_problem(1,3,'intrusion',batch_file_path,broker=broker,journal=sob.EvaluationJournal('check_resume.jsonl'))
+    print(b([1,2,3]), b.journal.records()[0]['status'], broker.counts(), job_id)
+    workers.wait()
+
+def check_solver_environment():
+    # the starter, engine and th_to_csv run directly give the intrusion of the batch file, in less fixed time
+    environment = sob.SolverEnvironment(batch_file_path=batch_file_path)
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,environment=environment)
+    b = sob.get_problem(1,3,'intrusion',batch_file_path)
+    print(a([1,2,3]) == b([1,2,3]))
+    print(a.output_data_frame.attrs['timings'], b.output_data_frame.attrs['timings'], environment.stats)
+
 def check_crashtube_problem():
     c = sob.get_problem(3,4,'intrusion',batch_file_path)
-    print(c([1,2,3,4]))
\ No newline at end of file
+    print(c([1,2,3,4]))
+
+def check_batch_evaluation():
+    # the batch evaluation of mass doesn't generate any input deck, the results should be the same as one by one
+    a = sob.get_problem(1,5,'mass',batch_file_path)
+    X = np.random.uniform(-5, 5, (10, 5))
+    print(np.array_equal(a.evaluate_batch(X), [a(x) for x in X]))
+
+    b = sob.get_problem(3,6,'absorbed_energy',batch_file_path)
+    print(b.evaluate_batch(np.zeros((3, 6))))
+
+def check_batch_intrusion():
+    # 4 simulations are run in parallel, 2 threads each
+    a = sob.get_problem(1,3,'intrusion',batch_file_path)
+    print(a.evaluate_batch([[1,2,3],[1,2,5],[-1,2,3],[-1,2,5]], max_jobs=4, cores_per_job=2))
+
+def check_analytic_evaluation():
+    # mass and absorbed energy are computed without writing anything, and match the model of the input deck
+    os.makedirs('analytic_evaluation', exist_ok=True)
+    os.chdir('analytic_evaluation')
+    a = sob.get_problem(1,5,'mass',batch_file_path)
+    b = sob.get_problem(3,6,'absorbed_energy',batch_file_path)
+    mass = a([1,2,3,4,2])
+    energy = b([1,2,3,4,2,-2])
+    print(os.listdir('.') == [])
+    a.generate_input_deck([1,2,3,4,2])
+    b.generate_input_deck([1,2,3,4,2,-2])
+    print(mass == a.model.mass(), energy == b.model.absorbed_energy())
+    os.chdir('..')
+
+def check_mesh_mass():
+    # the mass of the shells of the mesh accounts for the trigger dents, the tube without dents has the analytic mass
+    a = sob.get_problem(3,6,'mass',batch_file_path)
+    b = sob.get_problem(3,6,'mass',batch_file_path,mass_mode='mesh')
+    print(a([1,2,3,4,2,-2]), b([1,2,3,4,2,-2]))
+    print(a([0,0,0,0,0,0]) == b([0,0,0,0,0,0]))
+
+def check_shared_includes():
+    # the keyword files other than mesh.k are written once and hard linked into every deck
+    a = sob.get_problem(1,3,'intrusion',batch_file_path)
+    deck1 = a.generate_input_deck([1,2,3])
+    deck2 = a.generate_input_deck([1,2,5])
+    print(os.listdir('starbox_includes'))
+    print(os.path.samefile(os.path.join(deck1, 'dcc.k'), os.path.join(deck2, 'dcc.k')))
+    print(os.path.samefile(os.path.join(deck1, 'mesh.k'), os.path.join(deck2, 'mesh.k')))
+
+def read_deck(deck_dir):
+    decks = {}
+    for file_name in sorted(os.listdir(deck_dir)):
+        with open(os.path.join(deck_dir, file_name), 'rb') as f:
+            decks[file_name] = f.read()
+    return decks
+
+def check_concurrent_deck_generation():
+    # input decks generated from a thread pool should be byte-identical to the ones generated one by one
+    from concurrent.futures import ThreadPoolExecutor
+    X = np.random.uniform(-5, 5, (300, 5))
+    a = sob.get_problem(1,5,'mass',batch_file_path)
+    serial_decks = [read_deck(a.generate_input_deck(x)) for x in X]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        concurrent_dirs = list(pool.map(a.generate_input_deck, X))
+    print(all(read_deck(deck_dir) == deck for deck_dir, deck in zip(concurrent_dirs, serial_decks)))
+
+def check_evaluation_cache():
+    # the second evaluation of the same design is loaded from the cache, the solver runs only once
+    cache = sob.EvaluationCache('check_cache.sqlite')
+    cache.clear()
+    a = sob.get_problem(1,3,'intrusion',batch_file_path,cache=cache)
+    intrusion1 = a([1,2,3])
+    intrusion2 = a([1,2,3])
+    print(intrusion1 == intrusion2, cache.stats())
+    # the double precision solver has entries of its own
+    b = sob.get_problem(1,3,'intrusion',batch_file_path,cache=cache,sp='dp')
+    print(cache.key(a, a._map_variable([1,2,3])) != cache.key(b, b._map_variable([1,2,3])))
+
+    # the least recently used entries are evicted
+    cache = sob.EvaluationCache('check_cache.sqlite', max_entries=2)
+    cache.clear()
+    for key in ['a', 'b', 'c']:
+        cache.put(key, 1.0)
+    print(len(cache), cache.get('a'), cache.get('c'))
+
+def check_async_evaluation():
+    # the 4 simulations are in flight at the same time in one event loop
+    import asyncio
+    a = sob.get_problem(1,3,'intrusion',batch_file_path)
+    async def evaluate_all():
+        return await asyncio.gather(a.acall([1,2,3]), a.acall([1,2,5]), a.acall([-1,2,3]), a.acall([-1,2,5]))
+    print(asyncio.run(evaluate_all()))
+    # cancelling the evaluation kills its run: the design is neither cached nor failed
+    async def evaluate_cancelled():
+        try:
+            await asyncio.wait_for(a.acall([2,2,3]), 1)
+        except asyncio.TimeoutError:
+            return 'cancelled'
+    print(asyncio.run(evaluate_cancelled()), a.failures)
+
+def check_throughput_calibration():
+    # measures 2 splits of 4 cores, the batch evaluation afterwards uses the faster one
+    splits = [{'nmpi': 1, 'nt': 1, 'max_jobs': 4}, {'nmpi': 1, 'nt': 4, 'max_jobs': 1}]
+    print(sob.calibrate_throughput(batch_file_path, model_types=(1,), splits=splits))
+    # the splits are recorded per fidelity
+    print(sob.best_split('StarBox'), sob.best_split('StarBox', 'low'))
+    a = sob.get_problem(1,3,'intrusion',batch_file_path)
+    print(a.evaluate_batch([[1,2,3],[1,2,5],[-1,2,3],[-1,2,5]]))